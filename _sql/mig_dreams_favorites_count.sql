@@ -0,0 +1,13 @@
+-- Денормализованный счётчик избранного: dreams.favorites_count.
+-- Поддерживается в POST/DELETE /dreams/{id}/favorite (в той же транзакции) и в DELETE /admin/users/{id};
+-- сверка/починка — scripts/recount_favorites.py. Витрина читает колонку вместо GROUP BY по user_dream_favorites.
+-- Идемпотентно.
+
+ALTER TABLE dreams
+  ADD COLUMN IF NOT EXISTS favorites_count INT NOT NULL DEFAULT 0;
+
+UPDATE dreams d
+SET favorites_count = COALESCE(c.n, 0)
+FROM dreams d2
+LEFT JOIN (SELECT dream_id, COUNT(*) AS n FROM user_dream_favorites GROUP BY dream_id) c ON c.dream_id = d2.id
+WHERE d2.id = d.id AND d.favorites_count <> COALESCE(c.n, 0);
@@ -0,0 +1,18 @@
+-- Полнотекстовый поиск по витрине (GET /dreams/search): dreams.search_tsv — tsvector (russian)
+-- текста мечты (вес A), имени автора (B) и города (C). Поля автора лежат в users, поэтому колонка
+-- не GENERATED: её обновляет приложение в транзакции записи (dream_search.refresh) — создание мечты,
+-- правка текста, правка имени/города в админке. Выражение — то же, что dream_search.tsv_sql().
+-- Частичный GIN-индекс — только публичные мечты (как в витрине).
+-- Расхождения после ручных правок и скриптов пересобирает scripts/rebuild_dream_search.py. Идемпотентно.
+
+ALTER TABLE dreams ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+
+UPDATE dreams d SET search_tsv =
+  setweight(to_tsvector('russian', COALESCE(d.dream, '')), 'A')
+  || setweight(to_tsvector('russian', COALESCE(u.name, '') || ' ' || COALESCE(u.surname, '')), 'B')
+  || setweight(to_tsvector('russian', COALESCE(u.city, '')), 'C')
+FROM users u
+WHERE u.id = d.user_id;
+
+CREATE INDEX IF NOT EXISTS idx_dreams_search_tsv ON dreams USING GIN (search_tsv)
+  WHERE COALESCE(is_public, true) = true;
@@ -0,0 +1,42 @@
+-- Позиция мечты в витрине для наборов просмотренных (user_viewed_sets, viewed_sets.py).
+-- showcase_key — номер из dreams_showcase_key_seq, который триггер выдаёт мечте каждый раз, когда она
+-- становится публичной (INSERT публичной или UPDATE is_public: скрыта -> публична). Закрытые мечты
+-- (в том числе «Дневник») номера не получают и битмап просмотренных не раздувают; опубликованная позже
+-- мечта получает номер выше отметки hwm любого пользователя и для всех, кто её не смотрел, — «новая».
+-- Текущим публичным мечтам номер = id, последовательность продолжается после MAX(id): собранные
+-- наборы (они велись по id) остаются верными, пересборка не нужна.
+-- Идемпотентно.
+
+CREATE SEQUENCE IF NOT EXISTS dreams_showcase_key_seq AS integer;
+
+ALTER TABLE dreams ADD COLUMN IF NOT EXISTS showcase_key INT;
+
+UPDATE dreams SET showcase_key = id WHERE showcase_key IS NULL AND COALESCE(is_public, true) = true;
+
+SELECT setval(
+  'dreams_showcase_key_seq',
+  GREATEST(
+    (SELECT COALESCE(MAX(id), 0) FROM dreams),
+    (SELECT COALESCE(MAX(showcase_key), 0) FROM dreams),
+    (SELECT last_value FROM dreams_showcase_key_seq),
+    1
+  )
+);
+
+CREATE INDEX IF NOT EXISTS idx_dreams_public_showcase_key
+  ON dreams (showcase_key)
+  WHERE COALESCE(is_public, true) = true;
+
+CREATE OR REPLACE FUNCTION dreams_showcase_key() RETURNS trigger AS $$
+BEGIN
+  IF COALESCE(NEW.is_public, true)
+     AND (TG_OP = 'INSERT' OR NOT COALESCE(OLD.is_public, true) OR NEW.showcase_key IS NULL) THEN
+    NEW.showcase_key := nextval('dreams_showcase_key_seq');
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_dreams_showcase_key ON dreams;
+CREATE TRIGGER trigger_dreams_showcase_key BEFORE INSERT OR UPDATE OF is_public ON dreams
+  FOR EACH ROW EXECUTE FUNCTION dreams_showcase_key();
@@ -0,0 +1,11 @@
+-- Постраничная витрина (GET /dreams/showcase?limit=&cursor=): keyset по (date DESC NULLS LAST, id DESC)
+-- среди публичных мечт. Предикат индекса совпадает с WHERE витрины — планировщик берёт его для LIMIT.
+-- Мечты без date — в конце индекса: их диапазон (date IS NULL) читается тем же индексом.
+-- Прежний idx_dreams_public_date_id (date DESC — NULL первыми) не подходит к этому порядку и удаляется.
+-- Идемпотентно.
+
+CREATE INDEX IF NOT EXISTS idx_dreams_public_date_nl_id
+  ON dreams (date DESC NULLS LAST, id DESC)
+  WHERE COALESCE(is_public, true) = true;
+
+DROP INDEX IF EXISTS idx_dreams_public_date_id;
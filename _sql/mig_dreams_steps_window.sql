@@ -0,0 +1,14 @@
+-- Шаги мечты постранично (GET /dreams/{id}/steps?date_from=&date_to=&cursor=): keyset в порядке показа
+-- (sort_order, id; шаги без sort_order — в конце, как в GET /dreams) и окно по дедлайну — индексом, а не
+-- сортировкой всех шагов мечты (серии create_steps_batch — до 5000 шагов). Порядок совпадает с
+-- _dream_steps_page_sql и _steps_by_dream_sql в main.py; прежний индекс по COALESCE(sort_order, 0) удаляется.
+-- Шаги на сегодня в GET /dreams?summary=1 берёт idx_dreams_steps_unique_deadline_title.
+-- Идемпотентно.
+
+CREATE INDEX IF NOT EXISTS idx_dreams_steps_dream_sort_id
+  ON dreams_steps (dream_id, sort_order, id);
+
+DROP INDEX IF EXISTS idx_dreams_steps_dream_order;
+
+CREATE INDEX IF NOT EXISTS idx_dreams_steps_dream_deadline
+  ON dreams_steps (dream_id, deadline, id);
@@ -0,0 +1,85 @@
+-- Дельта-синхронизация личного кабинета: GET /dreams?since=<token> — только изменённые и удалённые мечты, шаги, книги.
+-- row_version — id транзакции, которая последней меняла строку (pg_current_xact_id, 64 бита), updated_at — время.
+-- Ставит их триггер: шаги и книги меняются из десятков мест main.py и скриптов, так ни одна запись не пропадёт.
+-- Изменение только служебных колонок мечты (favorites_count, search_tsv) версию не двигает.
+-- Удаления — в dreams_sync_tombstones (шаги и книги удалённой мечты покрывает её собственная запись).
+-- Старые записи удаляет scripts/prune_dreams_sync.py (DREAMS_SYNC_RETENTION_DAYS); токен старше — полный ответ.
+-- Идемпотентно.
+
+ALTER TABLE dreams ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE dreams ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE dreams_steps ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE dreams_steps ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE dream_books ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE dream_books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_dreams_user_row_version ON dreams (user_id, row_version);
+CREATE INDEX IF NOT EXISTS idx_dreams_steps_dream_row_version ON dreams_steps (dream_id, row_version);
+CREATE INDEX IF NOT EXISTS idx_dream_books_dream_row_version ON dream_books (dream_id, row_version);
+
+CREATE TABLE IF NOT EXISTS dreams_sync_tombstones (
+  id BIGSERIAL PRIMARY KEY,
+  user_id INT NOT NULL,
+  kind VARCHAR(16) NOT NULL,          -- dream | step | book
+  entity_id INT NOT NULL,
+  dream_id INT NOT NULL,
+  row_version BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint,
+  deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_dreams_sync_tombstones_user_version
+  ON dreams_sync_tombstones (user_id, row_version);
+CREATE INDEX IF NOT EXISTS idx_dreams_sync_tombstones_deleted_at
+  ON dreams_sync_tombstones (deleted_at);
+
+-- Аргументы триггера — колонки, изменение которых (и только их) версию не двигает
+CREATE OR REPLACE FUNCTION dreams_sync_touch() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND (to_jsonb(NEW) - COALESCE(TG_ARGV, '{}') - 'row_version' - 'updated_at')
+       = (to_jsonb(OLD) - COALESCE(TG_ARGV, '{}') - 'row_version' - 'updated_at') THEN
+    RETURN NEW;
+  END IF;
+  NEW.row_version := pg_current_xact_id()::text::bigint;
+  NEW.updated_at := NOW();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dreams_sync_tombstone() RETURNS trigger AS $$
+DECLARE
+  owner_id INT;
+BEGIN
+  IF TG_TABLE_NAME = 'dreams' THEN
+    IF OLD.user_id IS NOT NULL THEN
+      INSERT INTO dreams_sync_tombstones (user_id, kind, entity_id, dream_id) VALUES (OLD.user_id, 'dream', OLD.id, OLD.id);
+    END IF;
+    RETURN OLD;
+  END IF;
+  SELECT user_id INTO owner_id FROM dreams WHERE id = OLD.dream_id;
+  IF owner_id IS NOT NULL THEN
+    INSERT INTO dreams_sync_tombstones (user_id, kind, entity_id, dream_id) VALUES (owner_id, TG_ARGV[0], OLD.id, OLD.dream_id);
+  END IF;
+  RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_dreams_sync_touch ON dreams;
+CREATE TRIGGER trigger_dreams_sync_touch BEFORE INSERT OR UPDATE ON dreams
+  FOR EACH ROW EXECUTE FUNCTION dreams_sync_touch('favorites_count', 'search_tsv');
+DROP TRIGGER IF EXISTS trigger_dreams_steps_sync_touch ON dreams_steps;
+CREATE TRIGGER trigger_dreams_steps_sync_touch BEFORE INSERT OR UPDATE ON dreams_steps
+  FOR EACH ROW EXECUTE FUNCTION dreams_sync_touch();
+DROP TRIGGER IF EXISTS trigger_dream_books_sync_touch ON dream_books;
+CREATE TRIGGER trigger_dream_books_sync_touch BEFORE INSERT OR UPDATE ON dream_books
+  FOR EACH ROW EXECUTE FUNCTION dreams_sync_touch();
+
+DROP TRIGGER IF EXISTS trigger_dreams_sync_tombstone ON dreams;
+CREATE TRIGGER trigger_dreams_sync_tombstone AFTER DELETE ON dreams
+  FOR EACH ROW EXECUTE FUNCTION dreams_sync_tombstone();
+DROP TRIGGER IF EXISTS trigger_dreams_steps_sync_tombstone ON dreams_steps;
+CREATE TRIGGER trigger_dreams_steps_sync_tombstone AFTER DELETE ON dreams_steps
+  FOR EACH ROW EXECUTE FUNCTION dreams_sync_tombstone('step');
+DROP TRIGGER IF EXISTS trigger_dream_books_sync_tombstone ON dream_books;
+CREATE TRIGGER trigger_dream_books_sync_tombstone AFTER DELETE ON dream_books
+  FOR EACH ROW EXECUTE FUNCTION dreams_sync_tombstone('book');
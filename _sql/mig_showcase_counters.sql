@@ -0,0 +1,32 @@
+-- Счётчики витрины на пользователя: GET /dreams/showcase/counts — одна строка вместо семи COUNT.
+-- user_showcase_counters: viewed (просмотренные публичные; new = showcase_totals.public_dreams - viewed),
+-- helping, helped, favorites, in_progress, pending_completion. Строка создаётся при первом чтении счётчиков,
+-- дальше её меняют обработчики записи (в той же транзакции); расхождения правит фоновая сверка
+-- (SHOWCASE_COUNTERS_RECONCILE_SEC) и scripts/reconcile_showcase_counters.py.
+-- Идемпотентно.
+
+CREATE TABLE IF NOT EXISTS user_showcase_counters (
+  user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  viewed INT NOT NULL DEFAULT 0,
+  helping INT NOT NULL DEFAULT 0,
+  helped INT NOT NULL DEFAULT 0,
+  favorites INT NOT NULL DEFAULT 0,
+  in_progress INT NOT NULL DEFAULT 0,
+  pending_completion INT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  reconciled_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_showcase_counters_reconciled
+  ON user_showcase_counters (reconciled_at NULLS FIRST);
+
+-- Одна строка: число публичных мечт (поле «all» витрины)
+CREATE TABLE IF NOT EXISTS showcase_totals (
+  id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  public_dreams INT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO showcase_totals (id, public_dreams)
+SELECT true, COUNT(*) FROM dreams WHERE COALESCE(is_public, true) = true
+ON CONFLICT (id) DO UPDATE SET public_dreams = EXCLUDED.public_dreams, updated_at = NOW();
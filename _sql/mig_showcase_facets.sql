@@ -0,0 +1,50 @@
+-- Фасеты витрины (GET /dreams/showcase и GET /dreams/search: city, category, status, price_min / price_max;
+-- счётчики — GET /dreams/showcase/facets).
+-- showcase_facet_counts — свёртка публичных мечт по (город автора, код категории, код статуса, ценовой
+-- диапазон): одна строка на сочетание, не на мечту. Приложение пересобирает её раз в
+-- SHOWCASE_FACETS_REFRESH_SEC (showcase_facets.refresh); здесь — первое заполнение тем же запросом.
+-- price_bucket: -1 — цены нет (или не число), 0.. — границы showcase_facets.PRICE_EDGES (0, 10 000,
+-- 100 000, 1 000 000, 10 000 000 ₽).
+-- Частичные индексы публичных мечт под фильтры списка; выражение цены совпадает с showcase_facets.price_sql()
+-- (dreams.price — NUMERIC(12,2), в старых БД — VARCHAR: выражение читает текст цены, годится для обоих).
+-- Идемпотентно.
+
+CREATE TABLE IF NOT EXISTS showcase_facet_counts (
+  city TEXT NOT NULL,
+  category TEXT NOT NULL,
+  status TEXT NOT NULL,
+  price_bucket SMALLINT NOT NULL,
+  n INT NOT NULL,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (city, category, status, price_bucket)
+);
+
+BEGIN;
+DELETE FROM showcase_facet_counts;
+INSERT INTO showcase_facet_counts (city, category, status, price_bucket, n)
+SELECT COALESCE(btrim(u.city), ''), COALESCE(c.code, ''), COALESCE(s.code, 'planned'),
+       COALESCE(width_bucket(
+         (CASE WHEN btrim(d.price::text) ~ '^[0-9]+([.][0-9]+)?$' THEN btrim(d.price::text)::numeric END),
+         ARRAY[0,10000,100000,1000000,10000000]::numeric[]) - 1, -1),
+       COUNT(*)
+FROM dreams d
+JOIN users u ON u.id = d.user_id
+LEFT JOIN dreams_categories c ON c.id = d.category_id
+LEFT JOIN dreams_statuses s ON s.id = d.status_id
+WHERE COALESCE(d.is_public, true) = true
+GROUP BY 1, 2, 3, 4;
+COMMIT;
+
+CREATE INDEX IF NOT EXISTS idx_dreams_public_category_date_id
+  ON dreams (category_id, date DESC, id DESC)
+  WHERE COALESCE(is_public, true) = true;
+
+CREATE INDEX IF NOT EXISTS idx_dreams_public_status_date_id
+  ON dreams (status_id, date DESC, id DESC)
+  WHERE COALESCE(is_public, true) = true;
+
+CREATE INDEX IF NOT EXISTS idx_dreams_public_price
+  ON dreams ((CASE WHEN btrim(price::text) ~ '^[0-9]+([.][0-9]+)?$' THEN btrim(price::text)::numeric END))
+  WHERE COALESCE(is_public, true) = true;
+
+CREATE INDEX IF NOT EXISTS idx_users_city_btrim ON users (btrim(city));
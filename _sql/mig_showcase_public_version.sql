@@ -0,0 +1,14 @@
+-- Версия анонимной витрины (GET /dreams/showcase без user_id): одна строка-счётчик.
+-- Обработчики записи, меняющие анонимный ответ (создание/правка/удаление публичной мечты, избранное,
+-- «сбылось», имя/город/контакты автора), повышают version в своей транзакции; процессы приложения
+-- держат снимок ответа в памяти, пока version не изменилась (ETag / 304).
+-- Пока таблицы нет, кэш выключен и витрина строится из БД на каждый запрос. Идемпотентно.
+
+CREATE TABLE IF NOT EXISTS showcase_public_version (
+  id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  version BIGINT NOT NULL DEFAULT 0,
+  bumped_at TIMESTAMPTZ
+);
+
+INSERT INTO showcase_public_version (id, version) VALUES (true, 1)
+ON CONFLICT (id) DO NOTHING;
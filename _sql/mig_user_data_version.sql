@@ -0,0 +1,12 @@
+-- Версия данных кабинета пользователя: GET /dreams, /schedule, /steps/events и /users/me/viewable отдают по ней
+-- слабый ETag и 304 на If-None-Match — повторный опрос без изменений стоит одного SELECT по первичному ключу.
+-- Обработчики записи main.py, меняющие мечты, шаги, книги, дневник, «сбылось» или связи бадди пользователя
+-- (имя / аватар — и у тех, кто смотрит его кабинет), повышают version в своей транзакции.
+-- Нет строки — версия 0. Скрипты и ручной SQL версию не двигают: ETag и так меняется раз в USER_ETAG_MAX_AGE_SEC.
+-- Пока таблицы нет, ETag не выдаётся и ответы строятся как раньше. Идемпотентно.
+
+CREATE TABLE IF NOT EXISTS user_data_version (
+  user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  version BIGINT NOT NULL DEFAULT 0,
+  bumped_at TIMESTAMPTZ
+);
@@ -0,0 +1,27 @@
+-- Лента «Рекомендуем» для помощника (GET /dreams/recommended, recommendations.py).
+-- user_dream_recommendations — заранее посчитанные оценки: до RECOMMEND_TOP_N публичных мечт на пользователя,
+-- лента читается диапазоном индекса (user_id, score DESC, dream_id DESC).
+-- user_recommendation_state — строка на пользователя, открывавшего ленту: seq растёт с каждым его событием
+-- (избранное, «Хочу помочь», «Помог» — в той же транзакции), refreshed_seq / refreshed_at — последний пересчёт.
+-- Пересчитывает фоновая задача приложения (RECOMMEND_REFRESH_SEC); первую ленту — запрос пользователя.
+-- Идемпотентно.
+
+CREATE TABLE IF NOT EXISTS user_recommendation_state (
+  user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  seq BIGINT NOT NULL DEFAULT 0,
+  refreshed_seq BIGINT NOT NULL DEFAULT -1,
+  refreshed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_recommendation_state_refreshed
+  ON user_recommendation_state (refreshed_at NULLS FIRST);
+
+CREATE TABLE IF NOT EXISTS user_dream_recommendations (
+  user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  dream_id INT NOT NULL REFERENCES dreams(id) ON DELETE CASCADE,
+  score REAL NOT NULL,
+  PRIMARY KEY (user_id, dream_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_dream_recommendations_feed
+  ON user_dream_recommendations (user_id, score DESC, dream_id DESC);
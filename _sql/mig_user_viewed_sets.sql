@@ -0,0 +1,15 @@
+-- Компактный набор просмотренных мечт на пользователя: фильтр «Новые» и флаг is_viewed витрины
+-- без анти-join с user_dream_views (она остаётся журналом viewed_at для аналитики).
+-- hwm — все мечты с позицией (dreams.showcase_key) <= hwm просмотрены; bits — битмап просмотренных позиций выше hwm
+-- (бит i = позиция hwm + 1 + i, порядок get_bit). hwm = NULL — строка ещё не собрана: читается
+-- user_dream_views, строку соберёт ближайшая запись просмотров (viewed_sets.py).
+-- Позиции мечт для наборов — _sql/mig_dreams_showcase_key.sql (без неё наборы не используются).
+-- После применения обеих на всех воркерах (перезапуск): python3 scripts/build_viewed_sets.py
+-- Идемпотентно.
+
+CREATE TABLE IF NOT EXISTS user_viewed_sets (
+  user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  hwm INT,
+  bits BYTEA NOT NULL DEFAULT ''::bytea,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -71,8 +71,23 @@ def buddy_timezone_label(tz_id: str) -> str:
     return tz_id
 
 
+# Set once the DDL below succeeded (or main.py's startup bootstrap already recorded it).
+_buddy_alerts_schema_ready = False
+
+
+def mark_buddy_alerts_schema_ready() -> None:
+    """Skip ensure_buddy_alerts_schema() DDL for the rest of this process."""
+    global _buddy_alerts_schema_ready
+    _buddy_alerts_schema_ready = True
+
+
 def ensure_buddy_alerts_schema(cur) -> None:
-    """Idempotent schema bootstrap (sandbox without manual migration). Commits DDL on success."""
+    """Idempotent schema bootstrap (sandbox without manual migration). Commits DDL on success.
+
+    Runs at most once per process: later calls are no-ops.
+    """
+    if _buddy_alerts_schema_ready:
+        return
     conn = cur.connection
     try:
         cur.execute("""
@@ -130,6 +145,7 @@ def ensure_buddy_alerts_schema(cur) -> None:
             )
         """)
         conn.commit()
+        mark_buddy_alerts_schema_ready()
     except Exception:
         conn.rollback()
         raise
@@ -147,37 +163,37 @@ def fetch_subject_name(cur, subject_id: int) -> str:
     return _user_display_name(cur.fetchone())
 
 
-def fetch_day_steps(cur, user_id: int, report_date: date) -> List[dict]:
-    """Steps scheduled on report_date (deadline), not deleted."""
-    day_iso = report_date.isoformat()
-    sql_with_waived = """
-        SELECT s.id, s.title, s.completed, COALESCE(s.waived, false) AS waived
-        FROM dreams_steps s
-        JOIN dreams d ON d.id = s.dream_id
-        WHERE d.user_id = %s
-          AND s.deadline = %s
-          AND COALESCE(s.deleted, false) = false
-        ORDER BY s.id
+def _steps_have_waived_column(cur) -> bool:
+    cur.execute(
+        """SELECT 1 FROM information_schema.columns
+           WHERE table_schema = current_schema() AND table_name = 'dreams_steps' AND column_name = 'waived'"""
+    )
+    return cur.fetchone() is not None
+
+
+def fetch_day_steps(cur, user_id: int, report_date: date, has_waived: Optional[bool] = None) -> List[dict]:
+    """Steps scheduled on report_date (deadline), not deleted.
+
+    has_waived: whether dreams_steps.waived exists (main.py passes its schema registry answer);
+    None = look it up in information_schema. No failing SELECT, so the caller's transaction survives.
     """
-    sql_no_waived = """
-        SELECT s.id, s.title, s.completed, false AS waived
+    day_iso = report_date.isoformat()
+    if has_waived is None:
+        has_waived = _steps_have_waived_column(cur)
+    waived_sql = "COALESCE(s.waived, false)" if has_waived else "false"
+    cur.execute(
+        """
+        SELECT s.id, s.title, s.completed, """ + waived_sql + """ AS waived
         FROM dreams_steps s
         JOIN dreams d ON d.id = s.dream_id
         WHERE d.user_id = %s
           AND s.deadline = %s
           AND COALESCE(s.deleted, false) = false
         ORDER BY s.id
-    """
-    for sql in (sql_with_waived, sql_no_waived):
-        try:
-            cur.execute(sql, (user_id, day_iso))
-            return [dict(r) for r in cur.fetchall()]
-        except Exception:
-            try:
-                cur.connection.rollback()
-            except Exception:
-                pass
-    return []
+        """,
+        (user_id, day_iso),
+    )
+    return [dict(r) for r in cur.fetchall()]
 
 
 def compute_day_efficiency(steps: List[dict]) -> Optional[Dict[str, Any]]:
@@ -269,8 +285,10 @@ def mark_daily_report_sent(cur, user_id: int, report_date: date, send_method: st
     return cur.fetchone() is not None
 
 
-def fan_out_steps_success_100(cur, subject_id: int, report_date: date) -> int:
-    stats = compute_day_efficiency(fetch_day_steps(cur, subject_id, report_date))
+def fan_out_steps_success_100(
+    cur, subject_id: int, report_date: date, has_waived: Optional[bool] = None
+) -> int:
+    stats = compute_day_efficiency(fetch_day_steps(cur, subject_id, report_date, has_waived))
     if not stats or stats["efficiency_pct"] != 100:
         return 0
     subject_name = fetch_subject_name(cur, subject_id)
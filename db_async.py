@@ -0,0 +1,144 @@
+"""
+Async DB path (DB_ASYNC=1): a psycopg 3 AsyncConnectionPool for the `async def`
+variants of the hot read endpoints in main.py.
+
+The sync psycopg2 pool stays the default and keeps serving everything else;
+the switch exists to compare throughput / p99 of both modes under the same load.
+psycopg 3 is an optional dependency (requirements-async.txt): without it DB_ASYNC is
+ignored with a warning.
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Optional, Tuple
+
+from db_slowlog import explainable, slow_query_log
+from env_config import env_float, env_int
+from island_metrics import fingerprint, observe_db_timeout, observe_statement
+
+try:
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+except ImportError:  # psycopg[binary,pool] not installed: sync mode only
+    psycopg = None
+    AsyncConnectionPool = None
+    PoolTimeout = None
+
+ASYNC_ENV = "DB_ASYNC"
+
+if psycopg is not None:
+
+    class TimedAsyncCursor(psycopg.AsyncCursor):
+        """Reports every execute() to island_metrics, like db_pool.InstrumentedConnection."""
+
+        async def execute(self, query, params=None, **kwargs):
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                result = await super().execute(query, params, **kwargs)
+                ok = True
+                return result
+            except (psycopg.errors.QueryCanceled, psycopg.errors.LockNotAvailable) as e:
+                observe_db_timeout("lock" if isinstance(e, psycopg.errors.LockNotAvailable) else "statement")
+                raise
+            finally:
+                dt = time.perf_counter() - t0
+                observe_statement(query, dt)
+                if slow_query_log.is_slow(dt):
+                    await _record_slow_async(self.connection, query, params, dt, ok)
+
+    async def _record_slow_async(conn, query, params, seconds: float, succeeded: bool) -> None:
+        fp = fingerprint(query)
+        plan = None
+        text = explainable(query)
+        if succeeded and text is not None and slow_query_log.claim_explain(fp):
+            try:
+                # Plain cursor (not TimedAsyncCursor): EXPLAIN is not counted; autocommit, so no savepoint.
+                async with psycopg.AsyncCursor(conn) as cur:
+                    await cur.execute("EXPLAIN (ANALYZE off, FORMAT JSON) " + text, params)
+                    row = await cur.fetchone()
+                    plan = (list(row.values())[0] if isinstance(row, dict) else row[0]) if row else None
+            except Exception as e:
+                plan = {"error": str(e).splitlines()[0][:200]}
+        slow_query_log.write(query, params, seconds, fp, plan)
+
+
+def async_requested() -> bool:
+    """DB_ASYNC=1/true/yes in the environment."""
+    return (os.getenv(ASYNC_ENV) or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def async_available() -> bool:
+    return AsyncConnectionPool is not None
+
+
+def async_conninfo(timeouts: Optional[Tuple[int, int]] = None) -> str:
+    """Same DB_* settings as the sync pool (main._db_conn_kwargs).
+
+    timeouts: (statement_timeout_ms, lock_timeout_ms) as session settings — the pool runs in
+    autocommit, where SET LOCAL has no effect; all async variants are interactive reads.
+    """
+    kw = dict(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+        connect_timeout=15,
+        keepalives=1,
+        keepalives_idle=30,
+    )
+    if os.getenv("DB_PORT"):
+        kw["port"] = int(os.getenv("DB_PORT"))
+    sslmode = (os.getenv("DB_SSLMODE") or "").strip()
+    if sslmode:
+        kw["sslmode"] = sslmode
+    if timeouts:
+        kw["options"] = f"-c statement_timeout={int(timeouts[0])} -c lock_timeout={int(timeouts[1])}"
+    return make_conninfo(**{k: v for k, v in kw.items() if v is not None})
+
+
+def async_errors() -> tuple:
+    """Exceptions meaning "database unavailable" on the async path (-> 503)."""
+    return (psycopg.OperationalError, PoolTimeout)
+
+
+async def open_async_pool(timeouts: Optional[Tuple[int, int]] = None) -> Optional["AsyncConnectionPool"]:
+    """Create and open the pool; connections are filled in the background (open(wait=False)).
+
+    Connections run in autocommit: the async variants only read, so there is no
+    BEGIN/ROLLBACK round trip per checkout. Each checkout is validated with a
+    ping (check_connection), like SELECT 1 in main.get_db_connection().
+    """
+    pool = AsyncConnectionPool(
+        async_conninfo(timeouts),
+        min_size=env_int("DB_ASYNC_POOL_MIN", 1),
+        max_size=env_int("DB_ASYNC_POOL_MAX", 30),
+        timeout=env_float("DB_ASYNC_POOL_TIMEOUT", 30),
+        kwargs={"row_factory": dict_row, "autocommit": True, "cursor_factory": TimedAsyncCursor},
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await pool.open(wait=False)
+    return pool
+
+
+def async_pool_stats(pool) -> dict:
+    """psycopg_pool counters (pool_size, pool_available, requests_waiting, ...) for /metrics."""
+    if pool is None:
+        return {}
+    try:
+        return pool.get_stats()
+    except Exception:
+        return {}
+
+
+async def close_async_pool(pool) -> None:
+    if pool is None:
+        return
+    try:
+        await pool.close()
+    except Exception:
+        pass
@@ -0,0 +1,310 @@
+"""
+psycopg2 connection pool with idle-time-based validation.
+
+Checkout does not ping: only a connection that sat idle longer than
+DB_POOL_IDLE_CHECK_SEC (or any connection right after one was found broken)
+is validated with SELECT 1 by the caller (main.get_db_connection). A background
+reaper pings idle connections before they reach that age, recycles broken ones
+and those older than DB_POOL_MAX_LIFETIME_SEC, and pre-warms the pool back to
+its floor (minconn), so the first requests after a quiet period don't pay for
+connect + SSL.
+
+InstrumentedConnection (connection_factory) times every cursor execute() and
+reports it to island_metrics and the slow-query log (db_slowlog), whatever
+cursor_factory the caller passes. It also carries the per-request SQL time limits
+(set_local_timeouts): SET LOCAL statement_timeout / lock_timeout is prefixed to
+the first statement of every transaction, so it costs no extra round trip and
+survives commit() inside a handler.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from db_slowlog import record_sync as record_slow_query
+from env_config import env_float
+from island_metrics import observe_db_timeout, observe_statement
+
+
+# Idle this long (seconds) -> SELECT 1 on checkout.
+DB_POOL_IDLE_CHECK_SEC = env_float("DB_POOL_IDLE_CHECK_SEC", 30)
+# Reaper period; keep it below DB_POOL_IDLE_CHECK_SEC so checkouts normally skip the ping.
+DB_POOL_REAPER_SEC = env_float("DB_POOL_REAPER_SEC", 10)
+# Idle connections older than this are closed by the reaper and replaced (0 = never).
+DB_POOL_MAX_LIFETIME_SEC = env_float("DB_POOL_MAX_LIFETIME_SEC", 1800)
+
+
+_TIMED_CURSORS: Dict[type, type] = {}
+
+# Statement / lock timeout errors (the connection itself stays usable).
+TIMEOUT_ERRORS = (psycopg2.errors.QueryCanceled, psycopg2.errors.LockNotAvailable)
+
+
+def _timeouts_sql(timeouts: Tuple[int, int]) -> str:
+    statement_ms, lock_ms = timeouts
+    return f"SET LOCAL statement_timeout = {int(statement_ms)}; SET LOCAL lock_timeout = {int(lock_ms)}; "
+
+
+def _apply_timeouts(conn, timeouts: Tuple[int, int]) -> None:
+    # Plain cursor past InstrumentedConnection.cursor(): not counted as a request statement.
+    cur = psycopg2.extensions.connection.cursor(conn, cursor_factory=psycopg2.extensions.cursor)
+    try:
+        cur.execute(_timeouts_sql(timeouts))
+    finally:
+        cur.close()
+
+
+def set_local_timeouts(conn, timeouts: Optional[Tuple[int, int]]) -> None:
+    """(statement_timeout_ms, lock_timeout_ms) for every transaction of this checkout; None clears.
+
+    If a transaction is already open (the checkout ping), the limits are applied to it right away.
+    """
+    conn.local_timeouts = timeouts
+    if timeouts and not conn.autocommit and conn.status != psycopg2.extensions.STATUS_READY:
+        _apply_timeouts(conn, timeouts)
+
+
+def _opens_transaction(conn) -> Optional[Tuple[int, int]]:
+    """Limits to apply if the next statement starts a transaction, else None."""
+    timeouts = conn.local_timeouts
+    if not timeouts or conn.autocommit or conn.status != psycopg2.extensions.STATUS_READY:
+        return None
+    return timeouts
+
+
+def _with_local_timeouts(conn, query):
+    """Query prefixed with SET LOCAL ... when it opens a new transaction (other query types: separate SET)."""
+    timeouts = _opens_transaction(conn)
+    if timeouts is None:
+        return query
+    if isinstance(query, str):
+        return _timeouts_sql(timeouts) + query
+    if isinstance(query, bytes):
+        return _timeouts_sql(timeouts).encode() + query
+    _apply_timeouts(conn, timeouts)
+    return query
+
+
+def _timed_cursor_class(base: type) -> type:
+    """Subclass of the given cursor class whose execute/executemany report their duration."""
+    cls = _TIMED_CURSORS.get(base)
+    if cls is not None:
+        return cls
+
+    def execute(self, query, vars=None):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            result = base.execute(self, _with_local_timeouts(self.connection, query), vars)
+            ok = True
+            return result
+        except TIMEOUT_ERRORS as e:
+            observe_db_timeout("lock" if isinstance(e, psycopg2.errors.LockNotAvailable) else "statement")
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            observe_statement(query, dt)
+            record_slow_query(self.connection, query, vars, dt, ok)
+
+    def executemany(self, query, vars_list):
+        t0 = time.perf_counter()
+        timeouts = _opens_transaction(self.connection)
+        if timeouts is not None:
+            _apply_timeouts(self.connection, timeouts)
+        try:
+            return base.executemany(self, query, vars_list)
+        except TIMEOUT_ERRORS as e:
+            observe_db_timeout("lock" if isinstance(e, psycopg2.errors.LockNotAvailable) else "statement")
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            observe_statement(query, dt)
+            record_slow_query(self.connection, query, None, dt, False)
+
+    cls = type("Timed" + base.__name__, (base,), {"execute": execute, "executemany": executemany})
+    _TIMED_CURSORS[base] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors are timed (see _timed_cursor_class)."""
+
+    # perf_counter() of the current checkout (set by main.get_db_connection, cleared on return).
+    checked_out_at: Optional[float] = None
+    # (statement_timeout_ms, lock_timeout_ms) of the current checkout, see set_local_timeouts.
+    local_timeouts: Optional[Tuple[int, int]] = None
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+class IdleValidatingPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that validates by idle time instead of on every checkout.
+
+    minconn is the warm floor: the pool keeps (and the reaper restores) that many idle
+    connections; psycopg2 closes returned connections above it.
+    """
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        *args,
+        idle_check_sec: float = DB_POOL_IDLE_CHECK_SEC,
+        reaper_sec: float = DB_POOL_REAPER_SEC,
+        max_lifetime_sec: float = DB_POOL_MAX_LIFETIME_SEC,
+        **kwargs,
+    ) -> None:
+        self.idle_check_sec = idle_check_sec
+        self.reaper_sec = reaper_sec
+        self.max_lifetime_sec = max_lifetime_sec
+        self._idle_since: Dict[int, float] = {}
+        self._born: Dict[int, float] = {}
+        self._suspect_until = 0.0
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    # --- bookkeeping -----------------------------------------------------
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        now = time.monotonic()
+        self._born[id(conn)] = now
+        if key is None:
+            self._idle_since[id(conn)] = now
+        return conn
+
+    def _forget(self, conn) -> None:
+        self._idle_since.pop(id(conn), None)
+        self._born.pop(id(conn), None)
+
+    def _putconn(self, conn, key=None, close=False):
+        super()._putconn(conn, key, close)
+        if any(c is conn for c in self._pool):
+            self._idle_since[id(conn)] = time.monotonic()
+        else:
+            self._forget(conn)
+
+    # --- checkout --------------------------------------------------------
+
+    def checkout(self, key=None) -> Tuple[object, bool]:
+        """(conn, needs_validation). Already-closed idle connections are dropped here for free."""
+        now = time.monotonic()
+        with self._lock:
+            conn = self._getconn(key)
+            while conn.closed:
+                self._putconn(conn, close=True)
+                conn = self._getconn(key)
+            idle_since = self._idle_since.pop(id(conn), now)
+            validate = now - idle_since >= self.idle_check_sec or now < self._suspect_until
+        return conn, validate
+
+    def getconn(self, key=None):
+        return self.checkout(key)[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Pool occupancy for /metrics."""
+        with self._lock:
+            return {
+                "idle": len(self._pool),
+                "in_use": len(self._used),
+                "min": self.minconn,
+                "max": self.maxconn,
+            }
+
+    def owns(self, conn) -> bool:
+        """conn was handed out by this pool (main._return_conn picks primary vs replica)."""
+        return id(conn) in self._rused
+
+    def mark_suspect(self) -> None:
+        """A connection turned out broken (SSL closed, server restart): validate every
+        checkout for the next idle_check_sec and let the reaper sweep the idle ones."""
+        self._suspect_until = time.monotonic() + self.idle_check_sec
+
+    # --- reaper ----------------------------------------------------------
+
+    def start_reaper(self) -> None:
+        if self._reaper is not None or self.reaper_sec <= 0:
+            return
+        self._reaper = threading.Thread(target=self._reaper_loop, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reaper_loop(self) -> None:
+        while not self._stop.wait(self.reaper_sec):
+            try:
+                self.reap()
+            except Exception:
+                pass
+
+    def _take_idle(self, min_idle: float) -> List[Tuple[object, bool]]:
+        """Borrow idle connections idle for >= min_idle seconds (as used, so maxconn still holds)."""
+        now = time.monotonic()
+        taken = []
+        with self._lock:
+            if self.closed:
+                return taken
+            sweep = now < self._suspect_until
+            for conn in list(self._pool):
+                idle = now - self._idle_since.get(id(conn), now)
+                if not sweep and idle < min_idle:
+                    continue
+                self._pool.remove(conn)
+                self._idle_since.pop(id(conn), None)
+                key = self._getkey()
+                self._used[key] = conn
+                self._rused[id(conn)] = key
+                expired = self.max_lifetime_sec > 0 and now - self._born.get(id(conn), now) >= self.max_lifetime_sec
+                taken.append((conn, expired))
+        return taken
+
+    def reap(self) -> None:
+        """One reaper pass: ping aging idle connections, recycle broken/expired, warm to the floor."""
+        # Ping before a connection reaches idle_check_sec, so checkout doesn't have to.
+        for conn, expired in self._take_idle(max(0.0, self.idle_check_sec - self.reaper_sec)):
+            broken = expired or conn.closed
+            if not broken:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            try:
+                self.putconn(conn, close=broken)
+            except Exception:
+                pass
+        self.warm()
+
+    def warm(self) -> None:
+        """Open connections (outside the lock) until minconn are idle."""
+        with self._lock:
+            if self.closed:
+                return
+            deficit = min(self.minconn - len(self._pool), self.maxconn - len(self._pool) - len(self._used))
+        for _ in range(max(0, deficit)):
+            try:
+                conn = psycopg2.connect(*self._args, **self._kwargs)
+            except Exception:
+                return
+            with self._lock:
+                full = len(self._pool) + len(self._used) >= self.maxconn
+                if self.closed or full or len(self._pool) >= self.minconn:
+                    conn.close()
+                    return
+                now = time.monotonic()
+                self._pool.append(conn)
+                self._idle_since[id(conn)] = now
+                self._born[id(conn)] = now
+
+    def closeall(self):
+        self._stop.set()
+        super().closeall()
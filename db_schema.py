@@ -0,0 +1,149 @@
+"""
+Schema-capability registry: which tables/columns exist in the connected database.
+
+Read once from information_schema at startup (or lazily on the first checkout) and
+refreshed on demand (POST /admin/schema/refresh) or after run_migrate.py touches
+the stamp file. Handlers build a single SQL statement from it instead of trying a
+wide SELECT and falling back on psycopg2.ProgrammingError.
+"""
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Dict, FrozenSet, Iterable, Mapping, Optional, Union
+
+# Stamp file touched by run_migrate.py after a successful run (logs/ is a shared volume).
+SCHEMA_STAMP_NAME = ".schema_stamp"
+# How often (seconds) ensure() looks at the stamp mtime; os.stat only, no SQL.
+SCHEMA_STAMP_CHECK_SEC = float(os.getenv("SCHEMA_STAMP_CHECK_SEC", "2") or 2)
+
+ColumnSpec = Union[str, tuple]
+
+LOAD_SQL = """SELECT table_name, column_name FROM information_schema.columns
+              WHERE table_schema = current_schema()"""
+
+
+def touch_schema_stamp(log_dir: Path) -> None:
+    """Mark the schema as changed for running app processes (called by run_migrate.py)."""
+    try:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        (log_dir / SCHEMA_STAMP_NAME).write_text(str(time.time()), encoding="utf-8")
+    except OSError:
+        pass
+
+
+class SchemaRegistry:
+    """Tables and columns of current_schema(). Until loaded, every has*() answers True."""
+
+    def __init__(self, stamp_path: Optional[Path] = None) -> None:
+        self._lock = Lock()
+        self._tables: Dict[str, FrozenSet[str]] = {}
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._stamp_path = stamp_path
+        self._stamp_mtime: Optional[float] = None
+        self._stamp_checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def _read_stamp_mtime(self) -> Optional[float]:
+        if self._stamp_path is None:
+            return None
+        try:
+            return self._stamp_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def apply_rows(self, rows: Iterable, stamp: Optional[float] = None) -> None:
+        """Replace the registry with (table_name, column_name) rows of LOAD_SQL."""
+        tables: Dict[str, set] = {}
+        for r in rows:
+            if isinstance(r, Mapping):
+                t, c = r["table_name"], r["column_name"]
+            else:
+                t, c = r[0], r[1]
+            tables.setdefault(t, set()).add(c)
+        self._tables = {t: frozenset(cols) for t, cols in tables.items()}
+        self._loaded = True
+        self._loaded_at = time.time()
+        self._stamp_mtime = stamp
+        self._stamp_checked_at = time.monotonic()
+
+    def load(self, conn) -> None:
+        """(Re)read information_schema.columns. Leaves the connection's transaction open."""
+        with self._lock:
+            stamp = self._read_stamp_mtime()
+            with conn.cursor() as cur:
+                cur.execute(LOAD_SQL)
+                rows = cur.fetchall()
+            self.apply_rows(rows, stamp)
+
+    def stale(self) -> bool:
+        """True if not loaded yet or the migration stamp changed since the last load."""
+        if not self._loaded:
+            return True
+        if self._stamp_path is None:
+            return False
+        now = time.monotonic()
+        if now - self._stamp_checked_at < SCHEMA_STAMP_CHECK_SEC:
+            return False
+        self._stamp_checked_at = now
+        stamp = self._read_stamp_mtime()
+        return stamp is not None and stamp != self._stamp_mtime
+
+    def ensure(self, conn) -> None:
+        """Load if not loaded yet; reload if the migration stamp changed since the last load."""
+        if self.stale():
+            self.load(conn)
+
+    def stamp_mtime(self) -> Optional[float]:
+        """Current stamp mtime (for loaders that run LOAD_SQL themselves, e.g. the async pool)."""
+        return self._read_stamp_mtime()
+
+    def invalidate(self) -> None:
+        """Force a reload on the next ensure() (e.g. after runtime DDL)."""
+        self._loaded = False
+
+    def has_table(self, table: str) -> bool:
+        if not self._loaded:
+            return True
+        return table in self._tables
+
+    def has(self, table: str, *columns: str) -> bool:
+        """True if the table exists and has all the given columns."""
+        if not self._loaded:
+            return True
+        cols = self._tables.get(table)
+        if cols is None:
+            return False
+        return all(c in cols for c in columns)
+
+    def col(self, table: str, column: str, default: str = "NULL", alias: Optional[str] = None) -> str:
+        """SQL select item: `alias.column` if present, else `default AS column`."""
+        if self.has(table, column):
+            return f"{alias}.{column}" if alias else column
+        return f"{default} AS {column}"
+
+    def cols(self, table: str, columns: Iterable[ColumnSpec], alias: Optional[str] = None) -> str:
+        """Select list for columns; an item is "name" (NULL when missing) or ("name", "default_sql")."""
+        parts = []
+        for spec in columns:
+            if isinstance(spec, tuple):
+                name, default = spec
+            else:
+                name, default = spec, "NULL"
+            parts.append(self.col(table, name, default, alias))
+        return ", ".join(parts)
+
+    def snapshot(self) -> dict:
+        """Summary for the admin endpoint."""
+        return {
+            "loaded": self._loaded,
+            "loaded_at": self._loaded_at or None,
+            "tables": len(self._tables),
+            "columns": sum(len(c) for c in self._tables.values()),
+        }
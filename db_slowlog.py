@@ -0,0 +1,156 @@
+"""
+Slow-query log: statements slower than DB_SLOW_QUERY_MS go to logs/slow_sql.log
+(rotating, one JSON object per line) with the normalized SQL, parameter shapes,
+duration and route. With DB_SLOW_QUERY_EXPLAIN=1 the first occurrence of each
+fingerprint also gets its plan: EXPLAIN (ANALYZE off, FORMAT JSON) — the statement
+is not executed again.
+
+Fed by the instrumented cursors (db_pool.InstrumentedConnection, db_async.TimedAsyncCursor);
+main.py calls configure_slow_query_log(LOG_DIR / SLOW_QUERY_LOG_NAME) at import.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+from env_config import env_float
+from island_metrics import current_route, fingerprint, fingerprint_id, sql_text
+
+SLOW_QUERY_LOG_NAME = "slow_sql.log"
+# Statements explained at most once per fingerprint; the set is capped to stay small.
+_EXPLAINED_MAX = 5000
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+def param_shape(params: Any) -> Any:
+    """Types (and list lengths) of the parameters, never the values: (int, str, list[int]*37)."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {str(k): param_shape(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if params and not isinstance(params[0], (list, tuple, dict)) and len(params) > 8:
+            return f"{type(params).__name__}[{type(params[0]).__name__}]*{len(params)}"
+        return [_scalar_shape(v) for v in params]
+    return _scalar_shape(params)
+
+
+def _scalar_shape(v: Any) -> str:
+    if isinstance(v, (list, tuple)):
+        inner = type(v[0]).__name__ if v else "?"
+        return f"list[{inner}]*{len(v)}"
+    return type(v).__name__
+
+
+def explainable(query) -> Optional[str]:
+    """Plain-text statement worth explaining (DML/SELECT), else None."""
+    if not isinstance(query, (str, bytes)):
+        return None
+    text = sql_text(query).lstrip()
+    head = text[:10].lower()
+    return text if head.startswith(_EXPLAINABLE) else None
+
+
+class SlowQueryLog:
+    def __init__(self) -> None:
+        self.threshold_sec = env_float("DB_SLOW_QUERY_MS", 200) / 1000.0
+        self.explain = (os.getenv("DB_SLOW_QUERY_EXPLAIN") or "1").strip().lower() in ("1", "true", "yes", "on")
+        self._logger: Optional[logging.Logger] = None
+        self._explained: set = set()
+        self._lock = Lock()
+
+    def configure(self, path: Path) -> None:
+        logger = logging.getLogger("island.slow_sql")
+        logger.propagate = False
+        if not logger.handlers:
+            logger.setLevel(logging.INFO)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fh = RotatingFileHandler(path, maxBytes=2_000_000, backupCount=5, encoding="utf-8")
+            fh.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(fh)
+        self._logger = logger
+
+    def is_slow(self, seconds: float) -> bool:
+        return self._logger is not None and self.threshold_sec > 0 and seconds >= self.threshold_sec
+
+    def claim_explain(self, fp: str) -> bool:
+        """True once per fingerprint (the caller then runs EXPLAIN)."""
+        if not self.explain:
+            return False
+        with self._lock:
+            if fp in self._explained or len(self._explained) >= _EXPLAINED_MAX:
+                return False
+            self._explained.add(fp)
+            return True
+
+    def write(self, query, params, seconds: float, fp: Optional[str] = None, plan: Any = None) -> None:
+        if self._logger is None:
+            return
+        fp = fp or fingerprint(query)
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "ms": round(seconds * 1000, 1),
+            "route": current_route(),
+            "fp_id": fingerprint_id(fp),
+            "sql": fp[:4000],
+            "params": param_shape(params),
+        }
+        if plan is not None:
+            entry["plan"] = plan
+        try:
+            self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+        except Exception:
+            pass
+
+
+slow_query_log = SlowQueryLog()
+
+
+def configure_slow_query_log(path: Path) -> None:
+    slow_query_log.configure(path)
+
+
+def explain_sync(conn, query, params) -> Any:
+    """EXPLAIN on a psycopg2 connection inside a savepoint, so a failure doesn't abort the caller's transaction."""
+    text = explainable(query)
+    if text is None:
+        return None
+    import psycopg2.extensions
+
+    # Plain cursor past InstrumentedConnection.cursor(): EXPLAIN is not counted as a request statement.
+    cur = psycopg2.extensions.connection.cursor(conn, cursor_factory=psycopg2.extensions.cursor)
+    use_sp = not conn.autocommit
+    try:
+        if use_sp:
+            cur.execute("SAVEPOINT island_explain")
+        cur.execute("EXPLAIN (ANALYZE off, FORMAT JSON) " + text, params)
+        row = cur.fetchone()
+        if use_sp:
+            cur.execute("RELEASE SAVEPOINT island_explain")
+        return row[0] if row else None
+    except Exception as e:
+        if use_sp:
+            try:
+                cur.execute("ROLLBACK TO SAVEPOINT island_explain")
+            except Exception:
+                pass
+        return {"error": str(e).splitlines()[0][:200]}
+    finally:
+        cur.close()
+
+
+def record_sync(conn, query, params, seconds: float, succeeded: bool = True) -> None:
+    """Slow-statement hook for the psycopg2 cursor (a failed statement is logged without a plan)."""
+    if not slow_query_log.is_slow(seconds):
+        return
+    fp = fingerprint(query)
+    plan = None
+    if succeeded and slow_query_log.claim_explain(fp):
+        plan = explain_sync(conn, query, params)
+    slow_query_log.write(query, params, seconds, fp, plan)
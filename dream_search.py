@@ -0,0 +1,77 @@
+"""
+Full-text search over public dreams (GET /dreams/search).
+
+dreams.search_tsv is a Russian-configured tsvector of the dream text (weight A), the
+owner's name (B) and city (C), with a partial GIN index over public dreams
+(_sql/mig_dreams_search.sql). The owner's fields live in users, so the column cannot be
+a generated column. main.py keeps it current with refresh() in the same transaction as
+the write (dream create / text edit, admin edit of name or city). Rows changed behind
+its back (scripts, manual SQL) are repaired by scripts/rebuild_dream_search.py, which
+recomputes only the rows that differ from tsv_sql().
+
+Queries are prefix matches of every word (a & b:* ...), so results follow typing. They
+are ranked with ts_rank_cd and paged by keyset on (rank, id). Without the column, main.py
+falls back to ILIKE over the same fields with rank 0 (newest first).
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Optional, Sequence, Tuple
+
+CONFIG = "russian"
+TSV_COLUMN = "search_tsv"
+MAX_TERMS = 8
+
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tsv_sql(dream: str = "d", owner: str = "u") -> str:
+    """tsvector expression over <dream>.dream and <owner>.name/surname/city (the migration uses the same one)."""
+    return (
+        f"setweight(to_tsvector('{CONFIG}', COALESCE({dream}.dream, '')), 'A')"
+        f" || setweight(to_tsvector('{CONFIG}', COALESCE({owner}.name, '') || ' ' || COALESCE({owner}.surname, '')), 'B')"
+        f" || setweight(to_tsvector('{CONFIG}', COALESCE({owner}.city, '')), 'C')"
+    )
+
+
+def refresh(cur, dream_ids: Optional[Sequence[int]] = None, user_id: Optional[int] = None) -> None:
+    """Recompute search_tsv of these dreams, or of all dreams of this owner."""
+    if dream_ids is not None:
+        cond, params = "d.id = ANY(%s)", (list(dream_ids),)
+    elif user_id is not None:
+        cond, params = "d.user_id = %s", (user_id,)
+    else:
+        raise ValueError("dream_ids or user_id is required")
+    cur.execute(
+        f"UPDATE dreams d SET {TSV_COLUMN} = {tsv_sql()} FROM users u WHERE u.id = d.user_id AND {cond}",
+        params,
+    )
+
+
+def terms(q: Optional[str]) -> List[str]:
+    """Words of the query (letters and digits), lower-cased, at most MAX_TERMS."""
+    return [w.lower() for w in _WORD.findall(q or "")][:MAX_TERMS]
+
+
+def tsquery_text(words: Sequence[str]) -> str:
+    """to_tsquery input: every word as a prefix, all required."""
+    return " & ".join(w + ":*" for w in words)
+
+
+def match_sql(has_tsv: bool, words: Sequence[str]) -> Tuple[str, str, dict]:
+    """(WHERE condition, rank expression, params) for dreams d JOIN users u."""
+    if has_tsv:
+        query = f"to_tsquery('{CONFIG}', %(search_q)s)"
+        return (
+            f"d.{TSV_COLUMN} @@ {query}",
+            f"ts_rank_cd(d.{TSV_COLUMN}, {query})",
+            {"search_q": tsquery_text(words)},
+        )
+    conds, params = [], {}
+    for i, w in enumerate(words):
+        key = f"search_like{i}"
+        conds.append(
+            f"(d.dream ILIKE %({key})s OR u.name ILIKE %({key})s OR u.surname ILIKE %({key})s OR u.city ILIKE %({key})s)"
+        )
+        params[key] = "%" + w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return " AND ".join(conds), "0::real", params
@@ -0,0 +1,80 @@
+"""
+Delta sync of the personal dashboard (GET /dreams?since=<token>).
+
+Rows of dreams, dreams_steps and dream_books carry row_version: the 64-bit id of the
+transaction that last changed them (pg_current_xact_id). Deleted rows leave a tombstone
+with the deleting transaction's id. Triggers maintain both (_sql/mig_dreams_sync.sql).
+
+A token is the xmin of the reader's snapshot, taken by the first statement of the read.
+Every transaction not visible to that snapshot has an id >= xmin, so "row_version >=
+token" on the next read catches every change the previous read missed. Rows already seen
+may be sent again; the client applies changes by id, so that is harmless. Under READ
+COMMITTED every later statement of the read sees at least that first snapshot.
+
+Tombstones older than the retention (plus PRUNE_SLACK_DAYS for transactions that ran
+long before their commit) are pruned by prune(). A token issued more than the retention
+ago gets a full response instead of a delta.
+
+All functions take a cursor of the caller's transaction and work with any cursor_factory.
+"""
+from __future__ import annotations
+
+import time
+from typing import Optional, Tuple
+
+import page_cursor
+
+VERSION_COLUMN = "row_version"
+TOMBSTONES = "dreams_sync_tombstones"
+KINDS = ("dream", "step", "book")
+PRUNE_SLACK_DAYS = 1
+SNAPSHOT_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS version"
+TOMBSTONES_SQL = f"SELECT kind, entity_id FROM {TOMBSTONES} WHERE user_id = %s AND row_version >= %s ORDER BY id"
+
+
+def _get(row, i: int, key: str):
+    return row[key] if isinstance(row, dict) else row[i]
+
+
+def snapshot(cur) -> int:
+    """Token version of the current statement's snapshot (run it first in the read)."""
+    cur.execute(SNAPSHOT_SQL)
+    return int(_get(cur.fetchone(), 0, "version"))
+
+
+def encode_token(version: int, issued_at: Optional[float] = None) -> str:
+    return page_cursor.encode([version, int(issued_at if issued_at is not None else time.time())])
+
+
+def decode_token(token: str) -> Tuple[int, int]:
+    """(version, issued_at unix seconds); ValueError on garbage."""
+    try:
+        version, issued_at = page_cursor.decode(token, 2)
+        return int(version), int(issued_at)
+    except Exception as e:
+        raise ValueError("bad sync token") from e
+
+
+def expired(issued_at: int, retention_days: float, now: Optional[float] = None) -> bool:
+    """Tombstones of this token's window may already be pruned."""
+    return (now if now is not None else time.time()) - issued_at > retention_days * 86400
+
+
+def deleted(rows) -> dict:
+    """TOMBSTONES_SQL rows -> {"dreams": [...], "steps": [...], "books": [...]} (ids, no repeats)."""
+    out = {kind + "s": [] for kind in KINDS}
+    for row in rows:
+        ids = out.get(_get(row, 0, "kind") + "s")
+        entity_id = _get(row, 1, "entity_id")
+        if ids is not None and entity_id not in ids:
+            ids.append(entity_id)
+    return out
+
+
+def prune(cur, retention_days: float) -> int:
+    """Delete tombstones no unexpired token can need. Returns rows deleted."""
+    cur.execute(
+        f"DELETE FROM {TOMBSTONES} WHERE deleted_at < NOW() - make_interval(secs => %s)",
+        ((retention_days + PRUNE_SLACK_DAYS) * 86400,),
+    )
+    return cur.rowcount
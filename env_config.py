@@ -0,0 +1,20 @@
+"""
+Numeric settings from the environment (.env): an unset, empty or unparsable value gives the default.
+"""
+from __future__ import annotations
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except ValueError:
+        return default
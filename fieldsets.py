@@ -0,0 +1,149 @@
+"""
+Sparse fieldsets (fields=) for the large read endpoints: GET /dreams, GET /dreams/showcase,
+GET /steps/events, GET /schedule.
+
+A spec is a comma-separated list of field names and preset names, e.g. "card",
+"list,price" or "id,title,steps". Every resource has the presets "list" (what a list row
+needs), "card" (what a card shows) and "full" (everything, same as no spec). parse()
+resolves a spec to the selected names, or None when nothing is narrowed; "id" is always
+selected where the item has one (clients merge and patch by it). Handlers use
+wants() to drop SQL columns, joins and whole queries the selection does not need, and
+pick() to drop the unselected keys from each serialized item.
+
+Unknown names raise ValueError (the handler answers 400), so a typo does not silently
+return an empty object.
+"""
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Iterable, Optional, Sequence
+
+PRESETS = ("list", "card", "full")
+
+Selection = Optional[FrozenSet[str]]
+
+
+class Resource:
+    """Item shape of one endpoint: all field names (in output order) and the list / card presets."""
+
+    __slots__ = ("name", "fields", "presets")
+
+    def __init__(self, name: str, fields: Sequence[str], presets: Dict[str, Sequence[str]]) -> None:
+        self.name = name
+        self.fields = tuple(fields)
+        self.presets = {key: frozenset(names) for key, names in presets.items()}
+        self.presets["full"] = frozenset(self.fields)
+        unknown = set().union(*self.presets.values()) - set(self.fields)
+        if unknown:
+            raise ValueError(f"{name}: presets name unknown fields {sorted(unknown)}")
+
+    def parse(self, spec: Optional[str]) -> Selection:
+        """Selected field names; None — no spec or the full set. ValueError on an unknown name."""
+        if not spec or not spec.strip():
+            return None
+        selected = set()
+        for token in spec.split(","):
+            token = token.strip()
+            if not token:
+                continue
+            if token in self.presets:
+                selected |= self.presets[token]
+            elif token in self.fields:
+                selected.add(token)
+            else:
+                raise ValueError(f"unknown field {token!r} (presets: {', '.join(PRESETS)})")
+        if not selected:
+            raise ValueError("empty field list")
+        if "id" in self.fields:
+            selected.add("id")
+        if selected >= self.presets["full"]:
+            return None
+        return frozenset(selected)
+
+
+def wants(selected: Selection, *names: str) -> bool:
+    """True if any of names is selected (None selects everything)."""
+    return selected is None or any(name in selected for name in names)
+
+
+def pick(item: dict, selected: Selection, keep: Iterable[str] = ()) -> dict:
+    """item without the unselected keys (keep — keys that always stay); item itself when selected is None."""
+    if selected is None:
+        return item
+    keep = frozenset(keep)
+    return {key: value for key, value in item.items() if key in selected or key in keep}
+
+
+# Step of a dream (GET /dreams steps, GET /dreams/{id}/steps): _step_row_to_dict.
+STEP = Resource(
+    "step",
+    (
+        "id", "title", "completed", "deadline", "start_time", "end_time", "series_id", "series_index",
+        "series_total", "deleted", "plan_amount", "fact_amount", "waived",
+    ),
+    {
+        "list": ("id", "title", "completed", "deadline"),
+        "card": ("id", "title", "completed", "deadline", "start_time", "end_time", "series_id", "deleted", "waived"),
+    },
+)
+
+# Dream of the dashboard (GET /dreams): _build_dream_item; steps_summary in summary mode.
+DREAM = Resource(
+    "dream",
+    (
+        "id", "title", "dream", "description", "image_url", "status", "status_id", "status_obj", "deadline",
+        "category", "category_obj", "price", "is_public", "progress", "steps", "rule_code", "settings", "books",
+        "steps_summary",
+    ),
+    {
+        "list": ("id", "title", "status", "deadline", "category", "is_public"),
+        "card": (
+            "id", "title", "dream", "status", "status_obj", "deadline", "category", "category_obj", "price",
+            "is_public", "steps", "rule_code", "settings", "books", "steps_summary",
+        ),
+    },
+)
+
+# Showcase card (GET /dreams/showcase): _showcase_item; is_owner_view / has_pending_completion — in_progress.
+# Author contacts are only in "full": the card opens them through GET /dreams/{id}/contact.
+SHOWCASE_CARD = Resource(
+    "showcase card",
+    (
+        "id", "dream", "deadline", "price", "date", "user_id", "user_name", "city", "status", "status_label",
+        "telegram", "vk", "phone", "is_viewed", "is_favorite", "is_helping", "is_helped",
+        "pending_completion_request", "favorites_count", "is_owner_view", "has_pending_completion",
+    ),
+    {
+        "list": ("id", "dream", "user_name", "status", "is_viewed"),
+        "card": (
+            "id", "dream", "deadline", "price", "date", "user_id", "user_name", "city", "status", "status_label",
+            "is_viewed", "is_favorite", "is_helping", "is_helped", "pending_completion_request", "favorites_count",
+            "is_owner_view", "has_pending_completion",
+        ),
+    },
+)
+
+# Diary entry (GET /steps/events): _step_event_item + linked titles.
+STEP_EVENT = Resource(
+    "step event",
+    (
+        "id", "step_id", "dream_id", "event_type", "message", "created_at", "step_title",
+        "linked_dream_ids", "linked_step_ids", "linked_dream_titles", "linked_step_titles",
+    ),
+    {
+        "list": ("id", "event_type", "message", "created_at"),
+        "card": (
+            "id", "step_id", "dream_id", "event_type", "message", "created_at", "step_title",
+            "linked_dream_titles", "linked_step_titles",
+        ),
+    },
+)
+
+# Schedule row (GET /schedule): _schedule_step_item and the virtual book rows.
+SCHEDULE_ITEM = Resource(
+    "schedule item",
+    ("dream_id", "source_type", "source_id", "title", "date", "completed"),
+    {
+        "list": ("title", "date", "completed"),
+        "card": ("dream_id", "source_type", "source_id", "title", "date", "completed"),
+    },
+)
@@ -0,0 +1,273 @@
+"""
+In-process metrics in Prometheus text format (GET /metrics), without extra dependencies.
+
+Counters and histograms are labelled and thread-safe; gauges are read from callbacks
+at scrape time (pool sizes). Per-request DB time is accumulated in a RequestStats
+object bound to a ContextVar by the HTTP middleware; the instrumented cursor
+(db_pool.InstrumentedConnection) and the async cursor (db_async) report into it.
+The same object carries the statement count, the slowest statement and the time the
+request held pooled connections (checkout -> return, main.LazyDb releases early),
+which the middleware turns into Server-Timing headers and the SLOW log line.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = self.header()
+        for key, row in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += row[i]
+                le = 'le="' + _num(b) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_num(acc)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(row[-2])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {_num(row[-1])}")
+        return out
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples come from fn() -> {label values tuple: value} at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str], fn: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        super().__init__(name, doc, labelnames)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            samples = self.fn() or {}
+        except Exception:
+            samples = {}
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(samples.items())]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# --- SQL fingerprints ----------------------------------------------------
+
+_FP_STRING = re.compile(r"'(?:[^']|'')*'")
+_FP_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_PARAM = re.compile(r"%\(\w+\)s|%s")
+_FP_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_FP_SPACE = re.compile(r"\s+")
+
+
+def sql_text(query) -> str:
+    """Query as str (psycopg2 accepts bytes, psycopg 3 also sql.Composed)."""
+    if isinstance(query, bytes):
+        return query.decode("utf-8", errors="replace")
+    if isinstance(query, str):
+        return query
+    as_string = getattr(query, "as_string", None)
+    if as_string is not None:
+        try:
+            return as_string(None)
+        except Exception:
+            pass
+    return str(query)
+
+
+def fingerprint(query) -> str:
+    """Normalized SQL: literals and placeholders -> ?, IN-lists collapsed, whitespace squeezed."""
+    q = _FP_STRING.sub("?", sql_text(query))
+    q = _FP_PARAM.sub("?", q)
+    q = _FP_NUMBER.sub("?", q)
+    q = _FP_LIST.sub("(?)", q)
+    return _FP_SPACE.sub(" ", q).strip()
+
+
+def fingerprint_id(fp: str) -> str:
+    """Short stable id of a fingerprint (ASCII, fits in a header)."""
+    return hashlib.md5(fp.encode("utf-8")).hexdigest()[:8]
+
+
+# --- per-request DB stats ------------------------------------------------
+
+class RequestStats:
+    """DB activity of one HTTP request (filled by the instrumented cursors)."""
+
+    __slots__ = ("db_time", "statements", "slowest_time", "slowest_query", "conn_hold", "db_timeout", "route_fn")
+
+    def __init__(self, route_fn: Optional[Callable[[], str]] = None) -> None:
+        self.route_fn = route_fn
+        self.db_time = 0.0
+        self.statements = 0
+        self.slowest_time = 0.0
+        self.slowest_query = None
+        self.conn_hold = 0.0
+        # "statement" / "lock": a statement hit statement_timeout / lock_timeout (the middleware answers 503).
+        self.db_timeout: Optional[str] = None
+
+    def slowest_fingerprint(self) -> str:
+        return fingerprint(self.slowest_query) if self.slowest_query is not None else ""
+
+    def server_timing(self, total_sec: float) -> str:
+        """Server-Timing value: db (time + count), slowest statement (fingerprint id), connection hold, app total."""
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.statements} queries"']
+        if self.slowest_query is not None:
+            parts.append(f'db-slowest;dur={self.slowest_time * 1000:.1f};desc="{fingerprint_id(self.slowest_fingerprint())}"')
+        if self.conn_hold > 0:
+            parts.append(f"db-conn;dur={self.conn_hold * 1000:.1f}")
+        parts.append(f"app;dur={total_sec * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("island_request_stats", default=None)
+
+
+def begin_request(route_fn: Optional[Callable[[], str]] = None) -> Tuple[RequestStats, object]:
+    """route_fn: resolves the route label lazily (routing happens after the middleware starts)."""
+    stats = RequestStats(route_fn)
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token) -> None:
+    try:
+        _request_stats.reset(token)
+    except ValueError:
+        pass
+
+
+def current_route() -> str:
+    """Route of the request being served ("" outside a request: startup, scripts)."""
+    stats = _request_stats.get()
+    if stats is None or stats.route_fn is None:
+        return ""
+    try:
+        return stats.route_fn()
+    except Exception:
+        return ""
+
+
+def observe_statement(query, seconds: float) -> None:
+    """Called by the instrumented cursors after every execute()."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_time += seconds
+        stats.statements += 1
+        if seconds >= stats.slowest_time:
+            stats.slowest_time = seconds
+            stats.slowest_query = query
+
+
+def observe_conn_hold(seconds: float) -> None:
+    """Called when a pooled connection goes back (sync _return_conn, async pool context)."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.conn_hold += seconds
+
+
+def observe_db_timeout(kind: str) -> None:
+    """Called by the instrumented cursors on QueryCanceled / LockNotAvailable."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_timeout = kind
@@ -1,22 +1,31 @@
 import os
 import time
 import calendar
+import hashlib
+import json
 import logging
 from logging.handlers import RotatingFileHandler
 from collections import defaultdict, deque
 from datetime import datetime, date, timedelta, timezone
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from pathlib import Path
 import re
+import threading
 from threading import Lock
 import psycopg2
 from psycopg2 import OperationalError
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor, Json, execute_values
-from fastapi import FastAPI, HTTPException, File, UploadFile, Request
+from fastapi import Depends, FastAPI, HTTPException, File, UploadFile, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from starlette.routing import Mount
+from pydantic import BaseModel, conint
 from typing import Optional, List, Tuple
 from dotenv import load_dotenv
 from passlib.hash import bcrypt
@@ -31,6 +40,7 @@ from breakfast_sveta import (
 )
 from buddy_alerts_core import (
     ensure_buddy_alerts_schema,
+    mark_buddy_alerts_schema_ready,
     fan_out_steps_success_100,
     fetch_buddy_notifications,
     get_buddy_alert_settings,
@@ -39,6 +49,43 @@ from buddy_alerts_core import (
     count_unread_buddy_alerts,
     mark_buddy_notification_read,
 )
+from db_async import (
+    async_available,
+    async_errors,
+    async_pool_stats,
+    async_requested,
+    close_async_pool,
+    open_async_pool,
+    psycopg,
+)
+from db_pool import TIMEOUT_ERRORS as DB_TIMEOUT_ERRORS, IdleValidatingPool, InstrumentedConnection, set_local_timeouts
+from db_slowlog import SLOW_QUERY_LOG_NAME, configure_slow_query_log
+from db_schema import LOAD_SQL, SCHEMA_STAMP_NAME, SchemaRegistry
+from env_config import env_int
+from island_metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY as METRICS,
+    WAIT_BUCKETS,
+    CallbackGauge,
+    Counter,
+    Histogram,
+    begin_request,
+    current_route,
+    end_request,
+    observe_conn_hold,
+)
+import dream_search
+import dreams_sync
+import fieldsets
+import page_cursor
+import recommendations
+import showcase_counters
+import showcase_facets
+import showcase_flags
+import view_buffer
+import viewed_sets
+from showcase_cache import SnapshotCache, etag_matches
+from view_buffer import ViewBuffer
 
 # bcrypt принимает пароль не длиннее 72 байт; длинные обрезаем, чтобы не было 500 при входе/регистрации
 def _step_title_series_key(title: Optional[str]) -> str:
@@ -97,23 +144,193 @@ app = FastAPI()
 ENABLE_SPECIAL_BOOKS_IN_SCHEDULE = False
 
 
+def _route_label(request: Request) -> str:
+    """Шаблон пути маршрута (/dreams/{dream_id}) — ограниченная кардинальность меток /metrics."""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    for r in app.routes:
+        if isinstance(r, Mount) and request.url.path.startswith(r.path + "/"):
+            return r.path + "/*"
+    return "<unmatched>"
+
+
+# Бюджет SQL-запросов на один HTTP-запрос (ловим N+1). Превышение — WARNING «QUERY BUDGET» в app.log;
+# DB_QUERY_BUDGET_STRICT=1 (тесты, отладка) — вместо ответа 500, чтобы тест упал на маршруте с N+1.
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET") or 20)
+DB_QUERY_BUDGET_STRICT = (os.getenv("DB_QUERY_BUDGET_STRICT") or "").strip().lower() in ("1", "true", "yes", "on")
+# Маршруты, которым по смыслу нужно больше/меньше запросов, чем DB_QUERY_BUDGET (шаблон пути -> лимит).
+_ROUTE_QUERY_BUDGETS: dict = {}
+
+
+def _query_budget_exceeded(route: str, stats) -> Optional[str]:
+    budget = _ROUTE_QUERY_BUDGETS.get(route, DB_QUERY_BUDGET)
+    if budget <= 0 or stats.statements <= budget:
+        return None
+    return f"{stats.statements} SQL statements > budget {budget} (slowest: {stats.slowest_fingerprint()[:200]})"
+
+
+# Лимиты времени SQL на HTTP-запрос: SET LOCAL statement_timeout / lock_timeout в каждой транзакции
+# выданного соединения (db_pool.set_local_timeouts). Интерактивные маршруты — жёсткие лимиты,
+# админские (_DB_TIMEOUT_LOOSE_PREFIXES) — свободные; 0 — без лимита. Прерванный запрос — 503 + Retry-After.
+DB_STATEMENT_TIMEOUT_MS = env_int("DB_STATEMENT_TIMEOUT_MS", 5000)
+DB_LOCK_TIMEOUT_MS = env_int("DB_LOCK_TIMEOUT_MS", 2000)
+DB_ADMIN_STATEMENT_TIMEOUT_MS = env_int("DB_ADMIN_STATEMENT_TIMEOUT_MS", 120000)
+DB_ADMIN_LOCK_TIMEOUT_MS = env_int("DB_ADMIN_LOCK_TIMEOUT_MS", 15000)
+DB_TIMEOUT_RETRY_AFTER_SEC = max(env_int("DB_TIMEOUT_RETRY_AFTER_SEC", 5), 1)
+_DB_TIMEOUT_LOOSE_PREFIXES = ("/admin",)
+
+
+def _parse_route_db_timeouts(raw: str) -> dict:
+    """DB_ROUTE_TIMEOUTS: «шаблон_пути:statement_ms[:lock_ms],...»; без lock_ms — DB_LOCK_TIMEOUT_MS."""
+    out = {}
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split(":")
+        try:
+            if not parts[0].startswith("/") or len(parts) not in (2, 3):
+                raise ValueError(item)
+            out[parts[0]] = (int(parts[1]), int(parts[2]) if len(parts) == 3 else DB_LOCK_TIMEOUT_MS)
+        except ValueError:
+            print(f"⚠ DB_ROUTE_TIMEOUTS: пропущено «{item}» (ожидается /путь:statement_ms[:lock_ms])")
+    return out
+
+
+# Маршруты со своими лимитами (шаблон пути -> (statement_timeout_ms, lock_timeout_ms)): подбор кандидатов
+# шагов для книги сравнивает ключевые слова со всеми шагами мечты и на длинных сериях не укладывается
+# в общий лимит. DB_ROUTE_TIMEOUTS дополняет и переопределяет этот список.
+_ROUTE_DB_TIMEOUTS: dict = {
+    "/dreams/{dream_id}/books/{book_id}/step-candidates": (15000, DB_LOCK_TIMEOUT_MS),
+    **_parse_route_db_timeouts(os.getenv("DB_ROUTE_TIMEOUTS")),
+}
+
+
+def _db_timeouts_for_request() -> Optional[Tuple[int, int]]:
+    """(statement_timeout_ms, lock_timeout_ms) маршрута текущего запроса; None — вне HTTP-запроса (старт, скрипты)."""
+    route = current_route().partition(" ")[2]
+    if not route:
+        return None
+    timeouts = _ROUTE_DB_TIMEOUTS.get(route)
+    if timeouts is None:
+        if route.startswith(_DB_TIMEOUT_LOOSE_PREFIXES):
+            timeouts = (DB_ADMIN_STATEMENT_TIMEOUT_MS, DB_ADMIN_LOCK_TIMEOUT_MS)
+        else:
+            timeouts = (DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS)
+    return timeouts if any(timeouts) else None
+
+
+def _db_timeout_response(kind: str) -> JSONResponse:
+    setting = "lock_timeout" if kind == "lock" else "statement_timeout"
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Запрос к БД прерван по {setting}, повторите попытку позже"},
+        headers={"Retry-After": str(DB_TIMEOUT_RETRY_AFTER_SEC)},
+    )
+
+
+# Чтение с реплики (DB_REPLICA_HOST): только эти GET-маршруты. Read-your-writes: после успешного
+# не-GET запроса клиент (cookie island_rw) и user_id из query DB_REPLICA_STICKY_SEC секунд читают из основной БД.
+_REPLICA_READ_ROUTES = frozenset({
+    "/dreams/showcase", "/dreams", "/schedule", "/steps/events", "/landing_stats", "/roadmap",
+})
+DB_REPLICA_STICKY_SEC = float(os.getenv("DB_REPLICA_STICKY_SEC") or 5)
+DB_REPLICA_RETRY_SEC = float(os.getenv("DB_REPLICA_RETRY_SEC") or 30)
+_replica_down_until = 0.0
+_REPLICA_STICKY_COOKIE = "island_rw"
+_replica_sticky_users: dict = {}  # user_id -> time.time(), до которого читаем из основной БД
+_replica_read_request: ContextVar = ContextVar("island_replica_read_request", default=None)
+
+
+def _query_user_ids(request: Request) -> List[int]:
+    out = []
+    for name in ("user_id", "viewer_id"):
+        v = request.query_params.get(name)
+        if v and v.isdigit():
+            out.append(int(v))
+    return out
+
+
+def _replica_sticky(request: Request) -> bool:
+    now = time.time()
+    try:
+        if float(request.cookies.get(_REPLICA_STICKY_COOKIE) or 0) > now:
+            return True
+    except ValueError:
+        pass
+    return any(_replica_sticky_users.get(uid, 0) > now for uid in _query_user_ids(request))
+
+
+def _mark_replica_sticky(request: Request, response) -> None:
+    until = time.time() + DB_REPLICA_STICKY_SEC
+    for uid in _query_user_ids(request):
+        _replica_sticky_users[uid] = until
+    if len(_replica_sticky_users) > 10000:
+        now = time.time()
+        for uid in [u for u, t in _replica_sticky_users.items() if t <= now]:
+            _replica_sticky_users.pop(uid, None)
+    response.set_cookie(
+        _REPLICA_STICKY_COOKIE, f"{until:.0f}", max_age=int(DB_REPLICA_STICKY_SEC) + 1, httponly=True, samesite="lax",
+    )
+
+
 @app.middleware("http")
 async def island_request_log_middleware(request: Request, call_next):
     started = time.time()
+    stats, stats_token = begin_request(lambda: f"{request.method} {_route_label(request)}")
+    replica_token = None
+    if db_replica_pool is not None and request.method == "GET":
+        request.state.replica_sticky = _replica_sticky(request)
+        replica_token = _replica_read_request.set(request)
     try:
         response = await call_next(request)
+        if stats.db_timeout and response.status_code >= 500:
+            # Обработчики заворачивают исключения в 500 — прерванный по лимиту запрос отдаём как 503
+            app_logger.warning("DB TIMEOUT %s %s (%s_timeout)", request.method, request.url.path, stats.db_timeout)
+            _metric_db_timeouts.inc(kind=stats.db_timeout, route=_route_label(request))
+            response = _db_timeout_response(stats.db_timeout)
+        if db_replica_pool is not None and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            _mark_replica_sticky(request, response)
         ms = (time.time() - started) * 1000
-        if response.status_code >= 500:
+        route = _route_label(request)
+        _metric_http_latency.observe(ms / 1000, method=request.method, route=route)
+        _metric_http_db_time.observe(stats.db_time, method=request.method, route=route)
+        if stats.conn_hold > 0:
+            _metric_http_conn_hold.observe(stats.conn_hold, method=request.method, route=route)
+        _metric_http_requests.inc(method=request.method, route=route, status=str(response.status_code))
+        over_budget = _query_budget_exceeded(route, stats)
+        if over_budget:
+            app_logger.warning("QUERY BUDGET %s %s: %s", request.method, route, over_budget)
+            if DB_QUERY_BUDGET_STRICT:
+                response = JSONResponse(status_code=500, content={"detail": f"Query budget exceeded on {route}: {over_budget}"})
+        response.headers["Server-Timing"] = stats.server_timing(ms / 1000)
+        if response.status_code >= 500 and not stats.db_timeout:
             app_logger.error(
                 "HTTP %s %s -> %s (%.0fms)",
                 request.method, request.url.path, response.status_code, ms,
             )
         elif ms >= 3000:
-            app_logger.warning("SLOW %s %s (%.0fms)", request.method, request.url.path, ms)
+            app_logger.warning(
+                "SLOW %s %s (%.0fms) db=%.0fms conn=%.0fms queries=%d slowest=%.0fms %s",
+                request.method, request.url.path, ms, stats.db_time * 1000, stats.conn_hold * 1000, stats.statements,
+                stats.slowest_time * 1000, stats.slowest_fingerprint()[:300],
+            )
         return response
     except Exception:
+        if stats.db_timeout:
+            app_logger.warning("DB TIMEOUT %s %s (%s_timeout)", request.method, request.url.path, stats.db_timeout)
+            _metric_db_timeouts.inc(kind=stats.db_timeout, route=_route_label(request))
+            _metric_http_requests.inc(method=request.method, route=_route_label(request), status="503")
+            return _db_timeout_response(stats.db_timeout)
         app_logger.exception("UNHANDLED %s %s", request.method, request.url.path)
+        _metric_http_requests.inc(method=request.method, route=_route_label(request), status="500")
         raise
+    finally:
+        end_request(stats_token)
+        if replica_token is not None:
+            _replica_read_request.reset(replica_token)
 
 BASE_DIR = Path(__file__).resolve().parent
 LOG_DIR = BASE_DIR / "logs"
@@ -137,6 +354,8 @@ def _setup_app_logging() -> logging.Logger:
 
 
 app_logger = _setup_app_logging()
+# Медленные SQL (> DB_SLOW_QUERY_MS) с планом — в logs/slow_sql.log (db_slowlog.py)
+configure_slow_query_log(LOG_DIR / SLOW_QUERY_LOG_NAME)
 _HTML_NO_CACHE = {"Cache-Control": "no-cache, must-revalidate"}
 
 @app.get("/landing", include_in_schema=False)
@@ -180,22 +399,107 @@ app.add_middleware(
 
 # Пул соединений с БД (Connection Pool) — переиспользуем соединения вместо создания нового на каждый запрос
 db_pool = None
+# Пул реплики для чтения (DB_REPLICA_HOST); None — всё читается из основной БД
+db_replica_pool = None
+# Какие таблицы/колонки есть в БД: читается один раз при старте, обновляется после run_migrate.py
+schema_registry = SchemaRegistry(stamp_path=LOG_DIR / SCHEMA_STAMP_NAME)
+
+# Метрики пула и запросов (GET /metrics): по ним подбираем DB_POOL_MAX и число воркеров
+_metric_checkout_wait = METRICS.register(Histogram(
+    "island_db_pool_checkout_wait_seconds",
+    "Time spent in get_db_connection(): pool lock, idle ping, retries.",
+    buckets=WAIT_BUCKETS,
+))
+_metric_checkouts = METRICS.register(Counter(
+    "island_db_pool_checkouts_total", "Connections handed out by get_db_connection().", ("validated",),
+))
+_metric_checkout_errors = METRICS.register(Counter(
+    "island_db_pool_checkout_errors_total", "get_db_connection() failures (exhausted = all maxconn in use).", ("reason",),
+))
+_metric_discarded = METRICS.register(Counter(
+    "island_db_pool_discarded_total", "Broken connections closed instead of returned to the pool.", ("where",),
+))
+_metric_http_latency = METRICS.register(Histogram(
+    "island_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"),
+))
+_metric_http_requests = METRICS.register(Counter(
+    "island_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"),
+))
+_metric_http_db_time = METRICS.register(Histogram(
+    "island_http_request_db_seconds", "DB time per request (sum of cursor execute).", ("method", "route"),
+))
+_metric_db_timeouts = METRICS.register(Counter(
+    "island_db_timeouts_total", "Requests answered 503 after statement_timeout / lock_timeout.", ("kind", "route"),
+))
+_metric_showcase_drift = METRICS.register(Counter(
+    "island_showcase_counters_drift_total", "user_showcase_counters values fixed by the background reconciler.", ("counter",),
+))
+_metric_dream_views = METRICS.register(Counter(
+    "island_dream_views_total", "Showcase card views by write-behind buffer result.", ("result",),
+))
+_metric_showcase_cache = METRICS.register(Counter(
+    "island_showcase_cache_total", "Anonymous GET /dreams/showcase by snapshot cache result.", ("result",),
+))
+_metric_user_etag = METRICS.register(Counter(
+    "island_user_etag_total", "Dashboard GETs with a per-user ETag: 304 or full response.", ("route", "result"),
+))
+_metric_http_conn_hold = METRICS.register(Histogram(
+    "island_http_request_db_conn_hold_seconds",
+    "Time a request held pooled connections (checkout -> return), requests that took one.", ("method", "route"),
+))
+
+
+def _pool_gauge_samples() -> dict:
+    if db_pool is None:
+        return {}
+    st = db_pool.stats()
+    return {("idle",): st["idle"], ("in_use",): st["in_use"], ("min",): st["min"], ("max",): st["max"]}
+
+
+def _async_pool_gauge_samples() -> dict:
+    return {(k,): v for k, v in async_pool_stats(async_db_pool).items()}
+
+
+METRICS.register(CallbackGauge(
+    "island_db_pool_connections", "Sync pool: idle / in_use connections and min / max bounds.", ("state",), _pool_gauge_samples,
+))
+def _replica_pool_gauge_samples() -> dict:
+    if db_replica_pool is None:
+        return {}
+    return {(k,): v for k, v in db_replica_pool.stats().items()}
+
+
+METRICS.register(CallbackGauge(
+    "island_db_replica_pool_connections", "Read-replica pool (DB_REPLICA_HOST): idle / in_use / min / max.", ("state",),
+    _replica_pool_gauge_samples,
+))
+_metric_read_routing = METRICS.register(Counter(
+    "island_db_read_routing_total", "Checkouts of replica-eligible GET routes by target.", ("target",),
+))
+METRICS.register(CallbackGauge(
+    "island_db_async_pool", "Async pool (DB_ASYNC=1) psycopg_pool stats.", ("stat",), _async_pool_gauge_samples,
+))
+
+def _db_conn_kwargs(replica: bool = False):
+    """Параметры подключения к БД (host, user, password, ...). replica=True — реплика для чтения:
+    DB_REPLICA_HOST и DB_REPLICA_PORT/USER/PASS/NAME (если не заданы — как у основной БД)."""
+    def env(name):
+        return (os.getenv("DB_REPLICA_" + name) or os.getenv("DB_" + name)) if replica else os.getenv("DB_" + name)
 
-def _db_conn_kwargs():
-    """Параметры подключения к БД (host, user, password, ...)."""
     conn_kw = dict(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS"),
-        dbname=os.getenv("DB_NAME"),
+        host=env("HOST"),
+        user=env("USER"),
+        password=env("PASS"),
+        dbname=env("NAME"),
         cursor_factory=RealDictCursor,
+        connection_factory=InstrumentedConnection,
         connect_timeout=15,
         keepalives=1,
         keepalives_idle=30,
     )
-    if os.getenv("DB_PORT"):
-        conn_kw["port"] = int(os.getenv("DB_PORT"))
-    sslmode = (os.getenv("DB_SSLMODE") or "").strip()
+    if env("PORT"):
+        conn_kw["port"] = int(env("PORT"))
+    sslmode = (env("SSLMODE") or "").strip()
     if sslmode:
         conn_kw["sslmode"] = sslmode
     return conn_kw
@@ -220,11 +524,18 @@ def startup_event():
     for attempt in range(3):
         try:
             conn_kw = _db_conn_kwargs()
-            db_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=30,
+            db_pool = IdleValidatingPool(
+                minconn=env_int("DB_POOL_MIN", 4),
+                maxconn=env_int("DB_POOL_MAX", 30),
                 **conn_kw,
             )
+            db_pool.start_reaper()
+            _open_replica_pool()
+            _prepare_schema()
+            _start_showcase_reconciler()
+            _start_showcase_facets_refresher()
+            _start_recommendations_refresher()
+            _start_dream_views_flusher()
             # Политика дневника: успешные отметки шагов не храним в events (только рефлексия/комментарии).
             _purge_success_step_events()
             return
@@ -238,33 +549,279 @@ def startup_event():
             print("⚠ Пул БД не создан:", e)
             break
 
+def _open_replica_pool():
+    """Второй пул — на реплику (если задан DB_REPLICA_HOST). Недоступная реплика не мешает старту: чтение идёт в основную БД."""
+    global db_replica_pool
+    if not os.getenv("DB_REPLICA_HOST"):
+        return
+    try:
+        db_replica_pool = IdleValidatingPool(
+            minconn=env_int("DB_REPLICA_POOL_MIN", 2),
+            maxconn=env_int("DB_REPLICA_POOL_MAX", 30),
+            **_db_conn_kwargs(replica=True),
+        )
+        db_replica_pool.start_reaper()
+    except Exception as e:
+        db_replica_pool = None
+        print("⚠ Пул реплики не создан, чтение идёт в основную БД:", e)
+
 @app.on_event("shutdown")
 def shutdown_event():
-    global db_pool
-    if db_pool:
-        try:
-            db_pool.closeall()
-        except Exception:
-            pass
-        db_pool = None
+    global db_pool, db_replica_pool
+    if db_pool is not None:
+        _flush_dream_views()
+    for p in (db_pool, db_replica_pool):
+        if p:
+            try:
+                p.closeall()
+            except Exception:
+                pass
+    db_pool = None
+    db_replica_pool = None
+
+def _prepare_schema():
+    """При старте: прочитать схему БД в schema_registry и выполнить bootstrap схемы (_run_schema_bootstrap).
+    Ошибка не фатальна — get_db_connection() повторит это лениво при первом запросе."""
+    conn = None
+    try:
+        conn = db_pool.getconn()
+        schema_registry.load(conn)
+        _run_schema_bootstrap(conn)
+    except Exception as e:
+        print("⚠ Схема БД не прочитана при старте:", e)
+    finally:
+        _return_conn(conn)
+
+# Сверка user_showcase_counters с исходными таблицами в фоне: раз в SHOWCASE_COUNTERS_RECONCILE_SEC
+# (0 — выключено) пересчитываются SHOWCASE_COUNTERS_RECONCILE_BATCH давно не сверенных строк.
+SHOWCASE_COUNTERS_RECONCILE_SEC = float(os.getenv("SHOWCASE_COUNTERS_RECONCILE_SEC") or 300)
+SHOWCASE_COUNTERS_RECONCILE_BATCH = env_int("SHOWCASE_COUNTERS_RECONCILE_BATCH", 500)
+_showcase_reconciler_started = False
+
+
+def _reconcile_showcase_counters_once() -> None:
+    if not _showcase_counters_ready():
+        return
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            checked, drift = showcase_counters.reconcile(cur, SHOWCASE_COUNTERS_RECONCILE_BATCH, _has_completion_requests())
+        conn.commit()
+        for item in drift:
+            for counter in item:
+                if counter != "user_id":
+                    _metric_showcase_drift.inc(counter=counter)
+        if drift:
+            app_logger.warning("SHOWCASE COUNTERS drift fixed in %d of %d rows: %s", len(drift), checked, drift[:10])
+    except Exception as e:
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        app_logger.warning("SHOWCASE COUNTERS reconcile failed: %s", e)
+    finally:
+        _return_conn(conn)
+
+
+def _showcase_reconciler_loop() -> None:
+    while True:
+        time.sleep(SHOWCASE_COUNTERS_RECONCILE_SEC)
+        _reconcile_showcase_counters_once()
+
+
+def _start_showcase_reconciler() -> None:
+    """Фоновый поток сверки счётчиков витрины (несколько воркеров не мешают друг другу: FOR UPDATE SKIP LOCKED)."""
+    global _showcase_reconciler_started
+    if _showcase_reconciler_started or SHOWCASE_COUNTERS_RECONCILE_SEC <= 0:
+        return
+    _showcase_reconciler_started = True
+    threading.Thread(target=_showcase_reconciler_loop, name="showcase-counters-reconciler", daemon=True).start()
+
+# Свёртка фасетов витрины (showcase_facet_counts) пересобирается в фоне раз в SHOWCASE_FACETS_REFRESH_SEC
+# (0 — выключено). Воркеры не пересобирают её одновременно и чаще, чем раз в полинтервала (showcase_facets.refresh).
+SHOWCASE_FACETS_REFRESH_SEC = float(os.getenv("SHOWCASE_FACETS_REFRESH_SEC") or 60)
+_showcase_facets_refresher_started = False
+
+
+def _refresh_showcase_facets_once() -> None:
+    if not schema_registry.has_table(showcase_facets.TABLE):
+        return
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            showcase_facets.refresh(
+                cur, _showcase_has_statuses(), _showcase_has_categories(), min_age_sec=SHOWCASE_FACETS_REFRESH_SEC / 2,
+            )
+        conn.commit()
+    except Exception as e:
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        app_logger.warning("SHOWCASE FACETS refresh failed: %s", e)
+    finally:
+        _return_conn(conn)
+
+
+def _showcase_facets_refresher_loop() -> None:
+    while True:
+        time.sleep(SHOWCASE_FACETS_REFRESH_SEC)
+        _refresh_showcase_facets_once()
+
+
+def _start_showcase_facets_refresher() -> None:
+    global _showcase_facets_refresher_started
+    if _showcase_facets_refresher_started or SHOWCASE_FACETS_REFRESH_SEC <= 0:
+        return
+    _showcase_facets_refresher_started = True
+    threading.Thread(target=_showcase_facets_refresher_loop, name="showcase-facets-refresher", daemon=True).start()
+
+# Лента «Рекомендуем» (recommendations.py): фоновый пересчёт раз в RECOMMEND_REFRESH_SEC (0 — выключено),
+# за проход — до RECOMMEND_REFRESH_BATCH пользователей: сначала с новыми событиями (избранное, «Хочу помочь»,
+# «Помог»), затем пересчитанные раньше RECOMMEND_MAX_AGE_SEC. На пользователя хранится RECOMMEND_TOP_N мечт.
+RECOMMEND_REFRESH_SEC = float(os.getenv("RECOMMEND_REFRESH_SEC") or 30)
+RECOMMEND_REFRESH_BATCH = env_int("RECOMMEND_REFRESH_BATCH", 20)
+RECOMMEND_MAX_AGE_SEC = float(os.getenv("RECOMMEND_MAX_AGE_SEC") or 3600)
+RECOMMEND_TOP_N = env_int("RECOMMEND_TOP_N", 100)
+_recommendations_refresher_started = False
+
+
+def _recommendations_ready() -> bool:
+    """Таблицы ленты есть (mig_user_recommendations)."""
+    return schema_registry.has_table(recommendations.TABLE) and schema_registry.has_table(recommendations.STATE_TABLE)
+
+
+def _recommendations_schema() -> Tuple[bool, bool, bool, bool]:
+    """(категории, dreams.favorites_count, dreams_steps_events, dreams.created_at / updated_at) — какие сигналы есть в схеме."""
+    return (
+        schema_registry.has("dreams", "category_id"),
+        schema_registry.has("dreams", "favorites_count"),
+        schema_registry.has_table("dreams_steps_events"),
+        schema_registry.has("dreams", "created_at") and schema_registry.has("dreams", "updated_at"),
+    )
+
+
+def _mark_recommendations(cur, user_ids: List[int]) -> None:
+    """Событие пользователя (избранное, «Хочу помочь», «Помог») — в той же транзакции пометить его ленту к пересчёту."""
+    if _recommendations_ready():
+        recommendations.mark(cur, user_ids)
+
+
+def _refresh_recommendations_once() -> int:
+    if not _recommendations_ready():
+        return 0
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            if not recommendations.try_lock(cur):
+                return 0
+            users = recommendations.due(cur, RECOMMEND_REFRESH_BATCH, RECOMMEND_MAX_AGE_SEC)
+            recommendations.refresh(cur, users, RECOMMEND_TOP_N, *_recommendations_schema())
+        conn.commit()
+        return len(users)
+    except Exception as e:
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        app_logger.warning("RECOMMENDATIONS refresh failed: %s", e)
+        return 0
+    finally:
+        _return_conn(conn)
+
+
+def _recommendations_refresher_loop() -> None:
+    while True:
+        time.sleep(RECOMMEND_REFRESH_SEC)
+        _refresh_recommendations_once()
+
+
+def _start_recommendations_refresher() -> None:
+    global _recommendations_refresher_started
+    if _recommendations_refresher_started or RECOMMEND_REFRESH_SEC <= 0:
+        return
+    _recommendations_refresher_started = True
+    threading.Thread(target=_recommendations_refresher_loop, name="recommendations-refresher", daemon=True).start()
 
 def _return_conn(conn, discard=False):
     """Вернуть соединение в пул или закрыть. discard=True — отбросить сломанное (SSL closed и т.п.), не возвращать в пул."""
     if conn is None:
         return
+    checked_out_at = getattr(conn, "checked_out_at", None)
+    if checked_out_at is not None:
+        conn.checked_out_at = None
+        observe_conn_hold(time.perf_counter() - checked_out_at)
+    if getattr(conn, "local_timeouts", None):
+        conn.local_timeouts = None
     try:
         if not discard:
             try:
                 conn.rollback()
             except Exception:
                 pass
-        if db_pool is not None:
-            db_pool.putconn(conn, close=discard)
+        pool = db_replica_pool if db_replica_pool is not None and db_replica_pool.owns(conn) else db_pool
+        if pool is not None:
+            # conn.closed: сервер оборвал соединение посреди запроса — остальные простаивающие тоже под подозрением
+            if discard or conn.closed:
+                _metric_discarded.inc(where="return")
+                pool.mark_suspect()
+            pool.putconn(conn, close=discard)
         else:
             conn.close()
     except Exception:
         pass
 
+
+class LazyDb:
+    """Соединение одного запроса: берётся из пула при первом cursor(), возвращается release().
+
+    Обработчик вызывает release() сразу после последнего SQL — сборка ответа (dict'ы, сортировки,
+    JSON) идёт уже без занятого соединения — и ещё раз в finally, как _return_conn(conn): выход
+    зависимости с yield (lazy_db) FastAPI выполняет уже после отправки ответа, это только страховка.
+    Использование: db: LazyDb = Depends(lazy_db).
+    """
+
+    __slots__ = ("conn",)
+
+    def __init__(self) -> None:
+        self.conn = None
+
+    def cursor(self):
+        if self.conn is None:
+            self.conn = get_db_connection()
+        return self.conn.cursor(cursor_factory=RealDictCursor)
+
+    def rollback(self) -> None:
+        if self.conn is not None:
+            self.conn.rollback()
+
+    def release(self, discard: bool = False) -> None:
+        conn, self.conn = self.conn, None
+        _return_conn(conn, discard=discard)
+
+
+def lazy_db():
+    db = LazyDb()
+    try:
+        yield db
+    finally:
+        db.release()
+
+
+def _call_with_lazy_db(handler, *args, **kwargs):
+    """Вызов обработчика (или его тела) с db: LazyDb в обход FastAPI (async-варианты отдают ему редкие ветки)."""
+    db = LazyDb()
+    try:
+        return handler(*args, db=db, **kwargs)
+    finally:
+        db.release()
+
 # Модели данных
 class UserLogin(BaseModel):
     phone: str
@@ -479,6 +1036,8 @@ def _step_row_to_dict(s):
 
 def _insert_step_event_safe(cur, step_id: int, dream_id: int, editor_id: int, event_type: str, message: Optional[str] = None) -> bool:
     """Запись в дневник; при отсутствии таблицы не ломает транзакцию. False = дубликат за сегодня."""
+    if not schema_registry.has_table("dreams_steps_events"):
+        return False
     if message and message.strip():
         if _diary_event_duplicate_exists(cur, editor_id, message.strip(), step_id, [], []):
             return False
@@ -510,29 +1069,20 @@ def _insert_journal_event_safe(
     ls = [int(x) for x in (linked_step_ids or []) if x and int(x) > 0]
     if _diary_event_duplicate_exists(cur, editor_id, message, step_id, ld, ls):
         return False
-    cur.execute("SAVEPOINT sp_journal_evt")
-    try:
-        cur.execute(
-            """INSERT INTO dreams_steps_events
-               (step_id, dream_id, user_id, event_type, message, linked_dream_ids, linked_step_ids)
-               VALUES (%s, %s, %s, 'journal', %s, %s, %s)""",
-            (step_id, dream_id, editor_id, message, Json(ld), Json(ls)),
-        )
-        cur.execute("RELEASE SAVEPOINT sp_journal_evt")
-        return True
-    except psycopg2.ProgrammingError:
-        cur.execute("ROLLBACK TO SAVEPOINT sp_journal_evt")
-        if _diary_event_duplicate_exists(cur, editor_id, message, step_id, [], []):
-            return False
+    if not schema_registry.has("dreams_steps_events", "linked_dream_ids", "linked_step_ids"):
         cur.execute(
             """INSERT INTO dreams_steps_events (step_id, dream_id, user_id, event_type, message)
                VALUES (%s, %s, %s, 'journal', %s)""",
             (step_id, dream_id, editor_id, message),
         )
         return True
-    except Exception:
-        cur.execute("ROLLBACK TO SAVEPOINT sp_journal_evt")
-        raise
+    cur.execute(
+        """INSERT INTO dreams_steps_events
+           (step_id, dream_id, user_id, event_type, message, linked_dream_ids, linked_step_ids)
+           VALUES (%s, %s, %s, 'journal', %s, %s, %s)""",
+        (step_id, dream_id, editor_id, message, Json(ld), Json(ls)),
+    )
+    return True
 
 
 def _diary_event_duplicate_exists(
@@ -546,22 +1096,7 @@ def _diary_event_duplicate_exists(
     """Одинаковый текст + те же привязки + тот же step_id в один календарный день (UTC)."""
     ld = [int(x) for x in (linked_dream_ids or []) if x and int(x) > 0]
     ls = [int(x) for x in (linked_step_ids or []) if x and int(x) > 0]
-    try:
-        cur.execute(
-            """SELECT 1 FROM dreams_steps_events
-               WHERE user_id = %s AND message = %s AND step_id = %s
-                 AND (created_at AT TIME ZONE 'UTC')::date = (NOW() AT TIME ZONE 'UTC')::date
-                 AND COALESCE(linked_dream_ids, '[]'::jsonb) = %s::jsonb
-                 AND COALESCE(linked_step_ids, '[]'::jsonb) = %s::jsonb
-               LIMIT 1""",
-            (user_id, message, step_id, Json(ld), Json(ls)),
-        )
-        return cur.fetchone() is not None
-    except psycopg2.ProgrammingError:
-        try:
-            cur.connection.rollback()
-        except Exception:
-            pass
+    if not schema_registry.has("dreams_steps_events", "linked_dream_ids", "linked_step_ids"):
         cur.execute(
             """SELECT 1 FROM dreams_steps_events
                WHERE user_id = %s AND message = %s AND step_id = %s
@@ -570,6 +1105,16 @@ def _diary_event_duplicate_exists(
             (user_id, message, step_id),
         )
         return cur.fetchone() is not None
+    cur.execute(
+        """SELECT 1 FROM dreams_steps_events
+           WHERE user_id = %s AND message = %s AND step_id = %s
+             AND (created_at AT TIME ZONE 'UTC')::date = (NOW() AT TIME ZONE 'UTC')::date
+             AND COALESCE(linked_dream_ids, '[]'::jsonb) = %s::jsonb
+             AND COALESCE(linked_step_ids, '[]'::jsonb) = %s::jsonb
+           LIMIT 1""",
+        (user_id, message, step_id, Json(ld), Json(ls)),
+    )
+    return cur.fetchone() is not None
 
 
 def _normalize_id_list(raw: Optional[List[int]]) -> List[int]:
@@ -609,7 +1154,14 @@ def _validate_diary_links_for_user(cur, user_id: int, dream_ids: List[int], step
             raise HTTPException(status_code=400, detail="Некорректный шаг в привязке")
 
 
-def _enrich_event_link_titles(cur, events: List[dict]) -> List[dict]:
+_LINK_DREAM_TITLES_SQL = (
+    "SELECT id, COALESCE(NULLIF(TRIM(dream), ''), NULLIF(TRIM(title), ''), '') AS t FROM dreams WHERE id = ANY(%s)"
+)
+_LINK_STEP_TITLES_SQL = "SELECT id, COALESCE(NULLIF(TRIM(title), ''), '') AS t FROM dreams_steps WHERE id = ANY(%s)"
+
+
+def _event_link_ids(events: List[dict]) -> Tuple[list, list]:
+    """Уникальные linked_dream_ids / linked_step_ids событий (для _LINK_*_TITLES_SQL)."""
     dream_ids: set = set()
     step_ids: set = set()
     for ev in events:
@@ -617,22 +1169,12 @@ def _enrich_event_link_titles(cur, events: List[dict]) -> List[dict]:
             dream_ids.add(int(did))
         for sid in ev.get("linked_step_ids") or []:
             step_ids.add(int(sid))
-    dream_titles: dict = {}
-    step_titles: dict = {}
-    if dream_ids:
-        cur.execute(
-            "SELECT id, COALESCE(NULLIF(TRIM(dream), ''), NULLIF(TRIM(title), ''), '') AS t FROM dreams WHERE id = ANY(%s)",
-            (list(dream_ids),),
-        )
-        for r in cur.fetchall():
-            dream_titles[int(r["id"])] = (r.get("t") or "").strip() or ("Мечта #" + str(r["id"]))
-    if step_ids:
-        cur.execute(
-            "SELECT id, COALESCE(NULLIF(TRIM(title), ''), '') AS t FROM dreams_steps WHERE id = ANY(%s)",
-            (list(step_ids),),
-        )
-        for r in cur.fetchall():
-            step_titles[int(r["id"])] = (r.get("t") or "").strip() or ("Шаг #" + str(r["id"]))
+    return list(dream_ids), list(step_ids)
+
+
+def _apply_event_link_titles(events: List[dict], dream_rows, step_rows) -> List[dict]:
+    dream_titles = {int(r["id"]): (r.get("t") or "").strip() or ("Мечта #" + str(r["id"])) for r in dream_rows}
+    step_titles = {int(r["id"]): (r.get("t") or "").strip() or ("Шаг #" + str(r["id"])) for r in step_rows}
     for ev in events:
         ev["linked_dream_titles"] = [
             dream_titles.get(int(d), "Мечта #" + str(d)) for d in (ev.get("linked_dream_ids") or [])
@@ -643,8 +1185,24 @@ def _enrich_event_link_titles(cur, events: List[dict]) -> List[dict]:
     return events
 
 
+def _load_event_link_titles(cur, events: List[dict]) -> Tuple[list, list]:
+    """Строки названий для _apply_event_link_titles (сама подстановка — уже без соединения)."""
+    dream_ids, step_ids = _event_link_ids(events)
+    dream_rows: list = []
+    step_rows: list = []
+    if dream_ids:
+        cur.execute(_LINK_DREAM_TITLES_SQL, (dream_ids,))
+        dream_rows = cur.fetchall()
+    if step_ids:
+        cur.execute(_LINK_STEP_TITLES_SQL, (step_ids,))
+        step_rows = cur.fetchall()
+    return dream_rows, step_rows
+
+
 def _purge_success_step_events() -> None:
     """Удаляет из dreams_steps_events «удачные» события (completed / series_completed)."""
+    if not schema_registry.has_table("dreams_steps_events"):
+        return
     conn = None
     try:
         conn = get_db_connection()
@@ -663,140 +1221,121 @@ def _purge_success_step_events() -> None:
         _return_conn(conn)
 
 
-def _load_steps(cur, dream_ids):
+# Колонки dreams_steps, которых может не быть в старой схеме; в SELECT подставляются значения по умолчанию.
+_STEP_OPTIONAL_COLS = (
+    "sort_order", "deadline", "start_time", "end_time", "series_id", "series_index", "series_total",
+    ("deleted", "false"), "plan_amount", "fact_amount", ("waived", "false"),
+)
+
+
+def _step_select_sql(extra: str = "", fields: "fieldsets.Selection" = None) -> str:
+    """SELECT ... FROM dreams_steps (без WHERE) с полным набором полей для _step_row_to_dict под текущую схему.
+    extra — дополнительные элементы списка SELECT (с запятой в конце); fields — только эти необязательные колонки
+    (fields= запроса; sort_order нужен дельте и остаётся)."""
+    cols = [
+        c for c in _STEP_OPTIONAL_COLS
+        if fields is None or (c[0] if isinstance(c, tuple) else c) in fields or c == "sort_order"
+    ]
+    return (
+        "SELECT " + extra + "dream_id, id, title, completed"
+        + (", " + schema_registry.cols("dreams_steps", cols) if cols else "")
+        + " FROM dreams_steps"
+    )
+
+
+def _steps_by_dream_sql(where: str = "dream_id = ANY(%s)", fields: "fieldsets.Selection" = None) -> str:
+    """Шаги по dream_id = ANY(%s) (или по условию where) в порядке показа (для _load_steps и async-варианта)."""
+    order = "sort_order, id" if schema_registry.has("dreams_steps", "sort_order") else "id"
+    return _step_select_sql(fields=fields) + " WHERE " + where + " ORDER BY dream_id, " + order
+
+
+def _group_steps(rows) -> dict:
+    out = {}
+    for s in rows:
+        out.setdefault(s["dream_id"], []).append(_step_row_to_dict(s))
+    return out
+
+
+def _load_steps(cur, dream_ids, fields: "fieldsets.Selection" = None):
     """Загружает шаги по списку dream_id. Возвращает dict dream_id -> list of step dict.
 
-    Раньше при ProgrammingError на «широком» SELECT (нет plan_amount/fact_amount или др.)
-    срабатывал fallback без deadline — в ЛК все шаги без дат. Теперь перебираем запросы
-    с меньшим набором колонок, пока один не выполнится.
+    Набор колонок берётся из schema_registry: отсутствующие в старой схеме колонки
+    (plan_amount/fact_amount, waived, series_*, время, deadline) подставляются как NULL/false —
+    один запрос без перебора fallback-ов. fields — только колонки выбранных полей шага.
     """
-    out = {}
     if not dream_ids:
-        return out
-    queries = [
-        "SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time, series_id, series_index, series_total, deleted, plan_amount, fact_amount, waived FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-        "SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time, series_id, series_index, series_total, deleted, plan_amount, fact_amount FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-        "SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time, series_id, series_index, series_total, deleted FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-        "SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time, deleted FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-        "SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-        "SELECT dream_id, id, title, completed, sort_order, deadline FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-    ]
-    for sql in queries:
-        try:
-            cur.execute(sql, (dream_ids,))
-            for s in cur.fetchall():
-                did = s["dream_id"]
-                if did not in out:
-                    out[did] = []
-                out[did].append(_step_row_to_dict(s))
-            return out
-        except psycopg2.ProgrammingError:
-            try:
-                cur.connection.rollback()
-            except Exception:
-                pass
-            continue
-    # Схема без deadline (крайне старая): только названия
-    try:
-        cur.execute(
-            "SELECT dream_id, id, title, completed, sort_order FROM dreams_steps WHERE dream_id = ANY(%s) ORDER BY dream_id, sort_order, id",
-            (dream_ids,),
-        )
-        for s in cur.fetchall():
-            did = s["dream_id"]
-            if did not in out:
-                out[did] = []
-            out[did].append({
-                "id": s["id"], "title": s["title"], "completed": bool(s["completed"]),
-                "deadline": None, "start_time": None, "end_time": None, "series_id": None, "series_index": None, "series_total": None, "deleted": False,
-                "plan_amount": None, "fact_amount": None, "waived": False,
-            })
-    except psycopg2.ProgrammingError:
-        try:
-            cur.connection.rollback()
-        except Exception:
-            pass
-    return out
+        return {}
+    cur.execute(_steps_by_dream_sql(fields=fields), (dream_ids,))
+    return _group_steps(cur.fetchall())
 
-def _load_books(cur, dream_ids):
-    """Загружает книги по списку dream_id (для мечт с rule_code=books_reading). Возвращает dict dream_id -> list of book dicts."""
+
+def _books_by_dream_sql(where: str = "dream_id = ANY(%s)") -> Optional[str]:
+    """Книги по dream_id = ANY(%s) (или по условию where); None — таблицы dream_books нет."""
+    if not schema_registry.has_table("dream_books"):
+        return None
+    return (
+        "SELECT id, dream_id, title, author, status, started_at, deadline, finished_at, "
+        + schema_registry.col("dream_books", "linked_step_id")
+        + " FROM dream_books WHERE " + where + " ORDER BY dream_id, COALESCE(started_at, deadline, '9999-12-31'), id"
+    )
+
+
+def _group_books(rows) -> dict:
     out = {}
-    if not dream_ids:
-        return out
-    queries = [
-        """SELECT id, dream_id, title, author, status, started_at, deadline, finished_at, linked_step_id
-           FROM dream_books WHERE dream_id = ANY(%s) ORDER BY dream_id, COALESCE(started_at, deadline, '9999-12-31'), id""",
-        """SELECT id, dream_id, title, author, status, started_at, deadline, finished_at
-           FROM dream_books WHERE dream_id = ANY(%s) ORDER BY dream_id, COALESCE(started_at, deadline, '9999-12-31'), id""",
-    ]
-    for sql in queries:
-        try:
-            cur.execute(sql, (dream_ids,))
-            for r in cur.fetchall():
-                did = r["dream_id"]
-                if did not in out:
-                    out[did] = []
-                out[did].append({
-                    "id": r["id"],
-                    "title": r["title"] or "",
-                    "author": r["author"],
-                    "status": r["status"] or "planned",
-                    "started_at": str(r["started_at"]) if r.get("started_at") else None,
-                    "deadline": str(r["deadline"]) if r.get("deadline") else None,
-                    "finished_at": str(r["finished_at"]) if r.get("finished_at") else None,
-                    "linked_step_id": r.get("linked_step_id"),
-                })
-            return out
-        except psycopg2.ProgrammingError:
-            try:
-                cur.connection.rollback()
-            except Exception:
-                pass
-            continue
+    for r in rows:
+        out.setdefault(r["dream_id"], []).append({
+            "id": r["id"],
+            "title": r["title"] or "",
+            "author": r["author"],
+            "status": r["status"] or "planned",
+            "started_at": str(r["started_at"]) if r.get("started_at") else None,
+            "deadline": str(r["deadline"]) if r.get("deadline") else None,
+            "finished_at": str(r["finished_at"]) if r.get("finished_at") else None,
+            "linked_step_id": r.get("linked_step_id"),
+        })
     return out
 
-def _schedule_items_standard(cur, user_id: int, date_from: str, date_to: str):
-    """Пункты расписания из обычных шагов (dreams_steps): дедлайн в диапазоне [date_from, date_to]."""
-    items = []
-    sql_with_waived = (
-        """SELECT d.id AS dream_id, s.id AS source_id, s.title, s.deadline AS date, s.completed
-               FROM dreams d
-               JOIN dreams_steps s ON s.dream_id = d.id
-               WHERE d.user_id = %s AND s.deadline IS NOT NULL
-                 AND s.deadline >= %s AND s.deadline <= %s
-                 AND COALESCE(s.deleted, false) = false
-                 AND COALESCE(s.waived, false) = false
-               ORDER BY s.deadline, s.id"""
-    )
-    sql_no_waived = (
+
+def _load_books(cur, dream_ids):
+    """Загружает книги по списку dream_id (для мечт с rule_code=books_reading). Возвращает dict dream_id -> list of book dicts."""
+    sql = _books_by_dream_sql()
+    if not dream_ids or sql is None:
+        return {}
+    cur.execute(sql, (dream_ids,))
+    return _group_books(cur.fetchall())
+
+def _schedule_standard_sql() -> str:
+    """Шаги с дедлайном в [date_from, date_to]; параметры (user_id, date_from, date_to)."""
+    extra = ""
+    if schema_registry.has("dreams_steps", "deleted"):
+        extra += " AND COALESCE(s.deleted, false) = false"
+    if schema_registry.has("dreams_steps", "waived"):
+        extra += " AND COALESCE(s.waived, false) = false"
+    return (
         """SELECT d.id AS dream_id, s.id AS source_id, s.title, s.deadline AS date, s.completed
                FROM dreams d
                JOIN dreams_steps s ON s.dream_id = d.id
                WHERE d.user_id = %s AND s.deadline IS NOT NULL
-                 AND s.deadline >= %s AND s.deadline <= %s
-                 AND COALESCE(s.deleted, false) = false
+                 AND s.deadline >= %s::date AND s.deadline <= %s::date""" + extra + """
                ORDER BY s.deadline, s.id"""
     )
-    params = (user_id, date_from, date_to)
-    for sql in (sql_with_waived, sql_no_waived):
-        try:
-            cur.execute(sql, params)
-            for r in cur.fetchall():
-                items.append({
-                    "dream_id": r["dream_id"],
-                    "source_type": "step",
-                    "source_id": r["source_id"],
-                    "title": r["title"] or "",
-                    "date": str(r["date"]),
-                    "completed": bool(r["completed"]),
-                })
-            break
-        except psycopg2.ProgrammingError:
-            try:
-                cur.connection.rollback()
-            except Exception:
-                pass
-    return items
+
+
+def _schedule_step_item(r) -> dict:
+    return {
+        "dream_id": r["dream_id"],
+        "source_type": "step",
+        "source_id": r["source_id"],
+        "title": r["title"] or "",
+        "date": str(r["date"]),
+        "completed": bool(r["completed"]),
+    }
+
+
+def _schedule_items_standard(cur, user_id: int, date_from: str, date_to: str):
+    """Пункты расписания из обычных шагов (dreams_steps): дедлайн в диапазоне [date_from, date_to]."""
+    cur.execute(_schedule_standard_sql(), (user_id, date_from, date_to))
+    return [_schedule_step_item(r) for r in cur.fetchall()]
 
 def _schedule_items_books(cur, user_id: int, date_from: str, date_to: str):
     """Виртуальные пункты расписания из активных книг (reading/listening): по одной строке на день в [started_at, deadline]."""
@@ -865,17 +1404,197 @@ def _schedule_items_books(cur, user_id: int, date_from: str, date_to: str):
             d += timedelta(days=1)
     return items
 
+# Bootstrap схемы: идемпотентные DDL-шаги (раньше выполнялись в обработчиках на каждый запрос)
+# выполняются один раз на процесс при старте (или при первом соединении, если старт был без БД).
+# Применённые шаги записываются в schema_bootstrap — при следующих стартах DDL не выполняется вовсе.
+_SCHEMA_BOOTSTRAP_LOCK_KEY = 7_301_002  # pg_advisory_lock: несколько процессов не гоняют DDL одновременно
+_SCHEMA_BOOTSTRAP_RETRY_SEC = 60
+_schema_bootstrap_lock = Lock()
+_schema_bootstrap_done = False
+_schema_bootstrap_failed_at = 0.0
+
+
+def _schema_bootstrap_steps():
+    """(version, name, fn(cur)) — версии только добавляются, порядок не меняется."""
+    return (
+        (1, "user_buddy_links", _ensure_user_buddy_links_table),
+        (2, "buddy_requests", _ensure_buddy_requests_table),
+        (3, "user_dream_completion_request", _ensure_completion_request_table),
+        (4, "buddy_alerts", ensure_buddy_alerts_schema),
+    )
+
+
+def _applied_bootstrap_versions(cur) -> set:
+    if not schema_registry.has_table("schema_bootstrap"):
+        return set()
+    cur.execute("SELECT version FROM schema_bootstrap")
+    return {r["version"] for r in cur.fetchall()}
+
+
+def _run_schema_bootstrap(conn) -> None:
+    """Выполнить недостающие шаги bootstrap (один раз на процесс). Ошибка логируется, повтор — не чаще раза в минуту."""
+    global _schema_bootstrap_done, _schema_bootstrap_failed_at
+    if _schema_bootstrap_done:
+        return
+    if time.time() - _schema_bootstrap_failed_at < _SCHEMA_BOOTSTRAP_RETRY_SEC:
+        return
+    with _schema_bootstrap_lock:
+        if _schema_bootstrap_done:
+            return
+        locked = False
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                steps = _schema_bootstrap_steps()
+                applied = _applied_bootstrap_versions(cur)
+                if any(v not in applied for v, _, _ in steps):
+                    cur.execute("SELECT pg_advisory_lock(%s)", (_SCHEMA_BOOTSTRAP_LOCK_KEY,))
+                    locked = True
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_bootstrap (
+                            version INT PRIMARY KEY,
+                            name VARCHAR(100) NOT NULL,
+                            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                        )
+                    """)
+                    conn.commit()
+                    schema_registry.load(conn)
+                    applied = _applied_bootstrap_versions(cur)
+                    for version, name, fn in steps:
+                        if version in applied:
+                            continue
+                        fn(cur)
+                        cur.execute(
+                            "INSERT INTO schema_bootstrap (version, name) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING",
+                            (version, name),
+                        )
+                        conn.commit()
+                        app_logger.info("schema bootstrap: applied %s %s", version, name)
+                    schema_registry.load(conn)
+                conn.commit()
+            mark_buddy_alerts_schema_ready()
+            _schema_bootstrap_done = True
+        except Exception:
+            _schema_bootstrap_failed_at = time.time()
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            app_logger.exception("schema bootstrap failed")
+        finally:
+            if locked:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (_SCHEMA_BOOTSTRAP_LOCK_KEY,))
+                    conn.commit()
+                except Exception:
+                    pass
+
+
 def get_db_connection():
-    """Берёт соединение из пула. Валидирует его (SELECT 1); при SSL/connection closed — отбрасывает и повторяет до 3 раз."""
-    if db_pool is None:
-        return _connect_with_retry()
-    for attempt in range(3):
-        conn = db_pool.getconn()
+    """Соединение из пула (_checkout_db_connection) с учётом времени ожидания и ошибок в /metrics."""
+    started = time.perf_counter()
+    try:
+        conn = _checkout_replica_connection() if _replica_read_allowed() else None
+        if conn is None:
+            conn = _checkout_db_connection()
         try:
+            set_local_timeouts(conn, _db_timeouts_for_request())
+        except Exception:
+            _return_conn(conn, discard=True)
+            raise
+        # Время удержания (до _return_conn) — в island_http_request_db_conn_hold_seconds и Server-Timing db-conn
+        conn.checked_out_at = time.perf_counter()
+        return conn
+    except psycopg2.pool.PoolError:
+        _metric_checkout_errors.inc(reason="exhausted")
+        raise
+    except OperationalError:
+        _metric_checkout_errors.inc(reason="connection")
+        raise
+    except Exception:
+        _metric_checkout_errors.inc(reason="other")
+        raise
+    finally:
+        _metric_checkout_wait.observe(time.perf_counter() - started)
+
+
+def _replica_read_allowed() -> bool:
+    """Текущий запрос — GET из _REPLICA_READ_ROUTES без недавней записи этого пользователя (см. middleware)."""
+    if db_replica_pool is None or not _schema_bootstrap_done:
+        return False
+    request = _replica_read_request.get()
+    if request is None:
+        return False
+    if _route_label(request) not in _REPLICA_READ_ROUTES:
+        return False
+    if getattr(request.state, "replica_sticky", False):
+        _metric_read_routing.inc(target="primary_sticky")
+        return False
+    return True
+
+
+def _replica_failed() -> None:
+    """Реплика не ответила: DB_REPLICA_RETRY_SEC секунд читаем из основной БД, не пытаясь подключиться (connect_timeout 15 с)."""
+    global _replica_down_until
+    _replica_down_until = time.time() + DB_REPLICA_RETRY_SEC
+    _metric_read_routing.inc(target="primary_fallback")
+
+
+def _checkout_replica_connection():
+    """Соединение с реплики; None — реплика недоступна/пул исчерпан, читаем из основной БД."""
+    if time.time() < _replica_down_until:
+        _metric_read_routing.inc(target="primary_fallback")
+        return None
+    try:
+        conn, validate = db_replica_pool.checkout()
+    except psycopg2.pool.PoolError:
+        _metric_read_routing.inc(target="primary_fallback")
+        return None
+    except OperationalError:
+        _replica_failed()
+        return None
+    try:
+        if validate:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
+        schema_registry.ensure(conn)
+        _metric_read_routing.inc(target="replica")
+        return conn
+    except OperationalError:
+        _metric_discarded.inc(where="checkout")
+        db_replica_pool.mark_suspect()
+        try:
+            db_replica_pool.putconn(conn, close=True)
+        except Exception:
+            pass
+        _replica_failed()
+        return None
+    except Exception:
+        _return_conn(conn)
+        raise
+
+
+def _checkout_db_connection():
+    """Берёт соединение из пула. SELECT 1 — только если соединение простаивало дольше DB_POOL_IDLE_CHECK_SEC
+    (свежие проверяет фоновый reaper пула, db_pool.py); при SSL/connection closed — отбрасывает и повторяет до 3 раз."""
+    if db_pool is None:
+        conn = _connect_with_retry()
+        schema_registry.ensure(conn)
+        _run_schema_bootstrap(conn)
+        return conn
+    for attempt in range(3):
+        conn, validate = db_pool.checkout()
+        try:
+            if validate:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            schema_registry.ensure(conn)
+            _run_schema_bootstrap(conn)
+            _metric_checkouts.inc(validated="true" if validate else "false")
             return conn
         except OperationalError as e:
+            _metric_discarded.inc(where="checkout")
+            db_pool.mark_suspect()
             try:
                 db_pool.putconn(conn, close=True)
             except Exception:
@@ -884,6 +1603,9 @@ def get_db_connection():
                 time.sleep(0.5 * (attempt + 1))
                 continue
             raise
+        except Exception:
+            _return_conn(conn)
+            raise
     return None
 
 
@@ -932,6 +1654,14 @@ def _parse_iso_date_or_400(value: str, field_name: str = "report_date") -> str:
     return iso
 
 
+def _fields_or_400(resource: "fieldsets.Resource", spec: Optional[str], param: str = "fields") -> "fieldsets.Selection":
+    """Выбор полей fields= (fieldsets.py); неизвестное поле — 400."""
+    try:
+        return resource.parse(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный {param}: {e}")
+
+
 def _parse_marathon_month_or_400(value: str) -> str:
     month = (value or "").strip()
     if not re.match(r"^\d{4}-\d{2}$", month):
@@ -1007,19 +1737,12 @@ def login_user(user_login: UserLogin):
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             phone_alt = ("+7" + user_login.phone[1:]) if user_login.phone.startswith("8") and len(user_login.phone) >= 11 else user_login.phone
-            try:
-                cur.execute("""
-                    SELECT id, name, surname, city, phone, password_hash, avatar_path, buddy_id, buddy_trust, telegram, vk, gender
-                    FROM users
-                    WHERE phone = %s OR phone = %s
-                """, (user_login.phone, phone_alt))
-            except psycopg2.ProgrammingError:
-                conn.rollback()
-                cur.execute("""
-                    SELECT id, name, surname, city, phone, password_hash, avatar_path, buddy_id, buddy_trust, telegram, vk
-                    FROM users
-                    WHERE phone = %s OR phone = %s
-                """, (user_login.phone, phone_alt))
+            cur.execute(
+                "SELECT id, name, surname, city, phone, password_hash, avatar_path, buddy_id, buddy_trust, telegram, vk, "
+                + schema_registry.col("users", "gender")
+                + " FROM users WHERE phone = %s OR phone = %s",
+                (user_login.phone, phone_alt),
+            )
             user_data = cur.fetchone()
 
             if user_data is None:
@@ -1149,6 +1872,7 @@ def upload_avatar(
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("UPDATE users SET avatar_path = %s WHERE id = %s", (avatar_path, user_id))
+            _bump_user_data_version(cur, user_ids=[user_id], viewers=True)
         conn.commit()
     except Exception as e:
         conn.rollback()
@@ -1158,65 +1882,68 @@ def upload_avatar(
     return {"ok": True, "avatar_path": avatar_path}
 
 
+_BUDDY_CARD_SQL = "SELECT name, surname, avatar_path FROM users WHERE id = %s"
+
+
+def _users_me_sql() -> str:
+    return (
+        "SELECT id, name, surname, city, phone, avatar_path, buddy_id, buddy_trust, telegram, vk, "
+        + schema_registry.col("users", "gender")
+        + " FROM users WHERE id = %s"
+    )
+
+
+def _users_me_payload(user_data, buddy_row) -> dict:
+    """Ответ GET /users/me из строки users и (опционально) строки бадди (_BUDDY_CARD_SQL)."""
+    full_name = f"{user_data.get('name') or ''} {user_data.get('surname') or ''}".strip() or "Пользователь"
+    buddy_name = None
+    buddy_avatar_path = None
+    if buddy_row:
+        buddy_name = f"{buddy_row.get('name') or ''} {buddy_row.get('surname') or ''}".strip() or None
+        buddy_avatar_path = buddy_row.get("avatar_path")
+    out = {
+        "id": user_data["id"],
+        "name": (user_data.get("name") or "").strip(),
+        "surname": (user_data.get("surname") or "").strip(),
+        "full_name": full_name,
+        "city": user_data.get("city"),
+        "phone": user_data.get("phone"),
+        "avatar_path": user_data.get("avatar_path"),
+        "buddy_id": user_data.get("buddy_id"),
+        "buddy_trust": bool(user_data.get("buddy_trust")),
+        "buddy_name": buddy_name,
+        "buddy_avatar_path": buddy_avatar_path,
+    }
+    if user_data.get("gender") is not None:
+        out["gender"] = user_data.get("gender")
+    if "telegram" in user_data:
+        out["telegram"] = user_data.get("telegram") or ""
+    if "vk" in user_data:
+        out["vk"] = user_data.get("vk") or ""
+    return out
+
+
 @app.get("/users/me")
-def users_me(user_id: int):
+def users_me(user_id: int, db: LazyDb = Depends(lazy_db)):
     """Актуальные данные текущего пользователя: id, full_name, avatar_path, buddy_id, buddy_name, buddy_avatar_path, telegram, vk. Для сессии и для формы редактирования профиля."""
-    conn = None
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            try:
-                cur.execute(
-                    """SELECT id, name, surname, city, phone, avatar_path, buddy_id, buddy_trust, telegram, vk, gender
-                       FROM users WHERE id = %s""",
-                    (user_id,),
-                )
-            except psycopg2.ProgrammingError:
-                conn.rollback()
-                cur.execute(
-                    """SELECT id, name, surname, city, phone, avatar_path, buddy_id, buddy_trust, telegram, vk
-                       FROM users WHERE id = %s""",
-                    (user_id,),
-                )
+        with db.cursor() as cur:
+            cur.execute(_users_me_sql(), (user_id,))
             user_data = cur.fetchone()
             if user_data is None:
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
-            full_name = f"{user_data.get('name') or ''} {user_data.get('surname') or ''}".strip() or "Пользователь"
-            buddy_id = user_data.get("buddy_id")
-            buddy_name = None
-            buddy_avatar_path = None
-            if buddy_id:
-                cur.execute("SELECT name, surname, avatar_path FROM users WHERE id = %s", (buddy_id,))
+            buddy_row = None
+            if user_data.get("buddy_id"):
+                cur.execute(_BUDDY_CARD_SQL, (user_data["buddy_id"],))
                 buddy_row = cur.fetchone()
-                if buddy_row:
-                    buddy_name = f"{buddy_row.get('name') or ''} {buddy_row.get('surname') or ''}".strip() or None
-                    buddy_avatar_path = buddy_row.get("avatar_path")
-            out = {
-                "id": user_data["id"],
-                "name": (user_data.get("name") or "").strip(),
-                "surname": (user_data.get("surname") or "").strip(),
-                "full_name": full_name,
-                "city": user_data.get("city"),
-                "phone": user_data.get("phone"),
-                "avatar_path": user_data.get("avatar_path"),
-                "buddy_id": buddy_id,
-                "buddy_trust": bool(user_data.get("buddy_trust")),
-                "buddy_name": buddy_name,
-                "buddy_avatar_path": buddy_avatar_path,
-            }
-            if user_data.get("gender") is not None:
-                out["gender"] = user_data.get("gender")
-            if "telegram" in user_data:
-                out["telegram"] = user_data.get("telegram") or ""
-            if "vk" in user_data:
-                out["vk"] = user_data.get("vk") or ""
-            return out
+        db.release()
+        return _users_me_payload(user_data, buddy_row)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        _return_conn(conn)
+        db.release()
 
 
 class ProfileUpdateBody(BaseModel):
@@ -1274,7 +2001,11 @@ def update_profile(body: ProfileUpdateBody):
                 "UPDATE users SET " + ", ".join(updates) + " WHERE id = %s",
                 params,
             )
+            if body.telegram is not None or body.vk is not None or body.phone is not None:
+                # Контакты автора — в карточках анонимной витрины
+                _bump_showcase_version(cur, user_id=body.user_id)
         conn.commit()
+        showcase_cache.expire_version()
         return {"ok": True}
     except HTTPException:
         raise
@@ -1346,7 +2077,6 @@ def _ensure_user_buddy_links_table(cur):
 
 
 def _upsert_buddy_link(cur, viewer_id: int, subject_id: int, can_read: bool = True, can_write: bool = False, status: str = "active"):
-    _ensure_user_buddy_links_table(cur)
     cur.execute("""
         INSERT INTO user_buddy_links (viewer_id, subject_id, can_read, can_write, status)
         VALUES (%s, %s, %s, %s, %s)
@@ -1356,27 +2086,30 @@ def _upsert_buddy_link(cur, viewer_id: int, subject_id: int, can_read: bool = Tr
             status = EXCLUDED.status,
             revoked_at = NULL
     """, (viewer_id, subject_id, can_read, can_write, status))
+    _bump_user_data_version(cur, user_ids=[viewer_id, subject_id])
+
+
+# Право чтения ЛК: активная связь с can_read или legacy users.buddy_id. Параметры: (viewer, subject, viewer, subject).
+_CAN_VIEW_LK_SQL = """
+    SELECT EXISTS (
+               SELECT 1 FROM user_buddy_links
+               WHERE viewer_id = %s AND subject_id = %s AND status = 'active' AND can_read = true
+           )
+           OR EXISTS (SELECT 1 FROM users WHERE id = %s AND buddy_id = %s) AS ok
+"""
 
 
 def _can_view_lk(cur, viewer_id: int, subject_id: int) -> bool:
     if viewer_id == subject_id:
         return True
-    _ensure_user_buddy_links_table(cur)
-    cur.execute("""
-        SELECT 1 FROM user_buddy_links
-        WHERE viewer_id = %s AND subject_id = %s AND status = 'active' AND can_read = true
-    """, (viewer_id, subject_id))
-    if cur.fetchone():
-        return True
-    cur.execute("SELECT buddy_id FROM users WHERE id = %s", (viewer_id,))
+    cur.execute(_CAN_VIEW_LK_SQL, (viewer_id, subject_id, viewer_id, subject_id))
     row = cur.fetchone()
-    return bool(row and row.get("buddy_id") == subject_id)
+    return bool(row and row.get("ok"))
 
 
 def _can_edit_lk(cur, editor_id: int, owner_id: int) -> bool:
     if editor_id == owner_id:
         return True
-    _ensure_user_buddy_links_table(cur)
     cur.execute("""
         SELECT 1 FROM user_buddy_links
         WHERE viewer_id = %s AND subject_id = %s AND status = 'active' AND can_write = true
@@ -1388,6 +2121,105 @@ def _can_edit_lk(cur, editor_id: int, owner_id: int) -> bool:
     return bool(row and row.get("buddy_id") == owner_id and row.get("buddy_trust"))
 
 
+# Версия данных кабинета (user_data_version, _sql/mig_user_data_version.sql): счётчик на пользователя, который
+# _bump_user_data_version() повышает в транзакции каждой записи, меняющей его мечты, шаги, книги, дневник,
+# «сбылось» или связи бадди. GET /dreams, /schedule, /steps/events и /users/me/viewable первым запросом читают
+# версии (владельца и зрителя) и отдают слабый ETag; If-None-Match с ним — 304 без остальных запросов.
+# В ETag входят и путь с query, дата сервера («сегодня» в ответах), код приложения и окно
+# USER_ETAG_MAX_AGE_SEC — записи мимо main.py (скрипты, ручной SQL) видны не позже конца окна.
+USER_ETAG_MAX_AGE_SEC = float(os.getenv("USER_ETAG_MAX_AGE_SEC") or 300)
+_USER_VERSION_TABLE = "user_data_version"
+_USER_VERSION_SQL = "SELECT user_id, version FROM " + _USER_VERSION_TABLE + " WHERE user_id = ANY(%s)"
+_USER_ETAG_SALT = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:12]
+
+
+def _user_version_on() -> bool:
+    return schema_registry.has_table(_USER_VERSION_TABLE)
+
+
+def _bump_user_data_version(
+    cur, user_ids: Optional[List[int]] = None, dream_ids: Optional[List[int]] = None, viewers: bool = False,
+) -> None:
+    """+1 к версии данных пользователей user_ids и владельцев мечт dream_ids в транзакции записи.
+    viewers — и тем, кто смотрит их кабинеты (имя / аватар в GET /users/me/viewable)."""
+    if not _user_version_on():
+        return
+    sources = []
+    params: dict = {}
+    if user_ids:
+        sources.append("SELECT id FROM users WHERE id = ANY(%(uids)s)")
+        params["uids"] = [int(u) for u in user_ids if u is not None]
+    if dream_ids:
+        sources.append("SELECT user_id FROM dreams WHERE id = ANY(%(dids)s)")
+        params["dids"] = [int(d) for d in dream_ids if d is not None]
+    if not sources:
+        return
+    owners = " UNION ".join(sources)
+    if viewers:
+        owners = (
+            "WITH o (user_id) AS (" + owners + ") SELECT user_id FROM o"
+            " UNION SELECT id FROM users WHERE buddy_id IN (SELECT user_id FROM o)"
+        )
+        if schema_registry.has_table("user_buddy_links"):
+            owners += " UNION SELECT viewer_id FROM user_buddy_links WHERE subject_id IN (SELECT user_id FROM o)"
+    # Строки блокируются по возрастанию user_id — параллельные записи пар пользователей не встают в deadlock.
+    cur.execute(
+        "INSERT INTO " + _USER_VERSION_TABLE + " AS v (user_id, version, bumped_at)"
+        " SELECT user_id, 1, NOW() FROM (" + owners + ") AS b (user_id) WHERE user_id IS NOT NULL ORDER BY user_id"
+        " ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, bumped_at = NOW()",
+        params,
+    )
+
+
+def _user_etag_ids(user_ids) -> List[int]:
+    return sorted({int(u) for u in user_ids if u is not None})
+
+
+def _user_data_etag(request: Request, rows, user_ids: List[int]) -> str:
+    """Слабый ETag ответа по версиям user_ids (строки _USER_VERSION_SQL; нет строки — 0)."""
+    versions = {r["user_id"]: r["version"] for r in rows}
+    window = int(time.time() // USER_ETAG_MAX_AGE_SEC) if USER_ETAG_MAX_AGE_SEC > 0 else 0
+    raw = "|".join(
+        [_USER_ETAG_SALT, request.url.path, request.url.query, date.today().isoformat(), str(window)]
+        + [f"{uid}:{versions.get(uid, 0)}" for uid in user_ids]
+    )
+    return 'W/"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def _user_etag(cur, request: Request, *user_ids: Optional[int]) -> Optional[str]:
+    """ETag ответа кабинета: первый запрос чтения (версия — до данных). None — нет миграции."""
+    if not _user_version_on():
+        return None
+    ids = _user_etag_ids(user_ids)
+    cur.execute(_USER_VERSION_SQL, (ids,))
+    return _user_data_etag(request, cur.fetchall(), ids)
+
+
+def _user_etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _user_not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """304, если If-None-Match совпал с etag; иначе None (и ответ собирается из БД)."""
+    if etag is None:
+        return None
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        _metric_user_etag.inc(route=request.url.path, result="not_modified")
+        return Response(status_code=304, headers=_user_etag_headers(etag))
+    _metric_user_etag.inc(route=request.url.path, result="full")
+    return None
+
+
+def _with_user_etag(payload, etag: Optional[str]):
+    """Ответ (dict или готовый Response) с ETag; без etag — как есть."""
+    if etag is None:
+        return payload
+    if not isinstance(payload, Response):
+        payload = JSONResponse(content=jsonable_encoder(payload))
+    payload.headers.update(_user_etag_headers(etag))
+    return payload
+
+
 # --- Список пользователей для модалки «Добавить бадди» ---
 @app.get("/users/list")
 def users_list(exclude_user_id: Optional[int] = None, for_user_id: Optional[int] = None):
@@ -1396,9 +2228,6 @@ def users_list(exclude_user_id: Optional[int] = None, for_user_id: Optional[int]
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
-            _ensure_buddy_requests_table(cur)
-            conn.commit()
             sql_base = "SELECT id, name, surname FROM users WHERE 1=1"
             params: list = []
             if exclude_user_id is not None:
@@ -1471,15 +2300,17 @@ def users_list(exclude_user_id: Optional[int] = None, for_user_id: Optional[int]
 
 
 @app.get("/users/me/viewable")
-def get_viewable_subjects(user_id: int):
-    """Кабинеты, которые user_id может просматривать: себя + активные связи viewer→subject."""
+def get_viewable_subjects(request: Request, user_id: int):
+    """Кабинеты, которые user_id может просматривать: себя + активные связи viewer→subject.
+    ETag / 304 — как у GET /dreams (имя и аватар субъекта повышают версию его зрителей)."""
     conn = None
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
-            _ensure_buddy_requests_table(cur)
-            conn.commit()
+            etag = _user_etag(cur, request, user_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
             cur.execute("SELECT id, name, surname, avatar_path FROM users WHERE id = %s", (user_id,))
             self_row = cur.fetchone()
             if not self_row:
@@ -1532,7 +2363,7 @@ def get_viewable_subjects(user_id: int):
                         "can_read": True,
                         "can_write": bool(legacy.get("buddy_trust")),
                     })
-            return {"subjects": subjects}
+            return _with_user_etag({"subjects": subjects}, etag)
     except HTTPException:
         raise
     except Exception as e:
@@ -1548,9 +2379,6 @@ def get_access_grants(user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
-            ensure_buddy_alerts_schema(cur)
-            conn.commit()
             cur.execute("""
                 SELECT ubl.id AS link_id, ubl.viewer_id, ubl.can_read, ubl.can_write, ubl.status,
                        ubl.alert_steps_enabled, ubl.alert_reports_enabled,
@@ -1593,7 +2421,6 @@ def update_buddy_link(body: BuddyLinkUpdateBody, user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
             cur.execute("""
                 SELECT id, status FROM user_buddy_links
                 WHERE viewer_id = %s AND subject_id = %s
@@ -1613,6 +2440,7 @@ def update_buddy_link(body: BuddyLinkUpdateBody, user_id: int):
                     "UPDATE users SET buddy_trust = %s WHERE id = %s",
                     (body.can_write, body.viewer_id),
                 )
+            _bump_user_data_version(cur, user_ids=[body.viewer_id, body.subject_id])
             conn.commit()
             return {
                 "viewer_id": body.viewer_id,
@@ -1639,7 +2467,6 @@ def revoke_buddy_link(user_id: int, other_user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
             cur.execute("""
                 SELECT 1 FROM user_buddy_links
                 WHERE status = 'active'
@@ -1668,6 +2495,7 @@ def revoke_buddy_link(user_id: int, other_user_id: int):
                 "UPDATE users SET buddy_id = NULL, buddy_trust = false WHERE id = %s AND buddy_id = %s",
                 (other_user_id, user_id),
             )
+            _bump_user_data_version(cur, user_ids=[user_id, other_user_id])
             conn.commit()
             return {"ok": True, "other_user_id": other_user_id}
     except HTTPException:
@@ -1688,9 +2516,6 @@ def get_buddy_alert_settings_route(user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
-            ensure_buddy_alerts_schema(cur)
-            conn.commit()
             return get_buddy_alert_settings(cur, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1705,8 +2530,6 @@ def patch_buddy_alert_settings_route(body: BuddyAlertSettingsPatch, user_id: int
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_user_buddy_links_table(cur)
-            ensure_buddy_alerts_schema(cur)
             out = patch_buddy_alert_settings(
                 cur,
                 user_id,
@@ -1741,7 +2564,6 @@ def post_daily_report_sent(body: DailyReportSentBody):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            ensure_buddy_alerts_schema(cur)
             created = mark_daily_report_sent(cur, body.user_id, report_date, method)
             conn.commit()
             return {"ok": True, "created": created, "report_date": report_date.isoformat()}
@@ -1762,8 +2584,6 @@ def get_buddy_alerts_unread_count(user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            ensure_buddy_alerts_schema(cur)
-            conn.commit()
             return {"buddy_alerts_unread": count_unread_buddy_alerts(cur, user_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1778,7 +2598,6 @@ def patch_buddy_alert_read(notification_id: int, user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            ensure_buddy_alerts_schema(cur)
             ok = mark_buddy_notification_read(cur, notification_id, user_id)
             if not ok:
                 raise HTTPException(status_code=404, detail="Уведомление не найдено")
@@ -1820,8 +2639,6 @@ def list_buddy_requests(user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_buddy_requests_table(cur)
-            conn.commit()
             cur.execute("""
                 SELECT br.id, br.from_user_id, br.to_user_id, br.status, br.created_at,
                        u.name AS from_name, u.surname AS from_surname
@@ -1854,9 +2671,6 @@ def create_buddy_request(body: BuddyRequestCreate, user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_buddy_requests_table(cur)
-            _ensure_user_buddy_links_table(cur)
-            conn.commit()
             cur.execute("SELECT id FROM users WHERE id = %s", (body.to_user_id,))
             if not cur.fetchone():
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
@@ -1909,7 +2723,6 @@ def update_buddy_request(request_id: int, body: BuddyRequestUpdate, user_id: int
             to_id = row["to_user_id"]
             cur.execute("UPDATE buddy_requests SET status = %s WHERE id = %s", (body.status, request_id))
             if body.status == "accepted":
-                _ensure_user_buddy_links_table(cur)
                 _upsert_buddy_link(cur, from_id, to_id, can_read=True, can_write=False)
                 _upsert_buddy_link(cur, to_id, from_id, can_read=True, can_write=False)
                 cur.execute("UPDATE users SET buddy_id = %s WHERE id = %s", (to_id, from_id))
@@ -2079,113 +2892,653 @@ def _build_dream_item(row, steps_by_dream, books_by_dream=None):
     }
 
 
+def _showcase_has_statuses() -> bool:
+    return schema_registry.has_table("dreams_statuses") and schema_registry.has("dreams", "status_id")
+
+
+def _showcase_has_categories() -> bool:
+    return schema_registry.has_table("dreams_categories") and schema_registry.has("dreams", "category_id")
+
+
+def _showcase_status_sql() -> Tuple[str, str]:
+    """(колонки статуса, JOIN) для SELECT витрины: без справочника dreams_statuses — «Запланировано»."""
+    if _showcase_has_statuses():
+        return (
+            "COALESCE(s.code, 'planned') AS status_code, s.label_ru AS status_label",
+            " LEFT JOIN dreams_statuses s ON d.status_id = s.id",
+        )
+    return "'planned' AS status_code, 'Запланировано' AS status_label", ""
+
+
+def _showcase_author_cols(contacts: bool = True) -> str:
+    """Колонки автора карточки витрины (users u); contacts=False — без telegram / vk / phone (fields= без них)."""
+    cols = "u.name AS user_name, u.surname AS user_surname, u.city AS user_city"
+    if contacts:
+        cols += ", u.telegram AS user_telegram, u.vk AS user_vk, u.phone AS user_phone"
+    return cols
+
+
+def _showcase_favorites_count_col() -> str:
+    """", d.favorites_count" для SELECT витрины, если счётчик есть (mig_dreams_favorites_count); иначе — COUNT
+    по user_dream_favorites подзапросом в той же строке."""
+    if schema_registry.has("dreams", "favorites_count"):
+        return ", d.favorites_count"
+    if schema_registry.has_table("user_dream_favorites"):
+        return ", (SELECT COUNT(*) FROM user_dream_favorites fc WHERE fc.dream_id = d.id) AS favorites_count"
+    return ", 0 AS favorites_count"
+
+
+def _showcase_counters_ready() -> bool:
+    """Таблицы счётчиков витрины есть (mig_showcase_counters) — счётчики из одной строки, иначе COUNT-запросы."""
+    return schema_registry.has_table(showcase_counters.COUNTERS_TABLE) and schema_registry.has_table(showcase_counters.TOTALS_TABLE)
+
+
+def _has_completion_requests() -> bool:
+    return schema_registry.has_table(showcase_counters.COMPLETION_TABLE)
+
+
+def _showcase_counts_by_query(cur, user_id: Optional[int]) -> dict:
+    """Счётчики витрины COUNT-запросами по исходным таблицам (без миграции mig_showcase_counters)."""
+    cur.execute(
+        "SELECT COUNT(*) AS n FROM dreams WHERE COALESCE(is_public, true) = true"
+    )
+    count_all = cur.fetchone()["n"] or 0
+    count_new = count_all
+    count_helping = 0
+    count_helped = 0
+    count_favorites = 0
+    count_in_progress = 0
+    count_pending_completion = 0
+    if user_id:
+        viewed_set = _showcase_viewed_set(cur, user_id)
+        if viewed_set is not None:
+            cur.execute(
+                "SELECT COUNT(*) AS n FROM dreams d WHERE COALESCE(d.is_public, true) = true AND NOT " + viewed_sets.predicate("d"),
+                viewed_sets.params(viewed_set),
+            )
+        else:
+            cur.execute(
+                """SELECT COUNT(*) AS n FROM dreams d
+                   WHERE COALESCE(d.is_public, true) = true
+                   AND NOT EXISTS (SELECT 1 FROM user_dream_views v WHERE v.user_id = %s AND v.dream_id = d.id)""",
+                (user_id,),
+            )
+        count_new = cur.fetchone()["n"] or 0
+        cur.execute(
+            """SELECT COUNT(*) AS n FROM user_dream_help_intent h
+               JOIN dreams d ON d.id = h.dream_id AND COALESCE(d.is_public, true) = true
+               WHERE h.user_id = %s
+               AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %s AND hl.dream_id = h.dream_id)""",
+            (user_id, user_id),
+        )
+        count_helping = cur.fetchone()["n"] or 0
+        cur.execute(
+            """SELECT COUNT(*) AS n FROM user_dream_helped hl
+               JOIN dreams d ON d.id = hl.dream_id AND COALESCE(d.is_public, true) = true
+               WHERE hl.user_id = %s""",
+            (user_id,),
+        )
+        count_helped = cur.fetchone()["n"] or 0
+        cur.execute(
+            """SELECT COUNT(*) AS n FROM user_dream_favorites f
+               JOIN dreams d ON d.id = f.dream_id AND COALESCE(d.is_public, true) = true
+               WHERE f.user_id = %s""",
+            (user_id,),
+        )
+        count_favorites = cur.fetchone()["n"] or 0
+        cur.execute(
+            """SELECT COUNT(DISTINCT d.id) AS n FROM dreams d
+               WHERE d.user_id = %s AND EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id)""",
+            (user_id,),
+        )
+        count_in_progress = cur.fetchone()["n"] or 0
+        if _has_completion_requests():
+            cur.execute(
+                """SELECT COUNT(DISTINCT r.dream_id) AS n FROM user_dream_completion_request r
+                   JOIN dreams d ON d.id = r.dream_id WHERE d.user_id = %s""",
+                (user_id,),
+            )
+            count_pending_completion = cur.fetchone()["n"] or 0
+    return {
+        "new": count_new, "helping": count_helping, "helped": count_helped,
+        "favorites": count_favorites, "all": count_all,
+        "in_progress": count_in_progress, "pending_completion": count_pending_completion,
+    }
+
+
 @app.get("/dreams/showcase/counts")
 def get_dreams_showcase_counts(user_id: Optional[int] = None):
-    """Счётчики витрины: new, helping, favorites, all. Для отображения при просмотре своих мечт."""
+    """Счётчики витрины: new, helping, favorites, all. Для отображения при просмотре своих мечт.
+    Со счётчиками user_showcase_counters — одна строка (при первом чтении создаётся по исходным таблицам)."""
+    _flush_dream_views_for(user_id)
     conn = None
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT COUNT(*) AS n FROM dreams WHERE COALESCE(is_public, true) = true"
-            )
-            count_all = cur.fetchone()["n"] or 0
-            count_new = count_all
-            count_helping = 0
-            count_helped = 0
-            count_favorites = 0
-            if user_id:
-                cur.execute(
-                    """SELECT COUNT(*) AS n FROM dreams d
-                       WHERE COALESCE(d.is_public, true) = true
-                       AND NOT EXISTS (SELECT 1 FROM user_dream_views v WHERE v.user_id = %s AND v.dream_id = d.id)""",
-                    (user_id,),
-                )
-                count_new = cur.fetchone()["n"] or 0
-                cur.execute(
-                    """SELECT COUNT(*) AS n FROM user_dream_help_intent h
-                       JOIN dreams d ON d.id = h.dream_id AND COALESCE(d.is_public, true) = true
-                       WHERE h.user_id = %s
-                       AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %s AND hl.dream_id = h.dream_id)""",
-                    (user_id, user_id),
-                )
-                count_helping = cur.fetchone()["n"] or 0
-                cur.execute(
-                    """SELECT COUNT(*) AS n FROM user_dream_helped hl
-                       JOIN dreams d ON d.id = hl.dream_id AND COALESCE(d.is_public, true) = true
-                       WHERE hl.user_id = %s""",
-                    (user_id,),
-                )
-                count_helped = cur.fetchone()["n"] or 0
-                cur.execute(
-                    """SELECT COUNT(*) AS n FROM user_dream_favorites f
-                       JOIN dreams d ON d.id = f.dream_id AND COALESCE(d.is_public, true) = true
-                       WHERE f.user_id = %s""",
-                    (user_id,),
-                )
-                count_favorites = cur.fetchone()["n"] or 0
-                count_in_progress = 0
-                count_pending_completion = 0
-                try:
-                    cur.execute(
-                        """SELECT COUNT(DISTINCT d.id) AS n FROM dreams d
-                           WHERE d.user_id = %s AND EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id)""",
-                        (user_id,),
-                    )
-                    count_in_progress = cur.fetchone()["n"] or 0
-                    cur.execute(
-                        """SELECT COUNT(DISTINCT r.dream_id) AS n FROM user_dream_completion_request r
-                           JOIN dreams d ON d.id = r.dream_id WHERE d.user_id = %s""",
-                        (user_id,),
-                    )
-                    count_pending_completion = cur.fetchone()["n"] or 0
-                except psycopg2.ProgrammingError:
-                    pass
-            else:
-                count_in_progress = 0
-                count_pending_completion = 0
+            counts = None
+            if _showcase_counters_ready():
+                counts = showcase_counters.read_counts(cur, user_id, _has_completion_requests())
+            if counts is None:
+                counts = _showcase_counts_by_query(cur, user_id)
             buddy_alerts_unread = 0
             if user_id:
                 try:
-                    ensure_buddy_alerts_schema(cur)
                     buddy_alerts_unread = count_unread_buddy_alerts(cur, user_id)
                 except Exception:
                     pass
-            return {
-                "new": count_new, "helping": count_helping, "helped": count_helped,
-                "favorites": count_favorites, "all": count_all,
-                "in_progress": count_in_progress, "pending_completion": count_pending_completion,
-                "buddy_alerts_unread": buddy_alerts_unread,
-            }
+            counts["buddy_alerts_unread"] = buddy_alerts_unread
+        conn.commit()
+        return counts
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         _return_conn(conn)
 
 
-@app.get("/dreams/showcase")
-def get_dreams_showcase(user_id: Optional[int] = None, showcase_filter: Optional[str] = None):
-    """Витрина мечт: публичные мечты. user_id — для флагов. showcase_filter: new, helping, all, favorites, viewed, in_progress."""
-    conn = None
+@app.get("/dreams/showcase/facets")
+def get_dreams_showcase_facets(
+    city: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    db: LazyDb = Depends(lazy_db),
+):
+    """Счётчики фасетов витрины: сколько публичных мечт в каждом городе, категории, статусе и ценовом диапазоне
+    при текущих фильтрах (свой фильтр фасета не учитывается — соседние значения остаются видны), total — при всех.
+    Из свёртки showcase_facet_counts (отстаёт не больше чем на SHOWCASE_FACETS_REFRESH_SEC, цена — с точностью
+    до диапазона); без миграции mig_showcase_facets — тот же GROUP BY по dreams на запрос."""
+    filters = _showcase_filters(city, category, status, price_min, price_max)
+    has_statuses, has_categories = _showcase_has_statuses(), _showcase_has_categories()
+    source = showcase_facets.TABLE
+    if not schema_registry.has_table(showcase_facets.TABLE):
+        source = "(" + showcase_facets.source_sql(has_statuses, has_categories) + ")"
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            if showcase_filter == "in_progress" and user_id:
-                rows = []
-                try:
-                    cur.execute("""
-                        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
-                               u.name AS user_name, u.surname AS user_surname
-                        FROM dreams d
-                        JOIN users u ON u.id = d.user_id
-                        WHERE d.user_id = %s
-                          AND EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id)
-                        ORDER BY d.id DESC
+        with db.cursor() as cur:
+            cur.execute(*showcase_facets.counts_sql(filters, source))
+            rows = cur.fetchall()
+            labels = {("status", "planned"): "Запланировано"}
+            if has_statuses:
+                cur.execute("SELECT code, label_ru FROM dreams_statuses")
+                labels.update({("status", r["code"]): r["label_ru"] for r in cur.fetchall()})
+            if has_categories:
+                cur.execute("SELECT code, label_ru FROM dreams_categories")
+                labels.update({("category", r["code"]): r["label_ru"] for r in cur.fetchall()})
+        db.release()
+        return showcase_facets.payload(rows, labels)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.release()
+
+
+def _showcase_favorites_counts(cur, user_id: int) -> dict:
+    """counts ветки showcase_filter=favorites. Строка user_showcase_counters, если она уже есть
+    (ветка читается и с реплики — строку здесь не создаём), иначе четыре COUNT-запроса."""
+    counts = None
+    if _showcase_counters_ready():
+        counts = showcase_counters.read_counts(cur, user_id, _has_completion_requests(), create=False)
+    if counts is not None:
+        return {
+            "new": 0, "helping": counts["helping"], "helped": counts["helped"],
+            "favorites": counts["favorites"], "all": counts["all"],
+        }
+    try:
+        cur.execute("SELECT COUNT(*) AS n FROM dreams WHERE COALESCE(is_public, true) = true")
+        count_all = cur.fetchone()["n"] or 0
+        cur.execute("SELECT COUNT(*) AS n FROM user_dream_favorites WHERE user_id = %s", (user_id,))
+        count_favorites = cur.fetchone()["n"] or 0
+        cur.execute("""SELECT COUNT(*) AS n FROM user_dream_help_intent h JOIN dreams d ON d.id = h.dream_id
+            WHERE h.user_id = %s AND COALESCE(d.is_public, true) = true
+            AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %s AND hl.dream_id = h.dream_id)""", (user_id, user_id))
+        count_helping = cur.fetchone()["n"] or 0
+        cur.execute("""SELECT COUNT(*) AS n FROM user_dream_helped hl JOIN dreams d ON d.id = hl.dream_id
+            WHERE hl.user_id = %s AND COALESCE(d.is_public, true) = true""", (user_id,))
+        count_helped = cur.fetchone()["n"] or 0
+    except Exception:
+        count_all = count_favorites = count_helping = count_helped = 0
+    return {"new": 0, "helping": count_helping, "helped": count_helped, "favorites": count_favorites, "all": count_all}
+
+
+def _showcase_filters(
+    city: Optional[str], category: Optional[str], status: Optional[str], price_min: Optional[float], price_max: Optional[float],
+) -> "showcase_facets.Filters":
+    """Фасетные фильтры из query-параметров; price_min > price_max — 400."""
+    if price_min is not None and price_max is not None and price_min > price_max:
+        raise HTTPException(status_code=400, detail="price_min больше price_max")
+    return showcase_facets.Filters.of(city, category, status, price_min, price_max)
+
+
+def _showcase_facet_sql(filters: Optional["showcase_facets.Filters"]) -> Tuple[List[str], dict]:
+    """Условия WHERE фасетов (город автора, коды категории / статуса, цена от / до — не включая) для SELECT
+    витрины по dreams d JOIN users u. Каждому — частичный индекс из _sql/mig_showcase_facets.sql; код справочника —
+    скалярным подзапросом (коды уникальны), чтобы (category_id | status_id, date, id) отдавал страницу по порядку."""
+    conds, params = [], {}
+    if filters is None:
+        return conds, params
+    if filters.city:
+        conds.append("btrim(u.city) = %(f_city)s")
+        params["f_city"] = filters.city
+    if filters.status:
+        if _showcase_has_statuses():
+            conds.append("d.status_id = (SELECT st.id FROM dreams_statuses st WHERE st.code = %(f_status)s)")
+        else:
+            conds.append("'planned' = %(f_status)s")
+        params["f_status"] = filters.status
+    if filters.category:
+        if _showcase_has_categories():
+            conds.append("d.category_id = (SELECT c.id FROM dreams_categories c WHERE c.code = %(f_category)s)")
+        else:
+            conds.append("false")
+        params["f_category"] = filters.category
+    if filters.price_min is not None:
+        conds.append(showcase_facets.price_sql("d") + " >= %(f_price_min)s::numeric")
+        params["f_price_min"] = filters.price_min
+    if filters.price_max is not None:
+        conds.append(showcase_facets.price_sql("d") + " < %(f_price_max)s::numeric")
+        params["f_price_max"] = filters.price_max
+    return conds, params
+
+
+def _showcase_all_sql(
+    filters: Optional["showcase_facets.Filters"] = None, user_id: Optional[int] = None,
+    viewed: Optional["viewed_sets.ViewedSet"] = None, contacts: bool = True,
+) -> Tuple[str, dict]:
+    """Все публичные мечты с автором и статусом (ветка витрины без showcase_filter=favorites/in_progress).
+    С user_id — и колонки отметок зрителя (_showcase_flag_cols); contacts — _showcase_author_cols."""
+    status_cols, status_join = _showcase_status_sql()
+    facet_conds, params = _showcase_facet_sql(filters)
+    flag_cols, flag_params = _showcase_flag_cols(user_id, viewed)
+    params.update(flag_params)
+    return """
+        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+               """ + status_cols + """,
+               """ + _showcase_author_cols(contacts) + _showcase_favorites_count_col() + flag_cols + """
+        FROM dreams d
+        JOIN users u ON u.id = d.user_id""" + status_join + """
+        WHERE """ + " AND ".join(["COALESCE(d.is_public, true) = true"] + facet_conds) + """
+        ORDER BY d.id DESC
+    """, params
+
+
+def _viewed_sets_ready() -> bool:
+    """Наборы просмотренных (mig_user_viewed_sets) и позиции мечт в витрине для них (mig_dreams_showcase_key)."""
+    return schema_registry.has_table(viewed_sets.TABLE) and schema_registry.has("dreams", viewed_sets.KEY_COLUMN)
+
+
+def _showcase_viewed_set(cur, user_id: Optional[int]) -> Optional["viewed_sets.ViewedSet"]:
+    """Просмотренные зрителем мечты компактно (user_viewed_sets); None — набора нет, тогда user_dream_views."""
+    if not user_id or not _viewed_sets_ready():
+        return None
+    return viewed_sets.load(cur, user_id)
+
+
+def _showcase_flag_cols(user_id: Optional[int], viewed: Optional["viewed_sets.ViewedSet"], alias: str = "d") -> Tuple[str, dict]:
+    """(колонки, параметры) персональных отметок зрителя для SELECT карточек (showcase_flags): EXISTS по ключу
+    (user_id, dream_id) в той же строке вместо отдельного запроса на каждый флаг. viewed — набор просмотренных
+    (предикат-битмап), без него — EXISTS по user_dream_views. Без user_id — пусто (отметок нет)."""
+    if not user_id:
+        return "", {}
+    params: dict = {"uid": user_id}
+    viewed_sql = None
+    if viewed is not None:
+        viewed_sql = viewed_sets.predicate(alias, dreams_row=alias == "d")
+        params.update(viewed_sets.params(viewed))
+    tables = {table for table, _ in showcase_flags.TABLES.values() if schema_registry.has_table(table)}
+    return showcase_flags.columns_sql(alias, tables, viewed_sql), params
+
+
+def _showcase_with_flags(
+    sql: str, params: dict, user_id: Optional[int], viewed: Optional["viewed_sets.ViewedSet"], order_by: str,
+) -> Tuple[str, dict]:
+    """SELECT карточек с LIMIT -> тот же SELECT с отметками зрителя поверх уже отобранных строк (алиас p):
+    страница — один запрос, EXISTS считаются только для limit + 1 строк. order_by — порядок страницы по p."""
+    flag_cols, flag_params = _showcase_flag_cols(user_id, viewed, "p")
+    if not flag_cols:
+        return sql, params
+    params = dict(params, **flag_params)
+    return "SELECT p.*" + flag_cols + " FROM (" + sql + ") p ORDER BY " + order_by, params
+
+
+def _showcase_item(r, flags: dict) -> dict:
+    did = r["id"]
+    full_name = f"{r.get('user_name') or ''} {r.get('user_surname') or ''}".strip() or "Участник"
+    price_val = r.get("price")
+    if price_val is not None:
+        try:
+            price_val = float(price_val)
+        except (TypeError, ValueError):
+            price_val = None
+    helping = did in flags["helping"] and did not in flags["helped"]
+    return {
+        "id": did,
+        "dream": r.get("dream") or "",
+        "deadline": str(r["deadline"]) if r.get("deadline") else None,
+        "price": price_val,
+        "date": str(r["date"]) if r.get("date") else None,
+        "user_id": r["user_id"],
+        "user_name": full_name,
+        "city": (r.get("user_city") or "").strip() or None,
+        "status": r.get("status_code") or "planned",
+        "status_label": r.get("status_label") or "Запланировано",
+        "telegram": (r.get("user_telegram") or "").strip() or None,
+        "vk": (r.get("user_vk") or "").strip() or None,
+        "phone": r.get("user_phone"),
+        "is_viewed": did in flags["viewed"],
+        "is_favorite": did in flags["favorites"],
+        "is_helping": helping,
+        "is_helped": did in flags["helped"],
+        "pending_completion_request": (did in flags["completion_requested"]) and helping,
+        "favorites_count": r["favorites_count"],
+    }
+
+
+def _showcase_payload(rows, user_id: Optional[int], showcase_filter: Optional[str]) -> dict:
+    """Карточки, фильтр, сортировка и счётчики витрины из строк _showcase_all_sql (с колонками отметок зрителя)."""
+    flags = showcase_flags.from_rows(rows)
+    result = [_showcase_item(r, flags) for r in rows]
+    if showcase_filter and user_id:
+        if showcase_filter == "new":
+            result = [x for x in result if not x["is_viewed"]]
+        elif showcase_filter == "helping":
+            result = [x for x in result if x["is_helping"]]
+        elif showcase_filter == "helped":
+            result = [x for x in result if x["is_helped"]]
+        elif showcase_filter == "favorites":
+            result = [x for x in result if x["is_favorite"]]
+        elif showcase_filter == "viewed":
+            result = [x for x in result if x["is_viewed"]]
+    result.sort(key=lambda x: x["date"] or "", reverse=True)
+    if user_id:
+        result.sort(key=lambda x: x["is_viewed"])
+    # Счётчики: Новые, Помогаю, Помог, Избранные, Все
+    helped = flags["helped"]
+    count_all = len(rows)
+    counts = {
+        "new": count_all - len(flags["viewed"]) if user_id else count_all,
+        "helping": len([d for d in flags["helping"] if d not in helped]),
+        "helped": len(helped),
+        "favorites": len(flags["favorites"]),
+        "all": count_all,
+    }
+    return {"dreams": result, "counts": counts}
+
+
+# Постраничная витрина (limit / cursor): порядок тот же, что у _showcase_payload — сначала непросмотренные,
+# затем по date DESC NULLS LAST, id DESC. Каждый сегмент (непросмотренные / просмотренные) — диапазон индекса
+# idx_dreams_public_date_nl_id (_sql/mig_dreams_showcase_keyset.sql) с LIMIT, фильтры — EXISTS в SQL.
+SHOWCASE_PAGE_DEFAULT = 30
+SHOWCASE_PAGE_MAX = 100
+
+_SHOWCASE_FILTER_SQL = {
+    "helping": (
+        "EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.user_id = %(uid)s AND h.dream_id = d.id)"
+        " AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %(uid)s AND hl.dream_id = d.id)"
+    ),
+    "helped": "EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %(uid)s AND hl.dream_id = d.id)",
+    "favorites": "EXISTS (SELECT 1 FROM user_dream_favorites f WHERE f.user_id = %(uid)s AND f.dream_id = d.id)",
+}
+_SHOWCASE_VIEWED_SQL = showcase_flags.exists_sql("viewed", "d.id")
+
+
+def _showcase_encode_cursor(segment: int, dream_date, dream_id: int) -> str:
+    return page_cursor.encode([segment, dream_date.isoformat() if dream_date is not None else None, dream_id])
+
+
+def _showcase_decode_cursor(cursor: str) -> Tuple[int, Optional[str], int]:
+    """(сегмент, date последней карточки в ISO — DATE или TIMESTAMP, None — без даты, id последней карточки); мусор — 400."""
+    try:
+        segment, dream_date, dream_id = page_cursor.decode(cursor, 3)
+        if dream_date is not None:
+            datetime.fromisoformat(dream_date)
+        return int(segment), dream_date, int(dream_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Некорректный cursor витрины")
+
+
+def _showcase_page_sql(
+    user_id: Optional[int], showcase_filter: Optional[str], after: Optional[Tuple[int, Optional[str], int]], limit: int,
+    viewed: Optional["viewed_sets.ViewedSet"] = None, filters: Optional["showcase_facets.Filters"] = None,
+    contacts: bool = True,
+) -> Tuple[str, dict]:
+    """SELECT страницы витрины (limit + 1 строк — для next_cursor). Колонки — как у _showcase_all_sql + segment.
+    viewed — набор просмотренных зрителя: сегменты по нему (параметры-битмап), без анти-join с user_dream_views.
+    filters — фасеты (_showcase_facet_sql). Отметки зрителя — колонками поверх страницы (_showcase_with_flags).
+    Мечты без date идут в конце сегмента: после карточки с датой сегмент продолжается двумя диапазонами
+    индекса — (date, id) меньше курсора и date IS NULL."""
+    status_cols, status_join = _showcase_status_sql()
+    fav_col = _showcase_favorites_count_col()
+    params = {"uid": user_id, "lim": limit + 1}
+    where = ["COALESCE(d.is_public, true) = true"]
+    facet_conds, facet_params = _showcase_facet_sql(filters)
+    where += facet_conds
+    params.update(facet_params)
+    segments = [(0, None)]
+    if user_id:
+        if showcase_filter in _SHOWCASE_FILTER_SQL:
+            where.append(_SHOWCASE_FILTER_SQL[showcase_filter])
+        viewed_sql = _SHOWCASE_VIEWED_SQL
+        if viewed is not None:
+            viewed_sql = viewed_sets.predicate("d")
+            params.update(viewed_sets.params(viewed))
+        segments = [(0, "NOT " + viewed_sql), (1, viewed_sql)]
+        if showcase_filter == "new":
+            segments = segments[:1]
+        elif showcase_filter == "viewed":
+            segments = segments[1:]
+    parts = []
+    for segment, viewed_cond in segments:
+        if after is not None and segment < after[0]:
+            continue
+        keysets = [None]
+        if after is not None and segment == after[0]:
+            params["after_date"], params["after_id"] = after[1], after[2]
+            if after[1] is None:
+                keysets = ["d.date IS NULL AND d.id < %(after_id)s"]
+            else:
+                keysets = ["(d.date, d.id) < (%(after_date)s, %(after_id)s)", "d.date IS NULL"]
+        for keyset in keysets:
+            conds = list(where)
+            if viewed_cond:
+                conds.append(viewed_cond)
+            if keyset:
+                conds.append(keyset)
+            parts.append("""(
+            SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+                   """ + status_cols + """,
+                   """ + _showcase_author_cols(contacts) + fav_col + """,
+                   """ + str(segment) + """ AS segment
+            FROM dreams d
+            JOIN users u ON u.id = d.user_id""" + status_join + """
+            WHERE """ + " AND ".join(conds) + """
+            ORDER BY d.date DESC NULLS LAST, d.id DESC
+            LIMIT %(lim)s
+        )""")
+    if not parts:
+        return "", params
+    sql = (
+        "SELECT * FROM (" + " UNION ALL ".join(parts) + ") page"
+        " ORDER BY segment, date DESC NULLS LAST, id DESC LIMIT %(lim)s"
+    )
+    return _showcase_with_flags(sql, params, user_id, viewed, "p.segment, p.date DESC NULLS LAST, p.id DESC")
+
+
+def _showcase_page_payload(rows, limit: int) -> dict:
+    """Карточки страницы (строки _showcase_page_sql) и next_cursor; счётчики — GET /dreams/showcase/counts."""
+    page = rows[:limit]
+    flags = showcase_flags.from_rows(page)
+    next_cursor = None
+    if len(rows) > limit and page:
+        last = page[-1]
+        next_cursor = _showcase_encode_cursor(last["segment"], last["date"], last["id"])
+    return {"dreams": [_showcase_item(r, flags) for r in page], "next_cursor": next_cursor}
+
+
+def _showcase_page_limit(limit: Optional[int]) -> int:
+    return max(1, min(int(limit or SHOWCASE_PAGE_DEFAULT), SHOWCASE_PAGE_MAX))
+
+
+# Анонимная витрина (без user_id) одинакова для всех: сериализованный снимок в памяти процесса
+# (showcase_cache.py) по версии showcase_public_version, strong ETag и 304 на If-None-Match.
+# Версию повышает _bump_showcase_version() в транзакции записи; процесс перечитывает её не чаще
+# раза в SHOWCASE_CACHE_CHECK_SEC (0 — кэш выключен). Пока один запрос пересобирает снимок, остальные
+# до SHOWCASE_CACHE_STALE_SEC получают прежний; снимок старше SHOWCASE_CACHE_MAX_AGE_SEC пересобирается.
+SHOWCASE_CACHE_CHECK_SEC = float(os.getenv("SHOWCASE_CACHE_CHECK_SEC") or 1)
+SHOWCASE_CACHE_STALE_SEC = float(os.getenv("SHOWCASE_CACHE_STALE_SEC") or 10)
+SHOWCASE_CACHE_MAX_AGE_SEC = float(os.getenv("SHOWCASE_CACHE_MAX_AGE_SEC") or 300)
+_SHOWCASE_VERSION_TABLE = "showcase_public_version"
+_SHOWCASE_VERSION_SQL = "SELECT version FROM " + _SHOWCASE_VERSION_TABLE
+showcase_cache = SnapshotCache(SHOWCASE_CACHE_CHECK_SEC, SHOWCASE_CACHE_STALE_SEC, SHOWCASE_CACHE_MAX_AGE_SEC)
+
+
+def _showcase_cache_on() -> bool:
+    return showcase_cache.enabled and schema_registry.has_table(_SHOWCASE_VERSION_TABLE)
+
+
+def _bump_showcase_version(cur, dream_ids: Optional[List[int]] = None, user_id: Optional[int] = None) -> None:
+    """+1 к версии анонимной витрины в транзакции записи. dream_ids / user_id — только если среди этих мечт
+    (мечт пользователя) есть публичная. После commit() — showcase_cache.expire_version()."""
+    if not schema_registry.has_table(_SHOWCASE_VERSION_TABLE):
+        return
+    sql = "UPDATE " + _SHOWCASE_VERSION_TABLE + " SET version = version + 1, bumped_at = NOW()"
+    public = " AND COALESCE(d.is_public, true) = true" if schema_registry.has("dreams", "is_public") else ""
+    params: tuple = ()
+    if dream_ids is not None:
+        sql += " WHERE EXISTS (SELECT 1 FROM dreams d WHERE d.id = ANY(%s)" + public + ")"
+        params = (list(dream_ids),)
+    elif user_id is not None:
+        sql += " WHERE EXISTS (SELECT 1 FROM dreams d WHERE d.user_id = %s" + public + ")"
+        params = (user_id,)
+    cur.execute(sql, params)
+
+
+def _showcase_cache_key(
+    limit: Optional[int], cursor: Optional[str], filters: Optional["showcase_facets.Filters"] = None,
+    fields: "fieldsets.Selection" = None,
+) -> tuple:
+    """Ключ снимка: анонимный ответ не зависит от showcase_filter (фильтры — только с user_id), но зависит от фасетов
+    и fields= (снимок на каждый набор полей)."""
+    facets = tuple(filters) if filters is not None and filters.active else ()
+    if fields is not None:
+        facets += (("fields",) + tuple(sorted(fields)),)
+    if limit is None and cursor is None:
+        return ("all",) + facets
+    return ("page", _showcase_page_limit(limit), cursor or "") + facets
+
+
+def _showcase_snapshot_response(request: Request, snap, result: str) -> Response:
+    headers = {"ETag": snap.etag, "Cache-Control": "public, max-age=0, must-revalidate"}
+    if SHOWCASE_CACHE_STALE_SEC > 0:
+        headers["Cache-Control"] = f"public, max-age=0, stale-while-revalidate={int(SHOWCASE_CACHE_STALE_SEC)}"
+    if etag_matches(request.headers.get("if-none-match"), snap.etag):
+        _metric_showcase_cache.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+    _metric_showcase_cache.inc(result=result)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
+
+
+def _showcase_snapshot_body(payload: dict) -> bytes:
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def _showcase_anonymous(
+    request: Request, limit: Optional[int], cursor: Optional[str], db: "LazyDb", filters: Optional["showcase_facets.Filters"] = None,
+    fields: "fieldsets.Selection" = None,
+) -> Response:
+    key = _showcase_cache_key(limit, cursor, filters, fields)
+    version, reload = showcase_cache.version()
+    if reload:
+        version = None
+        try:
+            with db.cursor() as cur:
+                cur.execute(_SHOWCASE_VERSION_SQL)
+                row = cur.fetchone()
+            version = row["version"] if row else None
+        finally:
+            showcase_cache.set_version(version)
+    if version is None:
+        return _showcase_build(None, None, limit, cursor, db, filters=filters, fields=fields)
+    snap, build = showcase_cache.lookup(key, version)
+    if not build:
+        return _showcase_snapshot_response(request, snap, "hit" if snap.version == version else "stale")
+    try:
+        payload = _showcase_build(None, None, limit, cursor, db, filters=filters, fields=fields)
+    except BaseException:
+        showcase_cache.abandon(key)
+        raise
+    return _showcase_snapshot_response(request, showcase_cache.store(key, version, _showcase_snapshot_body(payload)), "miss")
+
+
+@app.get("/dreams/showcase")
+def get_dreams_showcase(
+    request: Request,
+    user_id: Optional[int] = None,
+    showcase_filter: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    city: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    fields: Optional[str] = None,
+    db: LazyDb = Depends(lazy_db),
+):
+    """Витрина мечт: публичные мечты. user_id — для флагов. showcase_filter: new, helping, all, favorites, viewed, in_progress.
+    limit / cursor — постранично (до SHOWCASE_PAGE_MAX карточек, ответ {dreams, next_cursor} без counts);
+    без них — вся витрина со счётчиками. Ветки favorites / in_progress с user_id — всегда целиком.
+    Фасеты: city, category / status (коды справочников), price_min / price_max (₽, верхняя граница не включается);
+    ветки favorites / in_progress их не учитывают. Счётчики по фасетам — GET /dreams/showcase/facets.
+    fields — поля карточки (fieldsets.SHOWCASE_CARD, пресеты list / card / full; контакты автора — только в full).
+    Без user_id — снимок из showcase_cache с ETag (If-None-Match -> 304)."""
+    filters = _showcase_filters(city, category, status, price_min, price_max)
+    selected = _fields_or_400(fieldsets.SHOWCASE_CARD, fields)
+    if user_id is None and _showcase_cache_on():
+        if cursor:
+            _showcase_decode_cursor(cursor)
+        try:
+            return _showcase_anonymous(request, limit, cursor, db, filters, selected)
+        finally:
+            db.release()
+    _flush_dream_views_for(user_id)
+    return _showcase_build(user_id, showcase_filter, limit, cursor, db, filters=filters, fields=selected)
+
+
+def _showcase_apply_fields(payload: dict, fields: "fieldsets.Selection") -> dict:
+    """Карточки ответа витрины без полей вне fields= (counts / next_cursor — как есть)."""
+    if fields is not None:
+        payload["dreams"] = [fieldsets.pick(item, fields) for item in payload["dreams"]]
+    return payload
+
+
+def _showcase_build(
+    user_id: Optional[int], showcase_filter: Optional[str], limit: Optional[int], cursor: Optional[str], db: "LazyDb",
+    filters: Optional["showcase_facets.Filters"] = None, fields: "fieldsets.Selection" = None,
+):
+    """Ответ GET /dreams/showcase из БД (без кэша). fields — разобранный fields= (без контактов — без их колонок)."""
+    paged = limit is not None or cursor is not None
+    contacts = fieldsets.wants(fields, "telegram", "vk", "phone")
+    after = _showcase_decode_cursor(cursor) if cursor else None
+    try:
+        with db.cursor() as cur:
+            if showcase_filter == "in_progress" and user_id:
+                rows = []
+                try:
+                    cur.execute("""
+                        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+                               u.name AS user_name, u.surname AS user_surname
+                        FROM dreams d
+                        JOIN users u ON u.id = d.user_id
+                        WHERE d.user_id = %s
+                          AND EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id)
+                        ORDER BY d.id DESC
                     """, (user_id,))
                     rows = cur.fetchall()
                 except Exception:
                     try:
-                        conn.rollback()
+                        db.rollback()
                     except Exception:
                         pass
                     try:
@@ -2200,15 +3553,12 @@ def get_dreams_showcase(user_id: Optional[int] = None, showcase_filter: Optional
                     except Exception:
                         rows = []
                 completion_dreams = set()
-                if rows:
-                    try:
-                        cur.execute(
-                            "SELECT dream_id FROM user_dream_completion_request WHERE dream_id = ANY(%s)",
-                            ([r["id"] for r in rows],),
-                        )
-                        completion_dreams = {r["dream_id"] for r in cur.fetchall()}
-                    except psycopg2.ProgrammingError:
-                        pass
+                if rows and schema_registry.has_table("user_dream_completion_request"):
+                    cur.execute(
+                        "SELECT dream_id FROM user_dream_completion_request WHERE dream_id = ANY(%s)",
+                        ([r["id"] for r in rows],),
+                    )
+                    completion_dreams = {r["dream_id"] for r in cur.fetchall()}
                 result = []
                 for r in rows:
                     full_name = f"{r.get('user_name') or ''} {r.get('user_surname') or ''}".strip() or "Участник"
@@ -2224,267 +3574,197 @@ def get_dreams_showcase(user_id: Optional[int] = None, showcase_filter: Optional
                         "has_pending_completion": r["id"] in completion_dreams,
                     })
                 counts = {"new": 0, "helping": 0, "helped": 0, "favorites": 0, "all": 0, "in_progress": len(rows), "pending_completion": len(completion_dreams)}
-                return {"dreams": result, "counts": counts}
+                return _showcase_apply_fields({"dreams": result, "counts": counts}, fields)
             if showcase_filter == "favorites" and user_id:
-                try:
-                    cur.execute(
-                        "SELECT dream_id FROM user_dream_favorites WHERE user_id = %s",
-                        (user_id,),
-                    )
-                    fav_ids = [r["dream_id"] for r in cur.fetchall()]
-                except Exception:
-                    fav_ids = []
-                if not fav_ids:
-                    try:
-                        cur.execute("SELECT COUNT(*) AS n FROM dreams WHERE COALESCE(is_public, true) = true")
-                        count_all = cur.fetchone()["n"] or 0
-                        cur.execute("SELECT COUNT(*) AS n FROM user_dream_favorites WHERE user_id = %s", (user_id,))
-                        count_favorites = cur.fetchone()["n"] or 0
-                        cur.execute("""SELECT COUNT(*) AS n FROM user_dream_help_intent h JOIN dreams d ON d.id = h.dream_id
-                            WHERE h.user_id = %s AND COALESCE(d.is_public, true) = true
-                            AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %s AND hl.dream_id = h.dream_id)""", (user_id, user_id))
-                        count_helping = cur.fetchone()["n"] or 0
-                        cur.execute("""SELECT COUNT(*) AS n FROM user_dream_helped hl JOIN dreams d ON d.id = hl.dream_id
-                            WHERE hl.user_id = %s AND COALESCE(d.is_public, true) = true""", (user_id,))
-                        count_helped = cur.fetchone()["n"] or 0
-                    except Exception:
-                        count_all = count_favorites = count_helping = count_helped = 0
-                    counts = {"new": 0, "helping": count_helping, "helped": count_helped, "favorites": count_favorites, "all": count_all}
-                    return {"dreams": [], "counts": counts}
-                try:
-                    cur.execute("""
-                        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
-                               COALESCE(s.code, 'planned') AS status_code, s.label_ru AS status_label,
-                               u.name AS user_name, u.surname AS user_surname, u.city AS user_city,
-                               u.telegram AS user_telegram, u.vk AS user_vk, u.phone AS user_phone
-                        FROM dreams d
-                        JOIN users u ON u.id = d.user_id
-                        LEFT JOIN dreams_statuses s ON d.status_id = s.id
-                        WHERE d.id = ANY(%s) AND COALESCE(d.is_public, true) = true
-                        ORDER BY d.date DESC NULLS LAST, d.id DESC
-                    """, (fav_ids,))
-                    rows = cur.fetchall()
-                except psycopg2.ProgrammingError:
-                    conn.rollback()
-                    cur.execute("""
-                        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
-                               u.name AS user_name, u.surname AS user_surname, u.city AS user_city,
-                               u.telegram AS user_telegram, u.vk AS user_vk, u.phone AS user_phone
-                        FROM dreams d JOIN users u ON u.id = d.user_id
-                        WHERE d.id = ANY(%s) AND COALESCE(d.is_public, true) = true
-                        ORDER BY d.date DESC NULLS LAST, d.id DESC
-                    """, (fav_ids,))
-                    rows = cur.fetchall()
-                    for r in rows:
-                        r["status_code"] = "planned"
-                        r["status_label"] = "Запланировано"
-                dream_ids = [r["id"] for r in rows]
-                viewed = set()
-                helping = set()
-                helped = set()
-                completion_requested = set()
-                try:
-                    cur.execute("SELECT dream_id FROM user_dream_views WHERE user_id = %s AND dream_id = ANY(%s)", (user_id, dream_ids))
-                    viewed = {r["dream_id"] for r in cur.fetchall()}
-                    cur.execute("SELECT dream_id FROM user_dream_help_intent WHERE user_id = %s AND dream_id = ANY(%s)", (user_id, dream_ids))
-                    helping = {r["dream_id"] for r in cur.fetchall()}
-                    cur.execute("SELECT dream_id FROM user_dream_helped WHERE user_id = %s AND dream_id = ANY(%s)", (user_id, dream_ids))
-                    helped = {r["dream_id"] for r in cur.fetchall()}
-                    try:
-                        cur.execute("SELECT dream_id FROM user_dream_completion_request WHERE helper_user_id = %s AND dream_id = ANY(%s)", (user_id, dream_ids))
-                        completion_requested = {r["dream_id"] for r in cur.fetchall()}
-                    except psycopg2.ProgrammingError:
-                        pass
-                except psycopg2.ProgrammingError:
-                    pass
-                favorites_count_by_dream = {}
-                try:
-                    cur.execute("SELECT dream_id, COUNT(*) AS c FROM user_dream_favorites WHERE dream_id = ANY(%s) GROUP BY dream_id", (dream_ids,))
-                    for row in cur.fetchall():
-                        favorites_count_by_dream[row["dream_id"]] = row["c"] or 0
-                except psycopg2.ProgrammingError:
-                    pass
-                result = []
-                for r in rows:
-                    did = r["id"]
-                    full_name = f"{r.get('user_name') or ''} {r.get('user_surname') or ''}".strip() or "Участник"
-                    price_val = float(r["price"]) if r.get("price") is not None else None
-                    item = {
-                        "id": did,
-                        "dream": r.get("dream") or "",
-                        "deadline": str(r["deadline"]) if r.get("deadline") else None,
-                        "price": price_val,
-                        "date": str(r["date"]) if r.get("date") else None,
-                        "user_id": r["user_id"],
-                        "user_name": full_name,
-                        "city": (r.get("user_city") or "").strip() or None,
-                        "status": r.get("status_code") or "planned",
-                        "status_label": r.get("status_label") or "Запланировано",
-                        "telegram": (r.get("user_telegram") or "").strip() or None,
-                        "vk": (r.get("user_vk") or "").strip() or None,
-                        "phone": r.get("user_phone"),
-                        "is_viewed": did in viewed,
-                        "is_favorite": True,
-                        "is_helping": did in helping and did not in helped,
-                        "is_helped": did in helped,
-                        "pending_completion_request": (did in completion_requested) and (did in helping and did not in helped),
-                        "favorites_count": favorites_count_by_dream.get(did, 0),
-                    }
-                    result.append(item)
-                try:
-                    cur.execute("SELECT COUNT(*) AS n FROM dreams WHERE COALESCE(is_public, true) = true")
-                    count_all = cur.fetchone()["n"] or 0
-                    cur.execute("SELECT COUNT(*) AS n FROM user_dream_favorites WHERE user_id = %s", (user_id,))
-                    count_favorites = cur.fetchone()["n"] or 0
-                    cur.execute("""SELECT COUNT(*) AS n FROM user_dream_help_intent h JOIN dreams d ON d.id = h.dream_id
-                        WHERE h.user_id = %s AND COALESCE(d.is_public, true) = true
-                        AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %s AND hl.dream_id = h.dream_id)""", (user_id, user_id))
-                    count_helping = cur.fetchone()["n"] or 0
-                    cur.execute("""SELECT COUNT(*) AS n FROM user_dream_helped hl JOIN dreams d ON d.id = hl.dream_id
-                        WHERE hl.user_id = %s AND COALESCE(d.is_public, true) = true""", (user_id,))
-                    count_helped = cur.fetchone()["n"] or 0
-                except Exception:
-                    count_all = count_favorites = count_helping = count_helped = 0
-                counts = {"new": 0, "helping": count_helping, "helped": count_helped, "favorites": count_favorites, "all": count_all}
-                return {"dreams": result, "counts": counts}
-            try:
-                cur.execute("""
-                    SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
-                           COALESCE(s.code, 'planned') AS status_code,
-                           s.label_ru AS status_label,
-                           u.name AS user_name, u.surname AS user_surname, u.city AS user_city,
-                           u.telegram AS user_telegram, u.vk AS user_vk, u.phone AS user_phone
-                    FROM dreams d
-                    JOIN users u ON u.id = d.user_id
-                    LEFT JOIN dreams_statuses s ON d.status_id = s.id
-                    WHERE COALESCE(d.is_public, true) = true
-                    ORDER BY d.id DESC
-                """)
-                rows = cur.fetchall()
-            except psycopg2.ProgrammingError:
-                conn.rollback()
+                if not schema_registry.has_table("user_dream_favorites"):
+                    return {"dreams": [], "counts": _showcase_favorites_counts(cur, user_id)}
+                status_cols, status_join = _showcase_status_sql()
+                flag_cols, params = _showcase_flag_cols(user_id, _showcase_viewed_set(cur, user_id))
                 cur.execute("""
                     SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
-                           u.name AS user_name, u.surname AS user_surname, u.city AS user_city,
-                           u.telegram AS user_telegram, u.vk AS user_vk, u.phone AS user_phone
+                           """ + status_cols + """,
+                           """ + _showcase_author_cols(contacts) + _showcase_favorites_count_col() + flag_cols + """
                     FROM dreams d
-                    JOIN users u ON u.id = d.user_id
-                    WHERE COALESCE(d.is_public, true) = true
-                    ORDER BY d.id DESC
-                """)
+                    JOIN users u ON u.id = d.user_id""" + status_join + """
+                    WHERE COALESCE(d.is_public, true) = true AND """ + _SHOWCASE_FILTER_SQL["favorites"] + """
+                    ORDER BY d.date DESC NULLS LAST, d.id DESC
+                """, params)
                 rows = cur.fetchall()
-                for r in rows:
-                    r["status_code"] = "planned"
-                    r["status_label"] = "Запланировано"
-            dream_ids = [r["id"] for r in rows]
-            viewed = set()
-            favorites = set()
-            helping = set()
-            helped = set()
-            completion_requested = set()
-            if user_id and dream_ids:
-                try:
-                    cur.execute(
-                        "SELECT dream_id FROM user_dream_views WHERE user_id = %s AND dream_id = ANY(%s)",
-                        (user_id, dream_ids),
-                    )
-                    viewed = {r["dream_id"] for r in cur.fetchall()}
-                    cur.execute(
-                        "SELECT dream_id FROM user_dream_favorites WHERE user_id = %s AND dream_id = ANY(%s)",
-                        (user_id, dream_ids),
-                    )
-                    favorites = {r["dream_id"] for r in cur.fetchall()}
-                    cur.execute(
-                        "SELECT dream_id FROM user_dream_help_intent WHERE user_id = %s AND dream_id = ANY(%s)",
-                        (user_id, dream_ids),
-                    )
-                    helping = {r["dream_id"] for r in cur.fetchall()}
-                    cur.execute(
-                        "SELECT dream_id FROM user_dream_helped WHERE user_id = %s AND dream_id = ANY(%s)",
-                        (user_id, dream_ids),
-                    )
-                    helped = {r["dream_id"] for r in cur.fetchall()}
-                    try:
-                        cur.execute(
-                            "SELECT dream_id FROM user_dream_completion_request WHERE helper_user_id = %s AND dream_id = ANY(%s)",
-                            (user_id, dream_ids),
-                        )
-                        completion_requested = {r["dream_id"] for r in cur.fetchall()}
-                    except psycopg2.ProgrammingError:
-                        pass
-                except psycopg2.ProgrammingError:
-                    pass
-            favorites_count_by_dream = {}
-            if dream_ids:
-                try:
-                    cur.execute(
-                        "SELECT dream_id, COUNT(*) AS c FROM user_dream_favorites WHERE dream_id = ANY(%s) GROUP BY dream_id",
-                        (dream_ids,),
-                    )
-                    for row in cur.fetchall():
-                        favorites_count_by_dream[row["dream_id"]] = row["c"] or 0
-                except psycopg2.ProgrammingError:
-                    pass
-            result = []
-            for r in rows:
-                did = r["id"]
-                full_name = f"{r.get('user_name') or ''} {r.get('user_surname') or ''}".strip() or "Участник"
-                price_val = r.get("price")
-                if price_val is not None:
-                    try:
-                        price_val = float(price_val)
-                    except (TypeError, ValueError):
-                        price_val = None
-                else:
-                    price_val = None
-                item = {
-                    "id": did,
-                    "dream": r.get("dream") or "",
-                    "deadline": str(r["deadline"]) if r.get("deadline") else None,
-                    "price": price_val,
-                    "date": str(r["date"]) if r.get("date") else None,
-                    "user_id": r["user_id"],
-                    "user_name": full_name,
-                    "city": (r.get("user_city") or "").strip() or None,
-                    "status": r.get("status_code") or "planned",
-                    "status_label": r.get("status_label") or "Запланировано",
-                    "telegram": (r.get("user_telegram") or "").strip() or None,
-                    "vk": (r.get("user_vk") or "").strip() or None,
-                    "phone": r.get("user_phone"),
-                    "is_viewed": did in viewed,
-                    "is_favorite": did in favorites,
-                    "is_helping": did in helping and did not in helped,
-                    "is_helped": did in helped,
-                    "pending_completion_request": (did in completion_requested) and (did in helping and did not in helped),
-                    "favorites_count": favorites_count_by_dream.get(did, 0),
-                }
-                result.append(item)
-            if showcase_filter and user_id:
-                if showcase_filter == "new":
-                    result = [x for x in result if not x["is_viewed"]]
-                elif showcase_filter == "helping":
-                    result = [x for x in result if x["is_helping"]]
-                elif showcase_filter == "helped":
-                    result = [x for x in result if x["is_helped"]]
-                elif showcase_filter == "favorites":
-                    result = [x for x in result if x["is_favorite"]]
-                elif showcase_filter == "viewed":
-                    result = [x for x in result if x["is_viewed"]]
-            if user_id:
-                result.sort(key=lambda x: x["date"] or "", reverse=True)
-                result.sort(key=lambda x: x["is_viewed"])
+                flags = showcase_flags.from_rows(rows)
+                payload = {"dreams": [_showcase_item(r, flags) for r in rows], "counts": _showcase_favorites_counts(cur, user_id)}
+                return _showcase_apply_fields(payload, fields)
+            viewed_set = _showcase_viewed_set(cur, user_id)
+            if paged:
+                page_limit = _showcase_page_limit(limit)
+                page_sql, page_params = _showcase_page_sql(
+                    user_id, showcase_filter, after, page_limit, viewed_set, filters, contacts,
+                )
+                rows = []
+                if page_sql:
+                    cur.execute(page_sql, page_params)
+                    rows = cur.fetchall()
             else:
-                result.sort(key=lambda x: x["date"] or "", reverse=True)
-            # Счётчики: Новые, Помогаю, Помог, Избранные, Все
-            count_all = len(rows)
-            count_new = count_all - len(viewed) if user_id else count_all
-            count_helping = len([d for d in helping if d not in helped])
-            count_helped = len(helped)
-            count_favorites = len(favorites)
-            counts = {"new": count_new, "helping": count_helping, "helped": count_helped, "favorites": count_favorites, "all": count_all}
-            return {"dreams": result, "counts": counts}
+                cur.execute(*_showcase_all_sql(filters, user_id, viewed_set, contacts))
+                rows = cur.fetchall()
+        db.release()
+        if paged:
+            return _showcase_apply_fields(_showcase_page_payload(rows, page_limit), fields)
+        return _showcase_apply_fields(_showcase_payload(rows, user_id, showcase_filter), fields)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.release()
+
+
+# Поиск по публичным мечтам (dream_search.py): dreams.search_tsv (russian) + частичный GIN-индекс,
+# ранжирование ts_rank_cd, keyset по (rank, id). Без миграции mig_dreams_search — ILIKE, новые сверху.
+def _dream_search_ready() -> bool:
+    return schema_registry.has("dreams", dream_search.TSV_COLUMN)
+
+
+def _search_encode_cursor(rank: float, dream_id: int) -> str:
+    return page_cursor.encode([rank, dream_id])
+
+
+def _search_decode_cursor(cursor: str, detail: str = "Некорректный cursor поиска") -> Tuple[float, int]:
+    """(ранг / оценка последней карточки, её id); мусор — 400."""
+    try:
+        rank, dream_id = page_cursor.decode(cursor, 2)
+        return float(rank), int(dream_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail=detail)
+
+
+def _dreams_search_sql(
+    words: List[str], filters: "showcase_facets.Filters", after: Optional[Tuple[float, int]], limit: int,
+    user_id: Optional[int] = None, viewed: Optional["viewed_sets.ViewedSet"] = None,
+) -> Tuple[str, dict]:
+    """SELECT страницы поиска (limit + 1 строк): колонки карточки витрины + rank и отметки зрителя user_id."""
+    status_cols, status_join = _showcase_status_sql()
+    match, rank, params = dream_search.match_sql(_dream_search_ready(), words)
+    conds = ["COALESCE(d.is_public, true) = true", match]
+    facet_conds, facet_params = _showcase_facet_sql(filters)
+    conds += facet_conds
+    params.update(facet_params)
+    if after is not None:
+        conds.append("(" + rank + ", d.id) < (%(after_rank)s::real, %(after_id)s)")
+        params["after_rank"], params["after_id"] = after
+    params["lim"] = limit + 1
+    sql = """
+        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+               """ + status_cols + """,
+               """ + _showcase_author_cols() + _showcase_favorites_count_col() + """,
+               """ + rank + """ AS rank
+        FROM dreams d
+        JOIN users u ON u.id = d.user_id""" + status_join + """
+        WHERE """ + " AND ".join(conds) + """
+        ORDER BY rank DESC, d.id DESC
+        LIMIT %(lim)s
+    """
+    return _showcase_with_flags(sql, params, user_id, viewed, "p.rank DESC, p.id DESC")
+
+
+@app.get("/dreams/search")
+def search_dreams(
+    q: str,
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    city: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    db: LazyDb = Depends(lazy_db),
+):
+    """Поиск по витрине: текст мечты, имя и город автора (каждое слово — префикс). Фильтры — фасеты витрины
+    (status / category — коды справочников, city, price_min / price_max). Карточки и отметки зрителя (user_id) — как у GET /dreams/showcase; сортировка по
+    релевантности, страница до SHOWCASE_PAGE_MAX и next_cursor."""
+    words = dream_search.terms(q)
+    if not words:
+        raise HTTPException(status_code=400, detail="Пустой поисковый запрос")
+    filters = _showcase_filters(city, category, status, price_min, price_max)
+    after = _search_decode_cursor(cursor) if cursor else None
+    page_limit = _showcase_page_limit(limit)
+    _flush_dream_views_for(user_id)
+    try:
+        with db.cursor() as cur:
+            sql, params = _dreams_search_sql(words, filters, after, page_limit, user_id, _showcase_viewed_set(cur, user_id))
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        db.release()
+        page = rows[:page_limit]
+        flags = showcase_flags.from_rows(page)
+        next_cursor = None
+        if len(rows) > page_limit and page:
+            next_cursor = _search_encode_cursor(page[-1]["rank"], page[-1]["id"])
+        return {"dreams": [_showcase_item(r, flags) for r in page], "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.release()
+
+
+@app.get("/dreams/recommended")
+def get_dreams_recommended(
+    user_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    """Лента «Рекомендуем» для помощника: публичные мечты по убыванию оценки (город автора, категории из его избранного
+    и помощи, активность автора, счётчик избранного — recommendations.py). Оценки заранее посчитаны в
+    user_dream_recommendations; при первом запросе пользователя — считаются здесь. Карточки — как у GET /dreams/showcase
+    (+ score), страница до SHOWCASE_PAGE_MAX и next_cursor. Без миграции mig_user_recommendations — пустая лента."""
+    after = _search_decode_cursor(cursor, "Некорректный cursor ленты") if cursor else None
+    page_limit = _showcase_page_limit(limit)
+    if not _recommendations_ready():
+        return {"dreams": [], "next_cursor": None}
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if recommendations.ensure(cur, user_id, RECOMMEND_TOP_N, *_recommendations_schema()):
+                conn.commit()
+            status_cols, status_join = _showcase_status_sql()
+            params = {"uid": user_id, "lim": page_limit + 1}
+            if after is not None:
+                params["after_score"], params["after_id"] = after
+            sql, params = _showcase_with_flags("""
+                SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+                       """ + status_cols + """,
+                       """ + _showcase_author_cols() + _showcase_favorites_count_col() + """,
+                       r.score
+                FROM """ + recommendations.TABLE + """ r
+                JOIN dreams d ON d.id = r.dream_id
+                JOIN users u ON u.id = d.user_id""" + status_join + """
+                WHERE """ + recommendations.feed_where(after) + """
+                ORDER BY r.score DESC, r.dream_id DESC
+                LIMIT %(lim)s
+            """, params, user_id, _showcase_viewed_set(cur, user_id), "p.score DESC, p.id DESC")
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        conn.commit()
+        page = rows[:page_limit]
+        flags = showcase_flags.from_rows(page)
+        items = []
+        for r in page:
+            item = _showcase_item(r, flags)
+            item["score"] = round(float(r["score"]), 3)
+            items.append(item)
+        next_cursor = None
+        if len(rows) > page_limit and page:
+            next_cursor = _search_encode_cursor(page[-1]["score"], page[-1]["id"])
+        return {"dreams": items, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
     finally:
         _return_conn(conn)
 
@@ -2529,30 +3809,118 @@ def get_dream_contact(dream_id: int):
         _return_conn(conn)
 
 
+# Просмотры карточек витрины пишутся пачками: POST /dreams/{id}/view и POST /dreams/views складывают их
+# в память (view_buffer.py), фоновый поток раз в DREAM_VIEWS_FLUSH_SEC пишет накопленное одним
+# INSERT ... ON CONFLICT. Буфер в DREAM_VIEWS_MAX_PENDING записей сбрасывает заполнивший его запрос,
+# остаток — остановка приложения. DREAM_VIEWS_FLUSH_SEC=0 — запись сразу, в том же запросе.
+DREAM_VIEWS_FLUSH_SEC = float(os.getenv("DREAM_VIEWS_FLUSH_SEC") or 2)
+DREAM_VIEWS_MAX_PENDING = env_int("DREAM_VIEWS_MAX_PENDING", 5000)
+DREAM_VIEWS_BATCH_MAX = env_int("DREAM_VIEWS_BATCH_MAX", 200)
+dream_views = ViewBuffer(DREAM_VIEWS_MAX_PENDING)
+_dream_views_flush_lock = Lock()
+_dream_views_flusher_started = False
+
+
+def _flush_dream_views() -> int:
+    """Записать накопленные просмотры одной транзакцией (вместе с дельтами user_showcase_counters).
+    При ошибке партия возвращается в буфер, кроме ошибки данных (DataError): повтор упал бы так же и
+    держал бы буфер полным — такая партия отбрасывается. Возвращает число записанных просмотров."""
+    with _dream_views_flush_lock:
+        items = dream_views.drain()
+        if not items:
+            return 0
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                inserted = view_buffer.flush(cur, items)
+                if inserted and _showcase_counters_ready():
+                    showcase_counters.views_added(cur, inserted)
+                if inserted and _viewed_sets_ready():
+                    viewed_sets.views_added(cur, inserted)
+            conn.commit()
+            _metric_dream_views.inc(len(items), result="flushed")
+            return len(items)
+        except psycopg2.DataError as e:
+            if conn:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            _metric_dream_views.inc(len(items), result="dropped")
+            app_logger.warning("DREAM VIEWS flush of %d dropped on bad data: %s", len(items), e)
+            return 0
+        except Exception as e:
+            if conn:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            dropped = dream_views.requeue(items)
+            if dropped:
+                _metric_dream_views.inc(dropped, result="dropped")
+            app_logger.warning("DREAM VIEWS flush of %d failed (%d dropped): %s", len(items), dropped, e)
+            return 0
+        finally:
+            _return_conn(conn)
+
+
+def _flush_dream_views_for(user_id: Optional[int]) -> None:
+    """Перед чтением своей витрины: дописать свои просмотры из буфера (или дождаться идущей записи)."""
+    if user_id is not None and (dream_views.has_user(user_id) or _dream_views_flush_lock.locked()):
+        _flush_dream_views()
+
+
+def _dream_views_flusher_loop() -> None:
+    while True:
+        time.sleep(DREAM_VIEWS_FLUSH_SEC)
+        _flush_dream_views()
+
+
+def _start_dream_views_flusher() -> None:
+    global _dream_views_flusher_started
+    if _dream_views_flusher_started or DREAM_VIEWS_FLUSH_SEC <= 0:
+        return
+    _dream_views_flusher_started = True
+    threading.Thread(target=_dream_views_flusher_loop, name="dream-views-flusher", daemon=True).start()
+
+
+def _record_dream_views(user_id: int, dream_ids: List[int]) -> None:
+    _metric_dream_views.inc(len(dream_ids), result="buffered")
+    full = dream_views.add(user_id, dream_ids)
+    if full or not _dream_views_flusher_started:
+        _flush_dream_views()
+
+
+# id пользователя / мечты в пределах INT PostgreSQL: вне диапазона — 422, а не партия буфера, которая не запишется.
+_ViewId = conint(ge=1, le=view_buffer.INT_MAX)
+
+
+class DreamViewBody(BaseModel):
+    user_id: _ViewId
+
+
+class DreamViewsBody(BaseModel):
+    user_id: _ViewId
+    dream_ids: List[_ViewId]
+
+
+@app.post("/dreams/views")
+def record_dream_views(body: DreamViewsBody):
+    """Записать просмотры нескольких мечт разом (карточки, попавшие во вьюпорт). До DREAM_VIEWS_BATCH_MAX id."""
+    dream_ids = list(dict.fromkeys(body.dream_ids))
+    if len(dream_ids) > DREAM_VIEWS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Не больше {DREAM_VIEWS_BATCH_MAX} мечт за запрос")
+    if dream_ids:
+        _record_dream_views(body.user_id, dream_ids)
+    return {"ok": True}
+
+
 @app.post("/dreams/{dream_id}/view")
-def record_dream_view(dream_id: int, body: ShowcaseActionBody):
-    """Записать просмотр мечты (при появлении карточки во вьюпорте)."""
-    conn = None
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute(
-                """INSERT INTO user_dream_views (user_id, dream_id) VALUES (%s, %s)
-                   ON CONFLICT (user_id, dream_id) DO UPDATE SET viewed_at = NOW()""",
-                (body.user_id, dream_id),
-            )
-        conn.commit()
-        return {"ok": True}
-    except psycopg2.IntegrityError:
-        if conn:
-            conn.rollback()
-        raise HTTPException(status_code=404, detail="Мечта не найдена")
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        _return_conn(conn)
+def record_dream_view(dream_id: _ViewId, body: DreamViewBody):
+    """Записать просмотр мечты (при появлении карточки во вьюпорте). Пишется через тот же буфер, что и /dreams/views."""
+    _record_dream_views(body.user_id, [dream_id])
+    return {"ok": True}
 
 
 @app.post("/dreams/{dream_id}/favorite")
@@ -2567,7 +3935,17 @@ def add_dream_favorite(dream_id: int, body: ShowcaseActionBody):
                 (body.user_id, dream_id),
             )
             inserted = cur.fetchone()
+            if inserted and schema_registry.has("dreams", "favorites_count"):
+                # Счётчик витрины — в той же транзакции, что и строка избранного
+                cur.execute("UPDATE dreams SET favorites_count = favorites_count + 1 WHERE id = %s", (dream_id,))
+            if inserted and _showcase_counters_ready():
+                showcase_counters.bump_viewer(cur, body.user_id, dream_id, favorites=1)
+            if inserted:
+                # favorites_count есть в карточке анонимной витрины
+                _bump_showcase_version(cur, dream_ids=[dream_id])
+                _mark_recommendations(cur, [body.user_id])
         conn.commit()
+        showcase_cache.expire_version()
         if inserted:
             try:
                 with conn.cursor(cursor_factory=RealDictCursor) as cur2:
@@ -2604,8 +3982,21 @@ def remove_dream_favorite(dream_id: int, user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM user_dream_favorites WHERE user_id = %s AND dream_id = %s", (user_id, dream_id))
+            cur.execute(
+                "DELETE FROM user_dream_favorites WHERE user_id = %s AND dream_id = %s RETURNING id", (user_id, dream_id),
+            )
+            removed = cur.fetchone() is not None
+            if removed and schema_registry.has("dreams", "favorites_count"):
+                cur.execute(
+                    "UPDATE dreams SET favorites_count = GREATEST(favorites_count - 1, 0) WHERE id = %s", (dream_id,),
+                )
+            if removed and _showcase_counters_ready():
+                showcase_counters.bump_viewer(cur, user_id, dream_id, favorites=-1)
+            if removed:
+                _bump_showcase_version(cur, dream_ids=[dream_id])
+                _mark_recommendations(cur, [user_id])
         conn.commit()
+        showcase_cache.expire_version()
         return {"ok": True}
     except Exception as e:
         if conn:
@@ -2640,8 +4031,6 @@ def create_completion_request(dream_id: int, body: ShowcaseActionBody):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            _ensure_completion_request_table(cur)
-            conn.commit()
             cur.execute("SELECT id, user_id FROM dreams WHERE id = %s", (dream_id,))
             row = cur.fetchone()
             if not row:
@@ -2656,9 +4045,12 @@ def create_completion_request(dream_id: int, body: ShowcaseActionBody):
             cur.execute(
                 """INSERT INTO user_dream_completion_request (dream_id, helper_user_id, requested_at)
                    VALUES (%s, %s, NOW())
-                   ON CONFLICT (dream_id, helper_user_id) DO UPDATE SET requested_at = NOW()""",
+                   ON CONFLICT (dream_id, helper_user_id) DO UPDATE SET requested_at = NOW()
+                   RETURNING (xmax = 0) AS inserted""",
                 (dream_id, body.user_id),
             )
+            if cur.fetchone()["inserted"] and _showcase_counters_ready():
+                showcase_counters.completion_request_added(cur, body.user_id, dream_id)
             cur.execute("SELECT name, surname FROM users WHERE id = %s", (owner_id,))
             owner = cur.fetchone()
             owner_name = "Участник"
@@ -2747,7 +4139,6 @@ def get_dreams_notifications(user_id: int):
                     "_at": at_str,
                 })
             try:
-                ensure_buddy_alerts_schema(cur)
                 for bn in fetch_buddy_notifications(cur, user_id):
                     out.append({
                         "type": bn["type"],
@@ -2783,14 +4174,31 @@ def accept_completion(dream_id: int, body: AcceptCompletionBody):
                 raise HTTPException(status_code=404, detail="Мечта не найдена или вы не владелец")
             cur.execute("SELECT user_id FROM user_dream_help_intent WHERE dream_id = %s", (dream_id,))
             helpers = [r["user_id"] for r in cur.fetchall()]
+            counters = _showcase_counters_ready()
             for h in helpers:
-                cur.execute("INSERT INTO user_dream_helped (user_id, dream_id) VALUES (%s, %s) ON CONFLICT (user_id, dream_id) DO NOTHING", (h, dream_id))
+                cur.execute(
+                    "INSERT INTO user_dream_helped (user_id, dream_id) VALUES (%s, %s) ON CONFLICT (user_id, dream_id) DO NOTHING RETURNING id",
+                    (h, dream_id),
+                )
+                if cur.fetchone() and counters:
+                    # «Помогаю» -> «Помог» (кто уже был в «Помог», в helping не считался)
+                    showcase_counters.bump_viewer(cur, h, dream_id, helped=1, helping=-1)
                 cur.execute("DELETE FROM user_dream_help_intent WHERE user_id = %s AND dream_id = %s", (h, dream_id))
             cur.execute("DELETE FROM user_dream_completion_request WHERE dream_id = %s", (dream_id,))
+            requests_removed = cur.rowcount
+            if counters:
+                if helpers:
+                    showcase_counters.help_intents_removed(cur, dream_id)
+                if requests_removed:
+                    showcase_counters.completion_requests_removed(cur, dream_id)
+            _mark_recommendations(cur, helpers)
             if body.move_to_done is not False:
                 cur.execute("UPDATE dreams SET status_id = 3 WHERE id = %s", (dream_id,))
+                _bump_showcase_version(cur, dream_ids=[dream_id])
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             cur.execute("INSERT INTO dreams_log (dream_id, date, fulfilled_by_user_id) VALUES (%s, CURRENT_DATE, %s)", (dream_id, body.user_id))
         conn.commit()
+        showcase_cache.expire_version()
         return {"ok": True}
     except HTTPException:
         raise
@@ -2811,9 +4219,11 @@ def revision_completion(dream_id: int, body: ShowcaseActionBody):
         with conn.cursor() as cur:
             cur.execute("SELECT user_id FROM dreams WHERE id = %s", (dream_id,))
             row = cur.fetchone()
-            if not row or row[0] != body.user_id:
+            if not row or row["user_id"] != body.user_id:
                 raise HTTPException(status_code=404, detail="Мечта не найдена или вы не владелец")
             cur.execute("DELETE FROM user_dream_completion_request WHERE dream_id = %s", (dream_id,))
+            if cur.rowcount and _showcase_counters_ready():
+                showcase_counters.completion_requests_removed(cur, dream_id)
         conn.commit()
         return {"ok": True}
     except HTTPException:
@@ -2835,10 +4245,19 @@ def decline_help(dream_id: int, body: ShowcaseActionBody):
         with conn.cursor() as cur:
             cur.execute("SELECT user_id FROM dreams WHERE id = %s", (dream_id,))
             row = cur.fetchone()
-            if not row or row[0] != body.user_id:
+            if not row or row["user_id"] != body.user_id:
                 raise HTTPException(status_code=404, detail="Мечта не найдена или вы не владелец")
             cur.execute("DELETE FROM user_dream_completion_request WHERE dream_id = %s", (dream_id,))
-            cur.execute("DELETE FROM user_dream_help_intent WHERE dream_id = %s", (dream_id,))
+            requests_removed = cur.rowcount
+            cur.execute("DELETE FROM user_dream_help_intent WHERE dream_id = %s RETURNING user_id", (dream_id,))
+            helpers = [r["user_id"] for r in cur.fetchall()]
+            if _showcase_counters_ready():
+                if requests_removed:
+                    showcase_counters.completion_requests_removed(cur, dream_id)
+                if helpers:
+                    showcase_counters.helpers_released(cur, helpers, dream_id)
+                    showcase_counters.help_intents_removed(cur, dream_id)
+            _mark_recommendations(cur, helpers)
         conn.commit()
         return {"ok": True}
     except HTTPException:
@@ -2859,13 +4278,24 @@ def record_dream_helped(dream_id: int, body: ShowcaseActionBody):
         conn = get_db_connection()
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO user_dream_helped (user_id, dream_id) VALUES (%s, %s) ON CONFLICT (user_id, dream_id) DO NOTHING",
+                "INSERT INTO user_dream_helped (user_id, dream_id) VALUES (%s, %s) ON CONFLICT (user_id, dream_id) DO NOTHING RETURNING id",
                 (body.user_id, dream_id),
             )
+            helped_added = cur.fetchone() is not None
             cur.execute(
                 "DELETE FROM user_dream_help_intent WHERE user_id = %s AND dream_id = %s",
                 (body.user_id, dream_id),
             )
+            intent_removed = cur.rowcount > 0
+            if _showcase_counters_ready():
+                # helping считал намерение, только пока не было «Помог»
+                showcase_counters.bump_viewer(
+                    cur, body.user_id, dream_id, helped=int(helped_added), helping=-int(helped_added and intent_removed),
+                )
+                if intent_removed:
+                    showcase_counters.help_intents_removed(cur, dream_id)
+            if helped_added or intent_removed:
+                _mark_recommendations(cur, [body.user_id])
         conn.commit()
         return {"ok": True}
     except psycopg2.IntegrityError:
@@ -2888,7 +4318,17 @@ def revert_dream_helped(dream_id: int, user_id: int):
         conn = get_db_connection()
         with conn.cursor() as cur:
             cur.execute("DELETE FROM user_dream_helped WHERE user_id = %s AND dream_id = %s", (user_id, dream_id))
+            helped_removed = cur.rowcount > 0
             cur.execute("DELETE FROM user_dream_help_intent WHERE user_id = %s AND dream_id = %s", (user_id, dream_id))
+            intent_removed = cur.rowcount > 0
+            if _showcase_counters_ready():
+                showcase_counters.bump_viewer(
+                    cur, user_id, dream_id, helped=-int(helped_removed), helping=-int(intent_removed and not helped_removed),
+                )
+                if intent_removed:
+                    showcase_counters.help_intents_removed(cur, dream_id)
+            if helped_removed or intent_removed:
+                _mark_recommendations(cur, [user_id])
         conn.commit()
         return {"ok": True}
     except Exception as e:
@@ -2907,9 +4347,13 @@ def record_dream_help_intent(dream_id: int, body: ShowcaseActionBody):
         conn = get_db_connection()
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO user_dream_help_intent (user_id, dream_id) VALUES (%s, %s) ON CONFLICT (user_id, dream_id) DO NOTHING",
+                "INSERT INTO user_dream_help_intent (user_id, dream_id) VALUES (%s, %s) ON CONFLICT (user_id, dream_id) DO NOTHING RETURNING id",
                 (body.user_id, dream_id),
             )
+            if cur.fetchone():
+                if _showcase_counters_ready():
+                    showcase_counters.help_intent_added(cur, body.user_id, dream_id)
+                _mark_recommendations(cur, [body.user_id])
         conn.commit()
         return {"ok": True}
     except psycopg2.IntegrityError:
@@ -2925,125 +4369,438 @@ def record_dream_help_intent(dream_id: int, body: ShowcaseActionBody):
 
 
 # --- Эндпоинт 2: ПОЛУЧЕНИЕ МЕЧТ ПОЛЬЗОВАТЕЛЯ ---
+def _dreams_list_sql(where: str = "") -> str:
+    """SELECT мечт пользователя для GET /dreams под текущую схему (schema_registry): справочники статусов
+    и категорий подключаются, только если они есть; отсутствующие колонки — NULL (is_public — true).
+    where — дополнительное условие по d (дельта-синхронизация)."""
+    has_statuses = schema_registry.has_table("dreams_statuses") and schema_registry.has("dreams", "status_id")
+    has_categories = schema_registry.has_table("dreams_categories") and schema_registry.has("dreams", "category_id")
+    select = [
+        "d.id, d.dream",
+        schema_registry.cols("dreams", (
+            "deadline", "price", "status_id", "category_id", ("is_public", "true"), "rule_code", "settings",
+        ), alias="d"),
+        "s.code AS status_code, s.label_ru AS status_label, s.icon AS status_icon" if has_statuses
+        else "'planned' AS status_code, NULL AS status_label, NULL AS status_icon",
+        "c.code AS category_code, c.label_ru AS category_label, c.icon AS category_icon" if has_categories
+        else "NULL AS category_code, NULL AS category_label, NULL AS category_icon",
+    ]
+    joins = ""
+    if has_statuses:
+        joins += " LEFT JOIN dreams_statuses s ON d.status_id = s.id"
+    if has_categories:
+        joins += " LEFT JOIN dreams_categories c ON d.category_id = c.id"
+    return "SELECT " + ", ".join(select) + " FROM dreams d" + joins + " WHERE d.user_id = %s" + where + " ORDER BY d.id"
+
+
+_DREAMS_LOG_STATS_SQL = """
+    SELECT COUNT(DISTINCT dream_id) AS dreams_count, COUNT(*) AS times_count
+    FROM dreams_log WHERE dream_id = ANY(%s)
+"""
+_DREAMS_LOG_STATS_BY_USER_SQL = """
+    SELECT COUNT(DISTINCT dream_id) AS dreams_count, COUNT(*) AS times_count
+    FROM dreams_log WHERE dream_id IN (SELECT id FROM dreams WHERE user_id = %s)
+"""
+_FULFILLED_BY_ME_SQL = """
+    SELECT COUNT(*) AS n FROM dreams_log L JOIN dreams D ON D.id = L.dream_id
+    WHERE L.fulfilled_by_user_id = %s AND D.user_id != %s
+"""
+
+
+def _dreams_payload(dreams_rows, steps_by_dream, books_by_dream, log_stats, fulfilled_by_me) -> dict:
+    """Ответ GET /dreams: мечты + счётчики исполнения из dreams_log (строки _DREAMS_LOG_STATS_SQL / _FULFILLED_BY_ME_SQL)."""
+    dreams_fulfilled_by_me = (fulfilled_by_me or {}).get("n") or 0
+    if not dreams_rows:
+        return {"dreams": [], "dreams_fulfilled_count": 0, "dreams_fulfilled_times": 0, "dreams_fulfilled_by_me": dreams_fulfilled_by_me}
+    return {
+        "dreams": [_build_dream_item(row, steps_by_dream, books_by_dream) for row in dreams_rows],
+        "dreams_fulfilled_count": (log_stats or {}).get("dreams_count") or 0,
+        "dreams_fulfilled_times": (log_stats or {}).get("times_count") or 0,
+        "dreams_fulfilled_by_me": dreams_fulfilled_by_me,
+    }
+
+
+# Дельта-синхронизация GET /dreams (dreams_sync.py, _sql/mig_dreams_sync.sql): ответ несёт sync_token, запрос
+# с since=<token> возвращает только мечты, шаги и книги, изменённые после него, и id удалённых. Токен старше
+# DREAMS_SYNC_RETENTION_DAYS (столько живут записи об удалениях) — полный ответ с full: true.
+DREAMS_SYNC_RETENTION_DAYS = float(os.getenv("DREAMS_SYNC_RETENTION_DAYS") or 30)
+
+
+def _dreams_sync_ready() -> bool:
+    return (
+        schema_registry.has("dreams", dreams_sync.VERSION_COLUMN)
+        and schema_registry.has("dreams_steps", dreams_sync.VERSION_COLUMN)
+        and schema_registry.has_table(dreams_sync.TOMBSTONES)
+    )
+
+
+def _dreams_decode_since(since: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(версия, время выдачи) токена since; мусор — 400."""
+    if not since:
+        return None
+    try:
+        return dreams_sync.decode_token(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный since")
+
+
+def _dreams_delta_sql(step_fields: "fieldsets.Selection" = None) -> Tuple[str, str, Optional[str]]:
+    """SELECT изменённых мечт (параметры (user_id, since)), шагов и книг (%(uid)s, %(since)s) пользователя;
+    книги — None без dream_books. Книги мечты, которая изменилась (например, стала books_reading), отдаются все."""
+    own = "dream_id IN (SELECT d.id FROM dreams d WHERE d.user_id = %(uid)s"
+    dreams_sql = _dreams_list_sql(" AND d.row_version >= %s")
+    steps_sql = _steps_by_dream_sql(own + ") AND row_version >= %(since)s", step_fields)
+    books_changed = "row_version >= %(since)s OR " if schema_registry.has("dream_books", dreams_sync.VERSION_COLUMN) else ""
+    books_sql = _books_by_dream_sql(
+        own + " AND d.rule_code = 'books_reading') AND (" + books_changed
+        + own + " AND d.row_version >= %(since)s))"
+    )
+    return dreams_sql, steps_sql, books_sql
+
+
+def _dreams_delta(cur, user_id: int, since: int, step_fields: "fieldsets.Selection" = None) -> dict:
+    """Ответ GET /dreams?since=: мечты (без steps / books), шаги (с dream_id и sort_order — место в списке) и книги
+    (с dream_id) — изменённые, deleted — id удалённых; счётчики исполнения — всегда целиком."""
+    params = {"uid": user_id, "since": since}
+    dreams_sql, steps_sql, books_sql = _dreams_delta_sql(step_fields)
+    cur.execute(dreams_sql, (user_id, since))
+    dreams = []
+    for row in cur.fetchall():
+        item = _build_dream_item(row, {})
+        del item["steps"], item["books"]
+        dreams.append(item)
+    cur.execute(steps_sql, params)
+    steps = [dict(_step_row_to_dict(r), dream_id=r["dream_id"], sort_order=r.get("sort_order")) for r in cur.fetchall()]
+    books = []
+    if books_sql is not None:
+        cur.execute(books_sql, params)
+        books = [dict(b, dream_id=did) for did, items in _group_books(cur.fetchall()).items() for b in items]
+    cur.execute(dreams_sync.TOMBSTONES_SQL, (user_id, since))
+    deleted = dreams_sync.deleted(cur.fetchall())
+    log_stats = None
+    if schema_registry.has_table("dreams_log"):
+        cur.execute(_DREAMS_LOG_STATS_BY_USER_SQL, (user_id,))
+        log_stats = cur.fetchone()
+    fulfilled_by_me = None
+    if schema_registry.has("dreams_log", "fulfilled_by_user_id"):
+        cur.execute(_FULFILLED_BY_ME_SQL, (user_id, user_id))
+        fulfilled_by_me = cur.fetchone()
+    return {
+        "dreams": dreams,
+        "steps": steps,
+        "books": books,
+        "deleted": deleted,
+        "dreams_fulfilled_count": (log_stats or {}).get("dreams_count") or 0,
+        "dreams_fulfilled_times": (log_stats or {}).get("times_count") or 0,
+        "dreams_fulfilled_by_me": (fulfilled_by_me or {}).get("n") or 0,
+        "full": False,
+    }
+
+
+def _dreams_full(cur, user_id: int, fields: "fieldsets.Selection" = None, step_fields: "fieldsets.Selection" = None) -> dict:
+    """Полный ответ GET /dreams по курсору (sync). fields / step_fields — без запросов шагов и книг, если они
+    не выбраны, и только колонки выбранных полей шага."""
+    cur.execute(_dreams_list_sql(), (user_id,))
+    dreams_rows = cur.fetchall()
+    dream_ids = [r["id"] for r in dreams_rows]
+    dream_ids_books = [r["id"] for r in dreams_rows if r.get("rule_code") == "books_reading"]
+    steps_by_dream = _load_steps(cur, dream_ids, step_fields) if fieldsets.wants(fields, "steps") else {}
+    books_by_dream = _load_books(cur, dream_ids_books) if dream_ids_books and fieldsets.wants(fields, "books") else {}
+    log_stats = None
+    if dream_ids and schema_registry.has_table("dreams_log"):
+        cur.execute(_DREAMS_LOG_STATS_SQL, (dream_ids,))
+        log_stats = cur.fetchone()
+    fulfilled_by_me = None
+    if schema_registry.has("dreams_log", "fulfilled_by_user_id"):
+        cur.execute(_FULFILLED_BY_ME_SQL, (user_id, user_id))
+        fulfilled_by_me = cur.fetchone()
+    return _dreams_payload(dreams_rows, steps_by_dream, books_by_dream, log_stats, fulfilled_by_me)
+
+
+# Полный ответ GET /dreams, собранный в PostgreSQL (json_build_object / json_agg): один запрос, строка JSON
+# уходит клиенту как есть, без dict на каждый шаг и повторной сериализации. Поля и значения — как у
+# _build_dream_item / _step_row_to_dict / _group_books. Включается DREAMS_SQL_JSON=1.
+DREAMS_SQL_JSON = (os.getenv("DREAMS_SQL_JSON") or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _json_col(table: str, alias: str, column: str, default: str = "NULL") -> str:
+    """Выражение по колонке для json_build_object; нет колонки — default."""
+    return f"{alias}.{column}" if schema_registry.has(table, column) else default
+
+
+def _step_json_sql() -> str:
+    """json_build_object шага s — поля _step_row_to_dict."""
+    c = lambda column, default="NULL": _json_col("dreams_steps", "s", column, default)
+    return (
+        "json_build_object('id', s.id, 'title', s.title, 'completed', COALESCE(s.completed, false), "
+        f"'deadline', {c('deadline')}, "
+        f"'start_time', to_char({c('start_time', 'NULL::time')}, 'HH24:MI'), "
+        f"'end_time', to_char({c('end_time', 'NULL::time')}, 'HH24:MI'), "
+        f"'series_id', {c('series_id')}, 'series_index', {c('series_index')}, 'series_total', {c('series_total')}, "
+        f"'deleted', COALESCE({c('deleted', 'false')}, false), "
+        f"'plan_amount', {c('plan_amount')}::float8, 'fact_amount', {c('fact_amount')}::float8, "
+        f"'waived', COALESCE({c('waived', 'false')}, false))"
+    )
+
+
+def _book_json_sql() -> str:
+    """json_build_object книги b — поля _group_books."""
+    return (
+        "json_build_object('id', b.id, 'title', COALESCE(b.title, ''), 'author', b.author, "
+        "'status', COALESCE(NULLIF(b.status, ''), 'planned'), 'started_at', b.started_at, 'deadline', b.deadline, "
+        f"'finished_at', b.finished_at, 'linked_step_id', {_json_col('dream_books', 'b', 'linked_step_id')})"
+    )
+
+
+def _dreams_json_sql() -> str:
+    """Весь ответ GET /dreams пользователя %(uid)s одной строкой JSON (колонка body)."""
+    has_statuses = schema_registry.has_table("dreams_statuses") and schema_registry.has("dreams", "status_id")
+    has_categories = schema_registry.has_table("dreams_categories") and schema_registry.has("dreams", "category_id")
+    c = lambda column, default="NULL": _json_col("dreams", "d", column, default)
+    step_order = "s.sort_order, s.id" if schema_registry.has("dreams_steps", "sort_order") else "s.id"
+    if has_statuses:
+        status = "COALESCE(NULLIF(st.code, ''), 'planned')"
+        status_obj = (
+            "CASE WHEN NULLIF(st.code, '') IS NOT NULL THEN json_build_object("
+            "'id', d.status_id, 'code', st.code, 'label_ru', st.label_ru, 'icon', st.icon) END"
+        )
+    else:
+        status = "'planned'"
+        status_obj = f"json_build_object('id', {c('status_id')}, 'code', 'planned', 'label_ru', NULL, 'icon', NULL)"
+    if has_categories:
+        category = "NULLIF(ct.code, '')"
+        category_obj = (
+            "CASE WHEN COALESCE(d.category_id, 0) <> 0 AND NULLIF(ct.code, '') IS NOT NULL THEN json_build_object("
+            "'id', d.category_id, 'code', ct.code, 'label_ru', ct.label_ru, 'icon', ct.icon) END"
+        )
+    else:
+        category, category_obj = "NULL", "NULL"
+    books = "'[]'::json"
+    if schema_registry.has_table("dream_books"):
+        books = (
+            f"CASE WHEN {c('rule_code')} = 'books_reading' THEN COALESCE((SELECT json_agg(" + _book_json_sql()
+            + " ORDER BY COALESCE(b.started_at, b.deadline, '9999-12-31'), b.id) FROM dream_books b"
+            " WHERE b.dream_id = d.id), '[]'::json) ELSE '[]'::json END"
+        )
+    item = (
+        "json_build_object('id', d.id, 'title', regexp_replace(COALESCE(d.dream, ''), '^\\s+|\\s+$', '', 'g'), "
+        f"'dream', COALESCE(d.dream, ''), 'description', '', 'image_url', NULL, "
+        f"'status', {status}, 'status_id', {c('status_id')}, 'status_obj', {status_obj}, "
+        f"'deadline', {c('deadline')}, 'category', {category}, 'category_obj', {category_obj}, "
+        f"'price', {c('price')}, 'is_public', COALESCE({c('is_public', 'true')}, true), 'progress', 0, "
+        "'steps', COALESCE((SELECT json_agg(" + _step_json_sql() + f" ORDER BY {step_order})"
+        " FROM dreams_steps s WHERE s.dream_id = d.id), '[]'::json), "
+        f"'rule_code', {c('rule_code')}, 'settings', {c('settings')}, 'books', {books})"
+    )
+    joins = ""
+    if has_statuses:
+        joins += " LEFT JOIN dreams_statuses st ON d.status_id = st.id"
+    if has_categories:
+        joins += " LEFT JOIN dreams_categories ct ON d.category_id = ct.id"
+    log_count, log_times = "0", "0"
+    if schema_registry.has_table("dreams_log"):
+        log_count = "(SELECT COUNT(DISTINCT dream_id) FROM dreams_log WHERE dream_id IN (SELECT id FROM dreams WHERE user_id = %(uid)s))"
+        log_times = "(SELECT COUNT(*) FROM dreams_log WHERE dream_id IN (SELECT id FROM dreams WHERE user_id = %(uid)s))"
+    by_me = "0"
+    if schema_registry.has("dreams_log", "fulfilled_by_user_id"):
+        by_me = (
+            "(SELECT COUNT(*) FROM dreams_log L JOIN dreams D ON D.id = L.dream_id"
+            " WHERE L.fulfilled_by_user_id = %(uid)s AND D.user_id != %(uid)s)"
+        )
+    return (
+        "SELECT json_build_object("
+        "'dreams', COALESCE((SELECT json_agg(x.item ORDER BY x.id) FROM (SELECT d.id, " + item + " AS item"
+        " FROM dreams d" + joins + " WHERE d.user_id = %(uid)s) x), '[]'::json), "
+        f"'dreams_fulfilled_count', {log_count}, 'dreams_fulfilled_times', {log_times}, "
+        f"'dreams_fulfilled_by_me', {by_me})::text AS body"
+    )
+
+
+def _dreams_json_body(cur, user_id: int) -> bytes:
+    cur.execute(_dreams_json_sql(), {"uid": user_id})
+    return cur.fetchone()["body"].encode("utf-8")
+
+
+def _json_body_with(body: bytes, **extra) -> bytes:
+    """Дописывает ключи в JSON-объект body (готовые байты ответа) без разбора."""
+    if not extra:
+        return body
+    tail = json.dumps(extra, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body[:-1] + b"," + tail[1:]
+
+
+# Сводный режим GET /dreams?summary=1: у мечты вместо steps — steps_summary, посчитанный в SQL (всего, выполнено,
+# «не выполнено», удалено, ближайший дедлайн, шаги на сегодня). Полный список — GET /dreams/{id}/steps окном по
+# дедлайну и курсором. Первая отрисовка ЛК не растёт с историей серий (create_steps_batch — до 5000 шагов).
+def _step_expr(column: str, default: str) -> str:
+    """Выражение по колонке dreams_steps s (для условий и агрегатов); нет колонки — default."""
+    return "s." + column if schema_registry.has("dreams_steps", column) else default
+
+
+def _steps_summary_sql() -> str:
+    """Сводка шагов по мечтам пользователя (%(uid)s, %(today)s) одним GROUP BY."""
+    deleted = "COALESCE(" + _step_expr("deleted", "false") + ", false)"
+    waived = "COALESCE(" + _step_expr("waived", "false") + ", false)"
+    deadline = _step_expr("deadline", "NULL::date")
+    live = "NOT " + deleted
+    return f"""
+        SELECT s.dream_id,
+               COUNT(*) FILTER (WHERE {live}) AS total,
+               COUNT(*) FILTER (WHERE {live} AND COALESCE(s.completed, false)) AS completed,
+               COUNT(*) FILTER (WHERE {live} AND {waived}) AS waived,
+               COUNT(*) FILTER (WHERE {deleted}) AS deleted,
+               MIN({deadline}) FILTER (
+                   WHERE {live} AND NOT COALESCE(s.completed, false) AND NOT {waived} AND {deadline} >= %(today)s
+               ) AS next_deadline
+        FROM dreams_steps s
+        WHERE s.dream_id IN (SELECT id FROM dreams WHERE user_id = %(uid)s)
+        GROUP BY s.dream_id
+    """
+
+
+def _steps_today_sql(step_fields: "fieldsets.Selection" = None) -> Optional[str]:
+    """Шаги пользователя с дедлайном %(today)s (кроме удалённых); None — в схеме нет deadline."""
+    if not schema_registry.has("dreams_steps", "deadline"):
+        return None
+    where = "dream_id IN (SELECT id FROM dreams WHERE user_id = %(uid)s) AND deadline = %(today)s"
+    if schema_registry.has("dreams_steps", "deleted"):
+        where += " AND COALESCE(deleted, false) = false"
+    return _steps_by_dream_sql(where, step_fields)
+
+
+def _steps_summary_item(row, today_steps) -> dict:
+    """steps_summary мечты из строки _steps_summary_sql (None — у мечты нет шагов)."""
+    row = row or {}
+    dl = row.get("next_deadline")
+    return {
+        "total": row.get("total") or 0,
+        "completed": row.get("completed") or 0,
+        "waived": row.get("waived") or 0,
+        "deleted": row.get("deleted") or 0,
+        "next_deadline": str(dl) if dl else None,
+        "today": today_steps,
+    }
+
+
+def _dreams_summary(
+    cur, user_id: int, today: str, fields: "fieldsets.Selection" = None, step_fields: "fieldsets.Selection" = None,
+) -> dict:
+    """Ответ GET /dreams?summary=1: мечты с steps_summary вместо steps; книги и счётчики — как в полном."""
+    params = {"uid": user_id, "today": today}
+    cur.execute(_dreams_list_sql(), (user_id,))
+    dreams_rows = cur.fetchall()
+    dream_ids = [r["id"] for r in dreams_rows]
+    dream_ids_books = [r["id"] for r in dreams_rows if r.get("rule_code") == "books_reading"]
+    summary = {}
+    today_by_dream = {}
+    if dream_ids and fieldsets.wants(fields, "steps_summary"):
+        cur.execute(_steps_summary_sql(), params)
+        summary = {r["dream_id"]: r for r in cur.fetchall()}
+        today_sql = _steps_today_sql(step_fields)
+        if today_sql is not None:
+            cur.execute(today_sql, params)
+            today_by_dream = _group_steps(cur.fetchall())
+    books_by_dream = _load_books(cur, dream_ids_books) if dream_ids_books and fieldsets.wants(fields, "books") else {}
+    log_stats = None
+    if dream_ids and schema_registry.has_table("dreams_log"):
+        cur.execute(_DREAMS_LOG_STATS_SQL, (dream_ids,))
+        log_stats = cur.fetchone()
+    fulfilled_by_me = None
+    if schema_registry.has("dreams_log", "fulfilled_by_user_id"):
+        cur.execute(_FULFILLED_BY_ME_SQL, (user_id, user_id))
+        fulfilled_by_me = cur.fetchone()
+    payload = _dreams_payload(dreams_rows, {}, books_by_dream, log_stats, fulfilled_by_me)
+    for item in payload["dreams"]:
+        del item["steps"]
+        item["steps_summary"] = _steps_summary_item(summary.get(item["id"]), today_by_dream.get(item["id"], []))
+    payload["summary"] = True
+    payload["today"] = today
+    return payload
+
+
+def _dreams_fields(fields: Optional[str], step_fields: Optional[str]) -> Tuple["fieldsets.Selection", "fieldsets.Selection"]:
+    """(поля мечты, поля шага) GET /dreams. Без step_fields шаги берут тот же пресет, что и мечты (fields=card)."""
+    if not step_fields and (fields or "").strip() in fieldsets.PRESETS:
+        step_fields = fields
+    return _fields_or_400(fieldsets.DREAM, fields), _fields_or_400(fieldsets.STEP, step_fields, "step_fields")
+
+
+def _dreams_apply_fields(payload: dict, fields: "fieldsets.Selection", step_fields: "fieldsets.Selection") -> dict:
+    """Оставляет в ответе GET /dreams выбранные поля мечт и шагов (вложенных, на сегодня, шагов дельты)."""
+    if fields is None and step_fields is None:
+        return payload
+    dreams = []
+    for item in payload["dreams"]:
+        item = fieldsets.pick(item, fields)
+        if "steps" in item:
+            item["steps"] = [fieldsets.pick(st, step_fields) for st in item["steps"]]
+        if item.get("steps_summary"):
+            item["steps_summary"]["today"] = [fieldsets.pick(st, step_fields) for st in item["steps_summary"]["today"]]
+        dreams.append(item)
+    payload["dreams"] = dreams
+    if "steps" in payload:
+        payload["steps"] = [fieldsets.pick(st, step_fields, keep=("dream_id", "sort_order")) for st in payload["steps"]]
+    return payload
+
+
 @app.get("/dreams")
-def get_dreams(user_id: int, viewer_id: Optional[int] = None):
-    """Список мечт пользователя user_id. viewer_id: посторонний зритель — только при can_read по user_buddy_links (или legacy buddy_id)."""
-    conn = None
+def get_dreams(
+    request: Request, user_id: int, viewer_id: Optional[int] = None, since: Optional[str] = None, summary: bool = False,
+    local_date: Optional[str] = None, fields: Optional[str] = None, step_fields: Optional[str] = None,
+    db: LazyDb = Depends(lazy_db),
+):
+    """Список мечт пользователя user_id. viewer_id: посторонний зритель — только при can_read по user_buddy_links (или legacy buddy_id).
+    С миграцией mig_dreams_sync ответ несёт sync_token; since=<sync_token> — только изменения после него
+    (dreams без steps / books, steps, books, deleted: {dreams, steps, books}, full: false).
+    summary=1 — у мечт steps_summary вместо steps (шаги на сегодня — на local_date клиента, по умолчанию дата сервера);
+    полный список шагов — GET /dreams/{id}/steps. С since summary не действует.
+    При DREAMS_SQL_JSON=1 полный ответ собирает PostgreSQL (_dreams_json_sql) и он уходит готовыми байтами.
+    fields= — поля мечты (пресеты list / card / full или имена через запятую), step_fields= — поля шага
+    (по умолчанию — тот же пресет); невыбранные шаги и книги не читаются из БД.
+    С миграцией mig_user_data_version — слабый ETag по версии данных user_id и viewer_id, If-None-Match -> 304."""
+    after = _dreams_decode_since(since)
+    today = _parse_iso_date_or_400(local_date, "local_date") if local_date else date.today().isoformat()
+    dream_sel, step_sel = _dreams_fields(fields, step_fields)
+    extra = {}
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with db.cursor() as cur:
+            # доступ — до If-None-Match: иначе 304 / 200 без доступа выдают, менялись ли данные
             if viewer_id is not None and viewer_id != user_id:
                 if not _can_view_lk(cur, viewer_id, user_id):
                     raise HTTPException(status_code=403, detail="Нет доступа к мечтам этого пользователя")
-            dreams_rows = None
-            try:
-                cur.execute("""
-                    SELECT d.id, d.dream, d.deadline, d.price, d.status_id, d.category_id, d.is_public,
-                           d.rule_code, d.settings,
-                           s.code AS status_code, s.label_ru AS status_label, s.icon AS status_icon,
-                           c.code AS category_code, c.label_ru AS category_label, c.icon AS category_icon
-                    FROM dreams d
-                    LEFT JOIN dreams_statuses s ON d.status_id = s.id
-                    LEFT JOIN dreams_categories c ON d.category_id = c.id
-                    WHERE d.user_id = %s ORDER BY d.id
-                """, (user_id,))
-                dreams_rows = cur.fetchall()
-            except psycopg2.ProgrammingError:
-                conn.rollback()
-                try:
-                    cur.execute(
-                        "SELECT id, dream, deadline, price, status_id, category_id, is_public FROM dreams WHERE user_id = %s ORDER BY id",
-                        (user_id,),
-                    )
-                    dreams_rows = cur.fetchall()
-                    for r in dreams_rows:
-                        r["status_code"] = "planned"
-                        r["status_label"] = r["category_code"] = r["category_label"] = r["status_icon"] = r["category_icon"] = None
-                        if r.get("is_public") is None:
-                            r["is_public"] = True
-                        try:
-                            cur.execute("SELECT id, code, label_ru, icon FROM dreams_categories")
-                            cat_map = {row["id"]: dict(row) for row in cur.fetchall()}
-                            for r in dreams_rows:
-                                cid = r.get("category_id")
-                                if cid and cid in cat_map:
-                                    c = cat_map[cid]
-                                    r["category_code"] = c.get("code")
-                                    r["category_label"] = c.get("label_ru")
-                                    r["category_icon"] = c.get("icon")
-                        except psycopg2.ProgrammingError:
-                            pass
-                except psycopg2.ProgrammingError:
-                    conn.rollback()
-                    try:
-                        cur.execute(
-                            "SELECT id, dream, deadline FROM dreams WHERE user_id = %s ORDER BY id",
-                            (user_id,),
-                        )
-                        dreams_rows = [dict(r) for r in cur.fetchall()]
-                        for r in dreams_rows:
-                            r["price"] = r["status_id"] = r["category_id"] = None
-                            r["status_code"] = "planned"
-                            r["status_label"] = r["category_code"] = r["category_label"] = r["status_icon"] = r["category_icon"] = None
-                            if r.get("is_public") is None:
-                                r["is_public"] = True
-                    except psycopg2.ProgrammingError:
-                        conn.rollback()
-                        cur.execute("SELECT id, dream FROM dreams WHERE user_id = %s ORDER BY id", (user_id,))
-                        dreams_rows = [dict(r) for r in cur.fetchall()]
-                        for r in dreams_rows:
-                            r["deadline"] = r["price"] = r["status_id"] = r["category_id"] = None
-                            r["status_code"] = "planned"
-                            r["status_label"] = r["category_code"] = r["category_label"] = r["status_icon"] = r["category_icon"] = None
-                            r["is_public"] = True
-            if not dreams_rows:
-                dreams_fulfilled_by_me = 0
-                try:
-                    cur.execute("SELECT COUNT(*) AS n FROM dreams_log L JOIN dreams D ON D.id = L.dream_id WHERE L.fulfilled_by_user_id = %s AND D.user_id != %s", (user_id, user_id))
-                    dreams_fulfilled_by_me = cur.fetchone().get("n") or 0
-                except (psycopg2.ProgrammingError, AttributeError):
-                    pass
-                return {"dreams": [], "dreams_fulfilled_count": 0, "dreams_fulfilled_times": 0, "dreams_fulfilled_by_me": dreams_fulfilled_by_me}
-            dream_ids = [r["id"] for r in dreams_rows]
-            steps_by_dream = _load_steps(cur, dream_ids)
-            dream_ids_books = [r["id"] for r in dreams_rows if r.get("rule_code") == "books_reading"]
-            books_by_dream = _load_books(cur, dream_ids_books) if dream_ids_books else {}
-            result = [_build_dream_item(row, steps_by_dream, books_by_dream) for row in dreams_rows]
-            dreams_fulfilled_count = 0
-            dreams_fulfilled_times = 0
-            dreams_fulfilled_by_me = 0
-            try:
-                cur.execute("""
-                    SELECT COUNT(DISTINCT dream_id) AS dreams_count, COUNT(*) AS times_count
-                    FROM dreams_log WHERE dream_id = ANY(%s)
-                """, (dream_ids,))
-                row = cur.fetchone()
-                if row:
-                    dreams_fulfilled_count = row.get("dreams_count") or 0
-                    dreams_fulfilled_times = row.get("times_count") or 0
-                cur.execute("""
-                    SELECT COUNT(*) AS n FROM dreams_log L JOIN dreams D ON D.id = L.dream_id
-                    WHERE L.fulfilled_by_user_id = %s AND D.user_id != %s
-                """, (user_id, user_id))
-                row = cur.fetchone()
-                if row:
-                    dreams_fulfilled_by_me = row.get("n") or 0
-            except psycopg2.ProgrammingError:
-                pass
-            return {
-                "dreams": result,
-                "dreams_fulfilled_count": dreams_fulfilled_count,
-                "dreams_fulfilled_times": dreams_fulfilled_times,
-                "dreams_fulfilled_by_me": dreams_fulfilled_by_me,
-            }
+            etag = _user_etag(cur, request, user_id, viewer_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+            version = dreams_sync.snapshot(cur) if _dreams_sync_ready() else None
+            if version is not None and after is not None and not dreams_sync.expired(after[1], DREAMS_SYNC_RETENTION_DAYS):
+                payload = _dreams_delta(cur, user_id, after[0], step_sel)
+            elif summary and after is None:
+                payload = _dreams_summary(cur, user_id, today, dream_sel, step_sel)
+            elif DREAMS_SQL_JSON and dream_sel is None and step_sel is None:
+                payload = _dreams_json_body(cur, user_id)
+            else:
+                payload = _dreams_full(cur, user_id, dream_sel, step_sel)
+                if after is not None:
+                    extra["full"] = True
+        db.release()
+        if version is not None:
+            extra["sync_token"] = dreams_sync.encode_token(version)
+        if isinstance(payload, bytes):
+            return _with_user_etag(Response(content=_json_body_with(payload, **extra), media_type="application/json"), etag)
+        payload = _dreams_apply_fields(payload, dream_sel, step_sel)
+        payload.update(extra)
+        return _with_user_etag(payload, etag)
+    except HTTPException:
+        raise
     except psycopg2.ProgrammingError as e:
         raise HTTPException(
             status_code=500,
             detail=f"БД: таблица dreams отсутствует или другая ошибка. Текст: {e!s}"
         )
     except OperationalError as e:
-        _return_conn(conn, discard=True)
-        conn = None
+        # Прерван по statement_timeout / lock_timeout — соединение исправно, возвращаем в пул
+        db.release(discard=not isinstance(e, DB_TIMEOUT_ERRORS))
         raise HTTPException(status_code=503, detail=f"Ошибка соединения с БД (повторите попытку): {str(e)}")
     except Exception as e:
         import traceback
@@ -3052,32 +4809,47 @@ def get_dreams(user_id: int, viewer_id: Optional[int] = None):
             detail=f"Ошибка: {str(e)}\n{traceback.format_exc()}"
         )
     finally:
-        _return_conn(conn)
+        db.release()
 
 
-@app.get("/schedule")
-def get_schedule(user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None):
-    """Агрегатор расписания: обычные шаги + виртуальные строки от мечт типа «книги». Параметры date_from, date_to в формате YYYY-MM-DD; по умолчанию — сегодня."""
-    from datetime import date
+def _schedule_range(date_from: Optional[str], date_to: Optional[str]) -> Tuple[str, str]:
+    """Диапазон расписания: по умолчанию — сегодня; перепутанные границы меняются местами."""
     today = date.today().strftime("%Y-%m-%d")
     date_from = date_from or today
     date_to = date_to or today
     if date_from > date_to:
         date_from, date_to = date_to, date_from
-    conn = None
+    return date_from, date_to
+
+
+@app.get("/schedule")
+def get_schedule(
+    request: Request, user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None,
+    fields: Optional[str] = None, db: LazyDb = Depends(lazy_db),
+):
+    """Агрегатор расписания: обычные шаги + виртуальные строки от мечт типа «книги». Параметры date_from, date_to в формате YYYY-MM-DD; по умолчанию — сегодня.
+    fields — поля строки (fieldsets.SCHEDULE_ITEM, пресеты list / card / full); сужается только ответ — колонок и так мало.
+    ETag / 304 — как у GET /dreams."""
+    date_from, date_to = _schedule_range(date_from, date_to)
+    selected = _fields_or_400(fieldsets.SCHEDULE_ITEM, fields)
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with db.cursor() as cur:
+            etag = _user_etag(cur, request, user_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
             items = _schedule_items_standard(cur, user_id, date_from, date_to)
             # Спец-режим книг временно отключен: в расписании остаются только обычные шаги.
             if ENABLE_SPECIAL_BOOKS_IN_SCHEDULE:
                 items.extend(_schedule_items_books(cur, user_id, date_from, date_to))
-            items.sort(key=lambda x: (x["date"], x["title"]))
-            return {"items": items, "date_from": date_from, "date_to": date_to}
+        db.release()
+        items.sort(key=lambda x: (x["date"], x["title"]))
+        payload = {"items": [fieldsets.pick(item, selected) for item in items], "date_from": date_from, "date_to": date_to}
+        return _with_user_etag(payload, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        _return_conn(conn)
+        db.release()
 
 
 @app.post("/dreams")
@@ -3091,39 +4863,41 @@ def create_dream(body: DreamCreate):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            try:
-                if body.deadline:
-                    cur.execute(
-                        "INSERT INTO dreams (user_id, dream, status_id, category_id, date, deadline, price, is_public) VALUES (%s, %s, %s, %s, CURRENT_DATE, %s, %s, %s) RETURNING id, dream, deadline",
-                        (body.user_id, body.dream.strip(), status_id, body.category_id, body.deadline, body.price, is_public),
-                    )
-                else:
-                    cur.execute(
-                        "INSERT INTO dreams (user_id, dream, status_id, category_id, date, price, is_public) VALUES (%s, %s, %s, %s, CURRENT_DATE, %s, %s) RETURNING id, dream, deadline",
-                        (body.user_id, body.dream.strip(), status_id, body.category_id, body.price, is_public),
-                    )
-            except psycopg2.ProgrammingError:
-                conn.rollback()
-                code = _STATUS_ID_TO_CODE.get(status_id, "planned")
-                try:
-                    if body.deadline:
-                        cur.execute(
-                            "INSERT INTO dreams (user_id, dream, status, date, deadline) VALUES (%s, %s, %s, CURRENT_DATE, %s) RETURNING id, dream, deadline",
-                            (body.user_id, body.dream.strip(), code, body.deadline),
-                        )
-                    else:
-                        cur.execute(
-                            "INSERT INTO dreams (user_id, dream, status, date) VALUES (%s, %s, %s, CURRENT_DATE) RETURNING id, dream",
-                            (body.user_id, body.dream.strip(), code),
-                        )
-                except psycopg2.ProgrammingError:
-                    conn.rollback()
-                    cur.execute(
-                        "INSERT INTO dreams (user_id, dream, date) VALUES (%s, %s, CURRENT_DATE) RETURNING id, dream",
-                        (body.user_id, body.dream.strip()),
-                    )
+            cols = ["user_id", "dream"]
+            vals = [body.user_id, body.dream.strip()]
+            if schema_registry.has("dreams", "status_id"):
+                cols.append("status_id")
+                vals.append(status_id)
+            elif schema_registry.has("dreams", "status"):
+                # Старая схема: колонка status VARCHAR вместо status_id
+                cols.append("status")
+                vals.append(_STATUS_ID_TO_CODE.get(status_id, "planned"))
+            for col, val in (
+                ("category_id", body.category_id),
+                ("deadline", body.deadline or None),
+                ("price", body.price),
+                ("is_public", is_public),
+            ):
+                if schema_registry.has("dreams", col):
+                    cols.append(col)
+                    vals.append(val)
+            cur.execute(
+                "INSERT INTO dreams (" + ", ".join(cols) + ", date) VALUES ("
+                + ", ".join(["%s"] * len(cols)) + ", CURRENT_DATE) RETURNING id, dream, "
+                + schema_registry.col("dreams", "deadline"),
+                vals,
+            )
             row = cur.fetchone()
+            if _dream_search_ready():
+                dream_search.refresh(cur, dream_ids=[row["id"]])
+            now_public = is_public if schema_registry.has("dreams", "is_public") else True
+            if _showcase_counters_ready():
+                showcase_counters.dream_created(cur, now_public)
+            if now_public:
+                _bump_showcase_version(cur)
+            _bump_user_data_version(cur, user_ids=[body.user_id])
             conn.commit()
+            showcase_cache.expire_version()
             deadline = str(row["deadline"]) if row.get("deadline") else None
             return {"id": row["id"], "dream": row.get("dream") or body.dream, "status_id": status_id, "deadline": deadline}
     except HTTPException:
@@ -3145,110 +4919,64 @@ def update_dream(dream_id: int, body: DreamUpdate, user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT id FROM dreams WHERE id = %s AND user_id = %s", (dream_id, user_id))
-            if not cur.fetchone():
+            cur.execute(
+                "SELECT id, " + schema_registry.col("dreams", "status_id") + ", " + schema_registry.col("dreams", "is_public")
+                + " FROM dreams WHERE id = %s AND user_id = %s",
+                (dream_id, user_id),
+            )
+            r = cur.fetchone()
+            if not r:
                 raise HTTPException(status_code=404, detail="Мечта не найдена или не ваша")
-            old_status_id = None
-            try:
-                cur.execute("SELECT status_id FROM dreams WHERE id = %s", (dream_id,))
-                r = cur.fetchone()
-                if r:
-                    old_status_id = r.get("status_id")
-            except psycopg2.ProgrammingError:
-                pass
-            # Используем только переданные клиентом поля (чтобы category_id=null сохранялось)
+            old_status_id = r.get("status_id")
+            # Используем только переданные клиентом поля (чтобы category_id=null сохранялось).
+            # Колонки, которых нет в схеме БД (старая схема), пропускаем.
             payload = body.model_dump(exclude_unset=True)
             updates, vals = [], []
             if "dream" in payload and payload["dream"] is not None:
                 updates.append("dream = %s")
                 vals.append(payload["dream"].strip())
-            if "status_id" in payload:
-                updates.append("status_id = %s")
-                vals.append(payload["status_id"])
-            if "category_id" in payload:
-                updates.append("category_id = %s")
-                vals.append(payload["category_id"])
-            if "deadline" in payload:
-                updates.append("deadline = %s")
-                vals.append(payload["deadline"] if payload["deadline"] else None)
-            if "price" in payload:
-                updates.append("price = %s")
-                vals.append(payload["price"])
-            if "is_public" in payload:
-                updates.append("is_public = %s")
-                vals.append(payload["is_public"])
-            if "rule_code" in payload:
-                updates.append("rule_code = %s")
-                vals.append(payload["rule_code"] if payload["rule_code"] else None)
-            if "settings" in payload:
-                updates.append("settings = %s")
-                vals.append(Json(payload["settings"]) if payload["settings"] is not None else None)
+            for col in ("status_id", "category_id", "deadline", "price", "is_public", "rule_code", "settings"):
+                if col not in payload or not schema_registry.has("dreams", col):
+                    continue
+                val = payload[col]
+                if col in ("deadline", "rule_code"):
+                    val = val if val else None
+                elif col == "settings":
+                    val = Json(val) if val is not None else None
+                updates.append(col + " = %s")
+                vals.append(val)
             if not updates:
                 return {"ok": True}
             vals.append(dream_id)
-            try:
-                cur.execute(
-                    "UPDATE dreams SET " + ", ".join(updates) + " WHERE id = %s",
-                    vals,
-                )
-            except psycopg2.ProgrammingError:
-                conn.rollback()
-                # Повтор без category_id (если колонки нет в старой схеме)
-                updates_old, vals_old = [], []
-                if "dream" in payload and payload["dream"] is not None:
-                    updates_old.append("dream = %s")
-                    vals_old.append(payload["dream"].strip())
-                if "status_id" in payload:
-                    updates_old.append("status_id = %s")
-                    vals_old.append(payload["status_id"])
-                if "deadline" in payload:
-                    updates_old.append("deadline = %s")
-                    vals_old.append(payload["deadline"] if payload["deadline"] else None)
-                if "price" in payload:
-                    updates_old.append("price = %s")
-                    vals_old.append(payload["price"])
-                if "is_public" in payload:
-                    updates_old.append("is_public = %s")
-                    vals_old.append(payload["is_public"])
-                if updates_old:
-                    vals_old.append(dream_id)
-                    try:
-                        cur.execute(
-                            "UPDATE dreams SET " + ", ".join(updates_old) + " WHERE id = %s",
-                            vals_old,
-                        )
-                    except psycopg2.ProgrammingError:
-                        conn.rollback()
-                        updates_old2, vals_old2 = [], []
-                        if "dream" in payload and payload["dream"] is not None:
-                            updates_old2.append("dream = %s")
-                            vals_old2.append(payload["dream"].strip())
-                        if "deadline" in payload:
-                            updates_old2.append("deadline = %s")
-                            vals_old2.append(payload["deadline"] if payload["deadline"] else None)
-                        if "price" in payload:
-                            updates_old2.append("price = %s")
-                            vals_old2.append(payload["price"])
-                        if "is_public" in payload:
-                            updates_old2.append("is_public = %s")
-                            vals_old2.append(payload["is_public"])
-                        if updates_old2:
-                            vals_old2.append(dream_id)
-                            cur.execute(
-                                "UPDATE dreams SET " + ", ".join(updates_old2) + " WHERE id = %s",
-                                vals_old2,
-                            )
-            conn.commit()
-            # При переходе мечты в статус «выполнено» (3) — одна запись в dreams_log (единый источник для лендинга и кабинета)
-            if payload.get("status_id") == 3 and old_status_id != 3:
-                try:
-                    cur.execute(
-                        "INSERT INTO dreams_log (dream_id, date, fulfilled_by_user_id) VALUES (%s, CURRENT_DATE, %s)",
-                        (dream_id, user_id),
-                    )
-                    conn.commit()
-                except psycopg2.ProgrammingError:
-                    conn.rollback()
+            cur.execute(
+                "UPDATE dreams SET " + ", ".join(updates) + " WHERE id = %s",
+                vals,
+            )
+            if "dream" in payload and payload["dream"] is not None and _dream_search_ready():
+                dream_search.refresh(cur, dream_ids=[dream_id])
+            # NULL в is_public витрина считает публичной
+            was_public = r.get("is_public") is not False
+            now_public = was_public
+            if "is_public" in payload and schema_registry.has("dreams", "is_public"):
+                now_public = payload["is_public"] is not False
+                if was_public != now_public and _showcase_counters_ready():
+                    showcase_counters.dream_visibility_changed(cur, dream_id, now_public)
+                if now_public and not was_public and _viewed_sets_ready():
+                    # новая позиция в витрине (триггер showcase_key): прежние просмотры — на неё
+                    viewed_sets.published(cur, dream_id)
+            if was_public or now_public:
+                _bump_showcase_version(cur)
+            _bump_user_data_version(cur, dream_ids=[dream_id])
+            conn.commit()
+            showcase_cache.expire_version()
+            # При переходе мечты в статус «выполнено» (3) — одна запись в dreams_log (единый источник для лендинга и кабинета)
+            if payload.get("status_id") == 3 and old_status_id != 3 and schema_registry.has("dreams_log", "fulfilled_by_user_id"):
+                cur.execute(
+                    "INSERT INTO dreams_log (dream_id, date, fulfilled_by_user_id) VALUES (%s, CURRENT_DATE, %s)",
+                    (dream_id, user_id),
+                )
+                _bump_user_data_version(cur, dream_ids=[dream_id])
+                conn.commit()
             return {"ok": True}
     except HTTPException:
         raise
@@ -3267,9 +4995,15 @@ def delete_dream(dream_id: int, user_id: int, viewer_id: Optional[int] = None):
         conn = get_db_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             _resolve_editor_and_check_dream(cur, dream_id, user_id, viewer_id)
+            if _showcase_counters_ready():
+                # До DELETE: просмотры, избранное и помощь уйдут по CASCADE
+                showcase_counters.dreams_removed(cur, [dream_id], _has_completion_requests())
+            _bump_showcase_version(cur, dream_ids=[dream_id])
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             cur.execute("DELETE FROM dreams_steps WHERE dream_id = %s", (dream_id,))
             cur.execute("DELETE FROM dreams WHERE id = %s", (dream_id,))
             conn.commit()
+            showcase_cache.expire_version()
             return {"ok": True}
     except HTTPException:
         raise
@@ -3280,6 +5014,134 @@ def delete_dream(dream_id: int, user_id: int, viewer_id: Optional[int] = None):
         _return_conn(conn)
 
 
+DREAM_STEPS_PAGE_DEFAULT = 100
+DREAM_STEPS_PAGE_MAX = 500
+
+
+def _steps_encode_cursor(sort_order: Optional[int], step_id: int) -> str:
+    return page_cursor.encode([sort_order, step_id])
+
+
+def _steps_decode_cursor(cursor: str) -> Tuple[Optional[int], int]:
+    """(sort_order последнего шага страницы, None — без sort_order; его id); мусор — 400."""
+    try:
+        sort_order, step_id = page_cursor.decode(cursor, 2)
+        return (int(sort_order) if sort_order is not None else None), int(step_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Некорректный cursor шагов")
+
+
+def _dream_steps_page_sql(
+    date_from: Optional[str], date_to: Optional[str], deleted: Optional[bool],
+    after: Optional[Tuple[Optional[int], int]], fields: "fieldsets.Selection" = None,
+) -> Tuple[str, dict]:
+    """SELECT страницы шагов мечты %(dream_id)s (limit + 1 строк) в порядке показа — как _steps_by_dream_sql:
+    sort_order, id, шаги без sort_order в конце. Keyset: после шага с sort_order — остаток его порядка и все шаги
+    без sort_order (два подзапроса по индексу), после шага без него — только они. Окно по дедлайну: шаги без
+    дедлайна в него не попадают. Параметр %(lim)s ставит вызывающий."""
+    has_order = schema_registry.has("dreams_steps", "sort_order")
+    conds = ["dream_id = %(dream_id)s"]
+    params: dict = {}
+    if (date_from or date_to) and not schema_registry.has("dreams_steps", "deadline"):
+        conds.append("false")
+    elif date_from or date_to:
+        if date_from:
+            conds.append("deadline >= %(date_from)s")
+            params["date_from"] = date_from
+        if date_to:
+            conds.append("deadline <= %(date_to)s")
+            params["date_to"] = date_to
+    if deleted is not None and schema_registry.has("dreams_steps", "deleted"):
+        conds.append("COALESCE(deleted, false) = %(deleted)s")
+        params["deleted"] = deleted
+    elif deleted:
+        conds.append("false")
+    keysets = [None]
+    if after:
+        params["after_order"], params["after_id"] = after
+        if not has_order:
+            keysets = ["id > %(after_id)s"]
+        elif after[0] is None:
+            keysets = ["sort_order IS NULL AND id > %(after_id)s"]
+        else:
+            keysets = ["(sort_order, id) > (%(after_order)s, %(after_id)s)", "sort_order IS NULL"]
+    select = _step_select_sql(("sort_order" if has_order else "NULL::int") + " AS page_order, ", fields)
+    order = " ORDER BY " + ("sort_order, id" if has_order else "id") + " LIMIT %(lim)s"
+    parts = [
+        select + " WHERE " + " AND ".join(conds + ([keyset] if keyset else [])) + order
+        for keyset in keysets
+    ]
+    if len(parts) == 1:
+        return parts[0], params
+    sql = (
+        "SELECT * FROM (" + " UNION ALL ".join("(" + p + ")" for p in parts) + ") page"
+        " ORDER BY page_order, id LIMIT %(lim)s"
+    )
+    return sql, params
+
+
+@app.get("/dreams/{dream_id}/steps")
+def get_dream_steps(
+    dream_id: int,
+    user_id: int,
+    viewer_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    deleted: Optional[bool] = None,
+    limit: int = DREAM_STEPS_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: LazyDb = Depends(lazy_db),
+):
+    """Шаги мечты постранично (для GET /dreams?summary=1): порядок — как в GET /dreams, страница до
+    DREAM_STEPS_PAGE_MAX и next_cursor. date_from / date_to (YYYY-MM-DD, включительно) — окно по дедлайну;
+    deleted=false — только текущие, deleted=true — только удалённые. Читать может владелец или зритель
+    с can_read (viewer_id). fields= — поля шага (list / card / full или имена через запятую)."""
+    selected = _fields_or_400(fieldsets.STEP, fields)
+    if date_from:
+        date_from = _parse_iso_date_or_400(date_from, "date_from")
+    if date_to:
+        date_to = _parse_iso_date_or_400(date_to, "date_to")
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from позже date_to")
+    limit = max(1, min(int(limit or DREAM_STEPS_PAGE_DEFAULT), DREAM_STEPS_PAGE_MAX))
+    after = _steps_decode_cursor(cursor) if cursor else None
+    try:
+        with db.cursor() as cur:
+            cur.execute("SELECT user_id FROM dreams WHERE id = %s", (dream_id,))
+            dream = cur.fetchone()
+            if not dream:
+                raise HTTPException(status_code=404, detail="Мечта не найдена")
+            reader_id = viewer_id if viewer_id is not None else user_id
+            if not _can_view_lk(cur, reader_id, dream["user_id"]):
+                raise HTTPException(status_code=403, detail="Нет доступа к мечтам этого пользователя")
+            sql, params = _dream_steps_page_sql(date_from, date_to, deleted, after, selected)
+            params.update({"dream_id": dream_id, "lim": limit + 1})
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        db.release()
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = _steps_encode_cursor(page[-1]["page_order"], page[-1]["id"])
+        return {
+            "dream_id": dream_id,
+            "steps": [fieldsets.pick(_step_row_to_dict(r), selected) for r in page],
+            "next_cursor": next_cursor,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+    except HTTPException:
+        raise
+    except OperationalError as e:
+        db.release(discard=not isinstance(e, DB_TIMEOUT_ERRORS))
+        raise HTTPException(status_code=503, detail=f"Ошибка соединения с БД (повторите попытку): {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.release()
+
+
 @app.post("/dreams/{dream_id}/steps")
 def create_step(dream_id: int, body: StepCreate, user_id: int, viewer_id: Optional[int] = None):
     """Добавить шаг к мечте. Разрешено владельцу или бадди с buddy_trust=true."""
@@ -3296,18 +5158,24 @@ def create_step(dream_id: int, body: StepCreate, user_id: int, viewer_id: Option
             series_id = body.series_id.strip() if body.series_id else None
             series_index = body.series_index if body.series_index and body.series_index > 0 else None
             series_total = body.series_total if body.series_total and body.series_total > 0 else None
-            try:
-                cur.execute(
-                    "INSERT INTO dreams_steps (dream_id, title, completed, sort_order, deadline, start_time, end_time, series_id, series_index, series_total) VALUES (%s, %s, false, %s, %s, %s, %s, %s, %s, %s) RETURNING id, title, completed, deadline, start_time, end_time, series_id, series_index, series_total",
-                    (dream_id, body.title.strip(), next_order, deadline, start_time, end_time, series_id, series_index, series_total),
-                )
-            except psycopg2.ProgrammingError:
-                cur.connection.rollback()
-                cur.execute(
-                    "INSERT INTO dreams_steps (dream_id, title, completed, sort_order) VALUES (%s, %s, false, %s) RETURNING id, title, completed",
-                    (dream_id, body.title.strip(), next_order),
-                )
+            cols = ["dream_id", "title", "sort_order"]
+            vals = [dream_id, body.title.strip(), next_order]
+            opt = (
+                ("deadline", deadline), ("start_time", start_time), ("end_time", end_time),
+                ("series_id", series_id), ("series_index", series_index), ("series_total", series_total),
+            )
+            for col, val in opt:
+                if schema_registry.has("dreams_steps", col):
+                    cols.append(col)
+                    vals.append(val)
+            cur.execute(
+                "INSERT INTO dreams_steps (" + ", ".join(cols) + ", completed) VALUES ("
+                + ", ".join(["%s"] * len(cols)) + ", false) RETURNING id, title, completed, "
+                + schema_registry.cols("dreams_steps", [c for c, _ in opt]),
+                vals,
+            )
             row = cur.fetchone()
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             dl = row.get("deadline")
             return {
@@ -3428,6 +5296,7 @@ def create_steps_batch(dream_id: int, body: StepBatchCreate, user_id: int, viewe
                 rows,
                 template="(%s, %s, false, %s, %s, %s, %s, %s, %s, %s)",
             )
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             return {
                 "created": len(rows),
@@ -3541,6 +5410,7 @@ def create_finance_steps(dream_id: int, body: FinanceStepsCreate, user_id: int,
                     "deadline": row["deadline"],
                     "plan_amount": float(row["plan_amount"]) if row.get("plan_amount") is not None else None,
                 })
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             return {"created": len(steps_out), "steps": steps_out}
     except HTTPException:
@@ -3573,58 +5443,49 @@ def update_step(dream_id: int, step_id: int, body: StepUpdate, user_id: int, vie
             patch_fields = set(body.model_dump(exclude_unset=True).keys())
 
             updates, vals = [], []
+
+            def _set(col, val):
+                # Колонки, которых нет в старой схеме, молча пропускаем (как раньше делал fallback-UPDATE).
+                if schema_registry.has("dreams_steps", col):
+                    updates.append(col + " = %s")
+                    vals.append(val)
+
             if body.title is not None:
-                updates.append("title = %s")
-                vals.append(body.title.strip())
+                _set("title", body.title.strip())
             if body.completed is not None and body.waived is not True:
-                updates.append("completed = %s")
-                vals.append(body.completed)
+                _set("completed", body.completed)
             if body.deadline is not None and scope != "all_series":
-                updates.append("deadline = %s")
-                vals.append(body.deadline if body.deadline else None)
+                _set("deadline", body.deadline if body.deadline else None)
             if body.start_time is not None:
-                updates.append("start_time = %s")
-                vals.append(body.start_time if body.start_time else None)
+                _set("start_time", body.start_time if body.start_time else None)
             if body.end_time is not None:
-                updates.append("end_time = %s")
-                vals.append(body.end_time if body.end_time else None)
+                _set("end_time", body.end_time if body.end_time else None)
             if body.series_id is not None:
-                updates.append("series_id = %s")
-                vals.append(body.series_id.strip() if body.series_id else None)
+                _set("series_id", body.series_id.strip() if body.series_id else None)
             if body.series_index is not None:
-                updates.append("series_index = %s")
-                vals.append(body.series_index if body.series_index and body.series_index > 0 else None)
+                _set("series_index", body.series_index if body.series_index and body.series_index > 0 else None)
             if body.series_total is not None:
-                updates.append("series_total = %s")
-                vals.append(body.series_total if body.series_total and body.series_total > 0 else None)
+                _set("series_total", body.series_total if body.series_total and body.series_total > 0 else None)
             if body.deleted is not None:
-                updates.append("deleted = %s")
-                vals.append(body.deleted)
+                _set("deleted", body.deleted)
             if body.fact_amount is not None:
-                updates.append("fact_amount = %s")
-                vals.append(body.fact_amount)
-            if body.waived is True:
-                updates.append("waived = true")
-                updates.append("completed = false")
-            elif body.waived is False:
-                updates.append("waived = false")
-
-            cur_step = None
-            for _sql in (
-                """SELECT id, series_id, title, deadline, start_time, end_time, completed, deleted, waived
-                   FROM dreams_steps WHERE id = %s AND dream_id = %s""",
-                """SELECT id, series_id, title, deadline, start_time, end_time, completed, deleted, false AS waived
-                   FROM dreams_steps WHERE id = %s AND dream_id = %s""",
-            ):
-                try:
-                    cur.execute(_sql, (step_id, dream_id))
-                    cur_step = cur.fetchone()
-                    break
-                except psycopg2.ProgrammingError:
-                    try:
-                        cur.connection.rollback()
-                    except Exception:
-                        pass
+                _set("fact_amount", body.fact_amount)
+            if schema_registry.has("dreams_steps", "waived"):
+                if body.waived is True:
+                    updates.append("waived = true")
+                    updates.append("completed = false")
+                elif body.waived is False:
+                    updates.append("waived = false")
+
+            cur.execute(
+                "SELECT id, title, completed, "
+                + schema_registry.cols("dreams_steps", (
+                    "series_id", "deadline", "start_time", "end_time", ("deleted", "false"), ("waived", "false"),
+                ))
+                + " FROM dreams_steps WHERE id = %s AND dream_id = %s",
+                (step_id, dream_id),
+            )
+            cur_step = cur.fetchone()
             if not cur_step:
                 raise HTTPException(status_code=404, detail="Шаг не найден")
             old_deadline = cur_step.get("deadline")
@@ -3662,47 +5523,21 @@ def update_step(dream_id: int, step_id: int, body: StepUpdate, user_id: int, vie
             if not updates:
                 if note_trim:
                     _insert_step_event_safe(cur, step_id, dream_id, editor_id, "comment", note_trim)
+                    _bump_user_data_version(cur, dream_ids=[dream_id])
                     conn.commit()
-                    try:
-                        cur.execute(
-                            """SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time,
-                               series_id, series_index, series_total, deleted, plan_amount, fact_amount, waived
-                               FROM dreams_steps WHERE id = %s AND dream_id = %s""",
-                            (step_id, dream_id),
-                        )
-                        one = cur.fetchone()
-                        if one:
-                            return {"ok": True, "step": _step_row_to_dict(one)}
-                    except psycopg2.ProgrammingError:
-                        pass
+                    cur.execute(_step_select_sql() + " WHERE id = %s AND dream_id = %s", (step_id, dream_id))
+                    one = cur.fetchone()
+                    if one:
+                        return {"ok": True, "step": _step_row_to_dict(one)}
                     return {"ok": True}
                 conn.commit()
                 return {"ok": True}
 
             multi_row = "ANY(" in where_sql
-            try:
-                cur.execute(
-                    "UPDATE dreams_steps SET " + ", ".join(updates) + " WHERE " + where_sql,
-                    vals + where_vals,
-                )
-            except psycopg2.ProgrammingError:
-                cur.connection.rollback()
-                updates_old, vals_old = [], []
-                if body.title is not None:
-                    updates_old.append("title = %s")
-                    vals_old.append(body.title.strip())
-                if body.completed is not None:
-                    updates_old.append("completed = %s")
-                    vals_old.append(body.completed)
-                if body.deleted is not None:
-                    updates_old.append("deleted = %s")
-                    vals_old.append(body.deleted)
-                if updates_old:
-                    vals_old.extend([step_id, dream_id])
-                    cur.execute(
-                        "UPDATE dreams_steps SET " + ", ".join(updates_old) + " WHERE id = %s AND dream_id = %s",
-                        vals_old,
-                    )
+            cur.execute(
+                "UPDATE dreams_steps SET " + ", ".join(updates) + " WHERE " + where_sql,
+                vals + where_vals,
+            )
             if body.waived is True:
                 if note_trim:
                     _insert_step_event_safe(cur, step_id, dream_id, editor_id, "waived", note_trim)
@@ -3738,6 +5573,8 @@ def update_step(dream_id: int, step_id: int, body: StepUpdate, user_id: int, vie
                 and not multi_row
             )
             if trigger_success_100:
+                # Уведомления бадди не должны откатывать само обновление шага
+                cur.execute("SAVEPOINT sp_fan_out")
                 try:
                     cur.execute(
                         "SELECT deadline FROM dreams_steps WHERE id = %s AND dream_id = %s",
@@ -3746,25 +5583,21 @@ def update_step(dream_id: int, step_id: int, body: StepUpdate, user_id: int, vie
                     dl_row = cur.fetchone()
                     dl_iso = _deadline_iso_db(dl_row.get("deadline")) if dl_row else None
                     if dl_iso:
-                        ensure_buddy_alerts_schema(cur)
-                        fan_out_steps_success_100(cur, owner_id, date.fromisoformat(dl_iso))
+                        fan_out_steps_success_100(
+                            cur, owner_id, date.fromisoformat(dl_iso),
+                            has_waived=schema_registry.has("dreams_steps", "waived"),
+                        )
+                    cur.execute("RELEASE SAVEPOINT sp_fan_out")
                 except Exception:
-                    pass
+                    cur.execute("ROLLBACK TO SAVEPOINT sp_fan_out")
 
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             if not multi_row:
-                try:
-                    cur.execute(
-                        """SELECT dream_id, id, title, completed, sort_order, deadline, start_time, end_time,
-                           series_id, series_index, series_total, deleted, plan_amount, fact_amount, waived
-                           FROM dreams_steps WHERE id = %s AND dream_id = %s""",
-                        (step_id, dream_id),
-                    )
-                    one = cur.fetchone()
-                    if one:
-                        return {"ok": True, "step": _step_row_to_dict(one)}
-                except psycopg2.ProgrammingError:
-                    pass
+                cur.execute(_step_select_sql() + " WHERE id = %s AND dream_id = %s", (step_id, dream_id))
+                one = cur.fetchone()
+                if one:
+                    return {"ok": True, "step": _step_row_to_dict(one)}
             return {"ok": True}
     except HTTPException:
         raise
@@ -3789,29 +5622,18 @@ def _ensure_diary_journal_bucket(cur, user_id: int) -> Tuple[int, int]:
     if row:
         dream_id = int(row["id"])
     else:
-        try:
-            cur.execute(
-                """INSERT INTO dreams (user_id, dream, status_id, date, is_public, rule_code)
-                   VALUES (%s, %s, 2, CURRENT_DATE, false, %s) RETURNING id""",
-                (user_id, "Дневник", DIARY_JOURNAL_RULE_CODE),
-            )
-        except psycopg2.ProgrammingError:
-            cur.connection.rollback()
-            cur.execute(
-                "INSERT INTO dreams (user_id, dream, status, date, is_public) VALUES (%s, %s, %s, CURRENT_DATE, false) RETURNING id",
-                (user_id, "Дневник", "in_progress"),
-            )
-            dream_row = cur.fetchone()
-            dream_id = int(dream_row["id"])
-            try:
-                cur.execute(
-                    "UPDATE dreams SET rule_code = %s WHERE id = %s",
-                    (DIARY_JOURNAL_RULE_CODE, dream_id),
-                )
-            except psycopg2.ProgrammingError:
-                cur.connection.rollback()
+        if schema_registry.has("dreams", "status_id"):
+            status_col, status_val = "status_id", 2
         else:
-            dream_id = int(cur.fetchone()["id"])
+            status_col, status_val = "status", "in_progress"
+        cur.execute(
+            "INSERT INTO dreams (user_id, dream, " + status_col + ", date, is_public, rule_code)"
+            " VALUES (%s, %s, %s, CURRENT_DATE, false, %s) RETURNING id",
+            (user_id, "Дневник", status_val, DIARY_JOURNAL_RULE_CODE),
+        )
+        dream_id = int(cur.fetchone()["id"])
+        if _dream_search_ready():
+            dream_search.refresh(cur, dream_ids=[dream_id])
     cur.execute(
         """SELECT id FROM dreams_steps
            WHERE dream_id = %s AND title = %s AND COALESCE(deleted, false) = false
@@ -3826,18 +5648,14 @@ def _ensure_diary_journal_bucket(cur, user_id: int) -> Tuple[int, int]:
         (dream_id,),
     )
     next_order = cur.fetchone()["next_order"]
-    try:
-        cur.execute(
-            """INSERT INTO dreams_steps (dream_id, title, completed, sort_order, deleted)
-               VALUES (%s, %s, false, %s, false) RETURNING id""",
-            (dream_id, DIARY_JOURNAL_STEP_TITLE, next_order),
-        )
-    except psycopg2.ProgrammingError:
-        cur.connection.rollback()
-        cur.execute(
-            "INSERT INTO dreams_steps (dream_id, title, completed, sort_order) VALUES (%s, %s, false, %s) RETURNING id",
-            (dream_id, DIARY_JOURNAL_STEP_TITLE, next_order),
-        )
+    cur.execute(
+        "INSERT INTO dreams_steps (dream_id, title, completed, sort_order"
+        + (", deleted" if schema_registry.has("dreams_steps", "deleted") else "")
+        + ") VALUES (%s, %s, false, %s"
+        + (", false" if schema_registry.has("dreams_steps", "deleted") else "")
+        + ") RETURNING id",
+        (dream_id, DIARY_JOURNAL_STEP_TITLE, next_order),
+    )
     return dream_id, int(cur.fetchone()["id"])
 
 
@@ -3858,6 +5676,7 @@ def create_diary_free_entry(body: DiaryFreeEntryBody, user_id: int):
             inserted = _insert_journal_event_safe(
                 cur, step_id, dream_id, user_id, msg, linked_dream_ids, linked_step_ids
             )
+            _bump_user_data_version(cur, user_ids=[user_id])
             conn.commit()
             return {
                 "ok": True,
@@ -3877,87 +5696,87 @@ def create_diary_free_entry(body: DiaryFreeEntryBody, user_id: int):
         _return_conn(conn)
 
 
+def _step_events_sql(fields: "fieldsets.Selection" = None) -> str:
+    """Лента дневника шагов владельца (%s user_id, %s limit) без «удачных» событий.
+    fields — разобранный fields=: без message / step_title / связей — без их колонок."""
+    cols = ["e.id", "e.step_id", "e.dream_id", "e.event_type", "e.created_at"]
+    if fieldsets.wants(fields, "message"):
+        cols.append("e.message")
+    if fieldsets.wants(fields, "step_title"):
+        cols.append("s.title AS step_title")
+    if fieldsets.wants(fields, "linked_dream_ids", "linked_step_ids", "linked_dream_titles", "linked_step_titles"):
+        cols.append(schema_registry.cols("dreams_steps_events", ("linked_dream_ids", "linked_step_ids"), alias="e"))
+    return (
+        "SELECT " + ", ".join(cols) + """
+           FROM dreams_steps_events e
+           JOIN dreams d ON d.id = e.dream_id
+           JOIN dreams_steps s ON s.id = e.step_id
+           WHERE d.user_id = %s
+            AND e.event_type NOT IN ('completed', 'series_completed')
+           ORDER BY e.created_at DESC
+           LIMIT %s"""
+    )
+
+
+def _json_id_list(v) -> List[int]:
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except Exception:
+            v = []
+    return [int(x) for x in (v or []) if x]
+
+
+def _step_event_item(r) -> dict:
+    return {
+        "id": r["id"],
+        "step_id": r["step_id"],
+        "dream_id": r["dream_id"],
+        "event_type": r["event_type"],
+        "message": r.get("message"),
+        "created_at": r["created_at"].isoformat() if r.get("created_at") else None,
+        "step_title": (r.get("step_title") or "").strip(),
+        "linked_dream_ids": _json_id_list(r.get("linked_dream_ids")),
+        "linked_step_ids": _json_id_list(r.get("linked_step_ids")),
+    }
+
+
 @app.get("/steps/events")
-def list_step_events(user_id: int, limit: int = 100, viewer_id: Optional[int] = None):
-    """Дневник событий по шагам (мечты владельца user_id). viewer_id: кто смотрит, если это бадди (как GET /dreams)."""
+def list_step_events(
+    request: Request, user_id: int, limit: int = 100, viewer_id: Optional[int] = None, fields: Optional[str] = None,
+    db: LazyDb = Depends(lazy_db),
+):
+    """Дневник событий по шагам (мечты владельца user_id). viewer_id: кто смотрит, если это бадди (как GET /dreams).
+    fields — поля события (fieldsets.STEP_EVENT, пресеты list / card / full); без linked_*_titles — без запросов названий.
+    ETag / 304 — как у GET /dreams."""
     lim = max(1, min(int(limit or 100), 500))
-    conn = None
+    selected = _fields_or_400(fieldsets.STEP_EVENT, fields)
+    titles = fieldsets.wants(selected, "linked_dream_titles", "linked_step_titles")
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with db.cursor() as cur:
+            # доступ — до If-None-Match: иначе 304 / 200 без доступа выдают, менялись ли данные
             if viewer_id is not None and viewer_id != user_id:
                 if not _can_view_lk(cur, viewer_id, user_id):
                     raise HTTPException(status_code=403, detail="Нет доступа к дневнику этого пользователя")
-            try:
-                cur.execute(
-                    """SELECT e.id, e.step_id, e.dream_id, e.event_type, e.message, e.created_at,
-                              s.title AS step_title, e.linked_dream_ids, e.linked_step_ids
-                       FROM dreams_steps_events e
-                       JOIN dreams d ON d.id = e.dream_id
-                       JOIN dreams_steps s ON s.id = e.step_id
-                       WHERE d.user_id = %s
-                        AND e.event_type NOT IN ('completed', 'series_completed')
-                       ORDER BY e.created_at DESC
-                       LIMIT %s""",
-                    (user_id, lim),
-                )
-                rows = cur.fetchall()
-            except psycopg2.ProgrammingError:
-                try:
-                    cur.connection.rollback()
-                    cur.execute(
-                        """SELECT e.id, e.step_id, e.dream_id, e.event_type, e.message, e.created_at, s.title AS step_title
-                           FROM dreams_steps_events e
-                           JOIN dreams d ON d.id = e.dream_id
-                           JOIN dreams_steps s ON s.id = e.step_id
-                           WHERE d.user_id = %s
-                            AND e.event_type NOT IN ('completed', 'series_completed')
-                           ORDER BY e.created_at DESC
-                           LIMIT %s""",
-                        (user_id, lim),
-                    )
-                    rows = cur.fetchall()
-                except psycopg2.ProgrammingError:
-                    return {"events": []}
-            out = []
-            for r in rows:
-                ld = r.get("linked_dream_ids")
-                ls = r.get("linked_step_ids")
-                if isinstance(ld, str):
-                    try:
-                        import json as _json
-
-                        ld = _json.loads(ld)
-                    except Exception:
-                        ld = []
-                if isinstance(ls, str):
-                    try:
-                        import json as _json
-
-                        ls = _json.loads(ls)
-                    except Exception:
-                        ls = []
-                out.append(
-                    {
-                        "id": r["id"],
-                        "step_id": r["step_id"],
-                        "dream_id": r["dream_id"],
-                        "event_type": r["event_type"],
-                        "message": r["message"],
-                        "created_at": r["created_at"].isoformat() if r.get("created_at") else None,
-                        "step_title": (r.get("step_title") or "").strip(),
-                        "linked_dream_ids": [int(x) for x in (ld or []) if x],
-                        "linked_step_ids": [int(x) for x in (ls or []) if x],
-                    }
-                )
-            out = _enrich_event_link_titles(cur, out)
-            return {"events": out}
+            etag = _user_etag(cur, request, user_id, viewer_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+            if not schema_registry.has_table("dreams_steps_events"):
+                return {"events": []}
+            cur.execute(_step_events_sql(selected), (user_id, lim))
+            out = [_step_event_item(r) for r in cur.fetchall()]
+            dream_rows, step_rows = _load_event_link_titles(cur, out) if titles else ([], [])
+        db.release()
+        if titles:
+            out = _apply_event_link_titles(out, dream_rows, step_rows)
+        return _with_user_etag({"events": [fieldsets.pick(ev, selected) for ev in out]}, etag)
     except HTTPException:
         raise
     except Exception:
         return {"events": []}
     finally:
-        _return_conn(conn)
+        db.release()
 
 
 def _fetch_step_event_row(cur, event_id: int, user_id: int):
@@ -4002,6 +5821,7 @@ def update_step_event(event_id: int, body: DiaryEventUpdate, user_id: int):
                     "UPDATE dreams_steps_events SET message = %s WHERE id = %s AND user_id = %s",
                     (msg, event_id, user_id),
                 )
+            _bump_user_data_version(cur, dream_ids=[row["dream_id"]])
             conn.commit()
             return {"ok": True, "id": event_id}
     except HTTPException:
@@ -4025,6 +5845,7 @@ def delete_step_event(event_id: int, user_id: int):
             if not row:
                 raise HTTPException(status_code=404, detail="Запись не найдена")
             cur.execute("DELETE FROM dreams_steps_events WHERE id = %s AND user_id = %s", (event_id, user_id))
+            _bump_user_data_version(cur, dream_ids=[row["dream_id"]])
             conn.commit()
             return {"ok": True}
     except HTTPException:
@@ -4083,6 +5904,7 @@ def create_dream_book(dream_id: int, body: DreamBookCreate, user_id: int, viewer
                     ),
                 )
             row = cur.fetchone()
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             return {
                 "id": row["id"],
@@ -4169,6 +5991,7 @@ def update_dream_book(dream_id: int, book_id: int, body: DreamBookUpdate, user_i
                 )
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Книга не найдена")
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             # Одна строка dream_books: не трогаем другие книги. Несколько книг могут иметь один и тот же linked_step_id.
             book_out = None
@@ -4336,6 +6159,7 @@ def delete_dream_book(dream_id: int, book_id: int, user_id: int, viewer_id: Opti
             cur.execute("DELETE FROM dream_books WHERE id = %s AND dream_id = %s", (book_id, dream_id))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Книга не найдена")
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             return {"ok": True}
     except HTTPException:
@@ -4366,6 +6190,7 @@ def upsert_dream_book_log(dream_id: int, book_id: int, body: DreamBookLogCreate,
                                                              pages_read = COALESCE(EXCLUDED.pages_read, dream_books_log.pages_read)""",
                 (book_id, body.date, body.minutes_spent, body.pages_read),
             )
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             return {"ok": True}
     except psycopg2.ProgrammingError as e:
@@ -4390,6 +6215,7 @@ def delete_dream_book_log(dream_id: int, book_id: int, date: str, user_id: int,
             if not cur.fetchone():
                 raise HTTPException(status_code=404, detail="Книга не найдена")
             cur.execute("DELETE FROM dream_books_log WHERE book_id = %s AND date = %s", (book_id, date))
+            _bump_user_data_version(cur, dream_ids=[dream_id])
             conn.commit()
             return {"ok": True}
     except psycopg2.ProgrammingError as e:
@@ -4869,6 +6695,23 @@ def roadmap_delete(item_id: int):
     finally:
         _return_conn(conn)
 
+@app.post("/admin/schema/refresh")
+def admin_refresh_schema():
+    """Перечитать схему БД в schema_registry (после ручной миграции мимо run_migrate.py)."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        schema_registry.load(conn)
+        return schema_registry.snapshot()
+    finally:
+        _return_conn(conn)
+
+@app.get("/metrics")
+def metrics():
+    """Метрики в формате Prometheus: пул БД (занятость, ожидание выдачи, отброшенные), латентность и время БД по маршрутам."""
+    return PlainTextResponse(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 # --- Админ API (схема БД: name, surname) ---
 @app.get("/admin/users")
 def admin_list_users():
@@ -4938,7 +6781,12 @@ def admin_update_user(user_id: int, user: UserUpdate):
                 WHERE id = %s RETURNING id, name, surname, phone, city
             """, (name, surname, phone, city, password_hash, user_id))
             updated = cur.fetchone()
+            if _dream_search_ready() and (name, surname, city) != (row["name"], row["surname"], row["city"]):
+                dream_search.refresh(cur, user_id=user_id)
+            _bump_showcase_version(cur, user_id=user_id)
+            _bump_user_data_version(cur, user_ids=[user_id], viewers=True)
             conn.commit()
+            showcase_cache.expire_version()
             return {"id": updated["id"], "full_name": _full_name(updated), "phone": updated["phone"], "city": updated["city"]}
     except psycopg2.IntegrityError:
         conn.rollback()
@@ -4965,10 +6813,360 @@ def admin_delete_user(user_id: int):
     try:
         conn = get_db_connection()
         with conn.cursor() as cur:
+            if schema_registry.has("dreams", "favorites_count"):
+                # Избранное пользователя уйдёт по CASCADE — снимаем его со счётчиков чужих мечт
+                cur.execute("""
+                    UPDATE dreams d SET favorites_count = GREATEST(d.favorites_count - 1, 0)
+                    FROM user_dream_favorites f
+                    WHERE f.user_id = %s AND f.dream_id = d.id AND d.user_id <> %s
+                """, (user_id, user_id))
+            if _showcase_counters_ready():
+                # Мечты пользователя уйдут по CASCADE; его помощь чужим мечтам (in_progress / pending_completion владельцев) поправит сверка
+                cur.execute("SELECT id FROM dreams WHERE user_id = %s", (user_id,))
+                showcase_counters.dreams_removed(cur, [r["id"] for r in cur.fetchall()], _has_completion_requests())
+            _bump_showcase_version(cur, user_id=user_id)
+            _bump_user_data_version(cur, user_ids=[user_id], viewers=True)
             cur.execute("DELETE FROM users WHERE id = %s RETURNING id", (user_id,))
             if cur.fetchone() is None:
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
         conn.commit()
+        showcase_cache.expire_version()
         return {"message": "Пользователь удалён"}
     finally:
-        _return_conn(conn)
\ No newline at end of file
+        _return_conn(conn)
+
+# ---------------------------------------------------------------------------
+# Async-режим (DB_ASYNC=1): async def-варианты горячих read-эндпоинтов на пуле psycopg 3 (db_async.py).
+# SQL и сборка ответа — общие с sync-обработчиками (_dreams_list_sql, _showcase_payload, ...), поэтому
+# ответы совпадают байт в байт; переключатель нужен, чтобы сравнить throughput и p99 под одной нагрузкой.
+# Остальные эндпоинты (и редкие ветки этих: витрина favorites/in_progress, книги в расписании) — sync.
+# ---------------------------------------------------------------------------
+async_db_pool = None
+
+
+def _schema_bootstrap_via_sync_pool() -> None:
+    _return_conn(get_db_connection())
+
+
+@asynccontextmanager
+async def _async_cursor():
+    """Курсор из async-пула с актуальным schema_registry (перечитывается после run_migrate.py).
+    Соединение занято, пока открыт блок: сборку ответа делаем уже после выхода из него (как LazyDb.release())."""
+    if not _schema_bootstrap_done and time.time() - _schema_bootstrap_failed_at >= _SCHEMA_BOOTSTRAP_RETRY_SEC:
+        # Bootstrap схемы не прошёл при старте — повторяем его на sync-соединении (как get_db_connection()).
+        await run_in_threadpool(_schema_bootstrap_via_sync_pool)
+    async with async_db_pool.connection() as conn:
+        checked_out_at = time.perf_counter()
+        try:
+            async with conn.cursor() as cur:
+                if schema_registry.stale():
+                    stamp = schema_registry.stamp_mtime()
+                    await cur.execute(LOAD_SQL)
+                    schema_registry.apply_rows(await cur.fetchall(), stamp)
+                yield cur
+        finally:
+            observe_conn_hold(time.perf_counter() - checked_out_at)
+
+
+async def _can_view_lk_async(cur, viewer_id: int, subject_id: int) -> bool:
+    if viewer_id == subject_id:
+        return True
+    await cur.execute(_CAN_VIEW_LK_SQL, (viewer_id, subject_id, viewer_id, subject_id))
+    row = await cur.fetchone()
+    return bool(row and row.get("ok"))
+
+
+async def _user_etag_async(cur, request: Request, *user_ids: Optional[int]) -> Optional[str]:
+    """Как _user_etag."""
+    if not _user_version_on():
+        return None
+    ids = _user_etag_ids(user_ids)
+    await cur.execute(_USER_VERSION_SQL, (ids,))
+    return _user_data_etag(request, await cur.fetchall(), ids)
+
+
+async def get_dreams_async(
+    request: Request, user_id: int, viewer_id: Optional[int] = None, since: Optional[str] = None, summary: bool = False,
+    local_date: Optional[str] = None, fields: Optional[str] = None, step_fields: Optional[str] = None,
+):
+    """Async-вариант GET /dreams (since, summary и fields — через sync-обработчик)."""
+    if since or summary or fields or step_fields:
+        return await run_in_threadpool(
+            _call_with_lazy_db, get_dreams, request, user_id, viewer_id, since, summary, local_date, fields, step_fields,
+        )
+    try:
+        async with _async_cursor() as cur:
+            # доступ — до If-None-Match: иначе 304 / 200 без доступа выдают, менялись ли данные
+            if viewer_id is not None and viewer_id != user_id:
+                if not await _can_view_lk_async(cur, viewer_id, user_id):
+                    raise HTTPException(status_code=403, detail="Нет доступа к мечтам этого пользователя")
+            etag = await _user_etag_async(cur, request, user_id, viewer_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+            version = None
+            if _dreams_sync_ready():
+                await cur.execute(dreams_sync.SNAPSHOT_SQL)
+                version = (await cur.fetchone())["version"]
+            if DREAMS_SQL_JSON:
+                await cur.execute(_dreams_json_sql(), {"uid": user_id})
+                body = (await cur.fetchone())["body"].encode("utf-8")
+                if version is not None:
+                    body = _json_body_with(body, sync_token=dreams_sync.encode_token(version))
+                return _with_user_etag(Response(content=body, media_type="application/json"), etag)
+            await cur.execute(_dreams_list_sql(), (user_id,))
+            dreams_rows = await cur.fetchall()
+            dream_ids = [r["id"] for r in dreams_rows]
+            dream_ids_books = [r["id"] for r in dreams_rows if r.get("rule_code") == "books_reading"]
+            steps_by_dream = {}
+            if dream_ids:
+                await cur.execute(_steps_by_dream_sql(), (dream_ids,))
+                steps_by_dream = _group_steps(await cur.fetchall())
+            books_by_dream = {}
+            books_sql = _books_by_dream_sql()
+            if dream_ids_books and books_sql is not None:
+                await cur.execute(books_sql, (dream_ids_books,))
+                books_by_dream = _group_books(await cur.fetchall())
+            log_stats = None
+            if dream_ids and schema_registry.has_table("dreams_log"):
+                await cur.execute(_DREAMS_LOG_STATS_SQL, (dream_ids,))
+                log_stats = await cur.fetchone()
+            fulfilled_by_me = None
+            if schema_registry.has("dreams_log", "fulfilled_by_user_id"):
+                await cur.execute(_FULFILLED_BY_ME_SQL, (user_id, user_id))
+                fulfilled_by_me = await cur.fetchone()
+        payload = _dreams_payload(dreams_rows, steps_by_dream, books_by_dream, log_stats, fulfilled_by_me)
+        if version is not None:
+            payload["sync_token"] = dreams_sync.encode_token(version)
+        return _with_user_etag(payload, etag)
+    except HTTPException:
+        raise
+    except async_errors() as e:
+        raise HTTPException(status_code=503, detail=f"Ошибка соединения с БД (повторите попытку): {str(e)}")
+    except psycopg.ProgrammingError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"БД: таблица dreams отсутствует или другая ошибка. Текст: {e!s}"
+        )
+    except Exception as e:
+        import traceback
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка: {str(e)}\n{traceback.format_exc()}"
+        )
+
+
+async def get_dreams_showcase_async(
+    request: Request,
+    user_id: Optional[int] = None,
+    showcase_filter: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    city: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    fields: Optional[str] = None,
+):
+    """Async-вариант GET /dreams/showcase (ветки favorites / in_progress — через sync-обработчик)."""
+    filters = _showcase_filters(city, category, status, price_min, price_max)
+    selected = _fields_or_400(fieldsets.SHOWCASE_CARD, fields)
+    if user_id is None and _showcase_cache_on():
+        if cursor:
+            _showcase_decode_cursor(cursor)
+        return await _showcase_anonymous_async(request, limit, cursor, filters, selected)
+    if user_id is not None and (dream_views.has_user(user_id) or _dream_views_flush_lock.locked()):
+        await run_in_threadpool(_flush_dream_views_for, user_id)
+    return await _showcase_build_async(user_id, showcase_filter, limit, cursor, filters, selected)
+
+
+async def _showcase_anonymous_async(
+    request: Request, limit: Optional[int], cursor: Optional[str], filters: Optional["showcase_facets.Filters"] = None,
+    fields: "fieldsets.Selection" = None,
+) -> Response:
+    """Как _showcase_anonymous: версия читается из того же async-пула, что и данные (до них)."""
+    key = _showcase_cache_key(limit, cursor, filters, fields)
+    version, reload = showcase_cache.version()
+    if reload:
+        version = None
+        try:
+            async with _async_cursor() as cur:
+                await cur.execute(_SHOWCASE_VERSION_SQL)
+                row = await cur.fetchone()
+            version = row["version"] if row else None
+        finally:
+            showcase_cache.set_version(version)
+    if version is None:
+        return await _showcase_build_async(None, None, limit, cursor, filters, fields)
+    snap, build = showcase_cache.lookup(key, version)
+    if not build:
+        return _showcase_snapshot_response(request, snap, "hit" if snap.version == version else "stale")
+    try:
+        payload = await _showcase_build_async(None, None, limit, cursor, filters, fields)
+    except BaseException:
+        showcase_cache.abandon(key)
+        raise
+    return _showcase_snapshot_response(request, showcase_cache.store(key, version, _showcase_snapshot_body(payload)), "miss")
+
+
+async def _showcase_build_async(
+    user_id: Optional[int], showcase_filter: Optional[str], limit: Optional[int], cursor: Optional[str],
+    filters: Optional["showcase_facets.Filters"] = None, fields: "fieldsets.Selection" = None,
+):
+    if showcase_filter in ("favorites", "in_progress") and user_id:
+        return await run_in_threadpool(
+            _call_with_lazy_db, _showcase_build, user_id, showcase_filter, limit, cursor, fields=fields,
+        )
+    paged = limit is not None or cursor is not None
+    contacts = fieldsets.wants(fields, "telegram", "vk", "phone")
+    after = _showcase_decode_cursor(cursor) if cursor else None
+    try:
+        async with _async_cursor() as cur:
+            viewed_set = None
+            if user_id and _viewed_sets_ready():
+                await cur.execute(viewed_sets.LOAD_SQL, (user_id,))
+                viewed_set = viewed_sets.parse(await cur.fetchone())
+            if paged:
+                page_limit = _showcase_page_limit(limit)
+                page_sql, page_params = _showcase_page_sql(
+                    user_id, showcase_filter, after, page_limit, viewed_set, filters, contacts,
+                )
+                rows = []
+                if page_sql:
+                    await cur.execute(page_sql, page_params)
+                    rows = await cur.fetchall()
+            else:
+                await cur.execute(*_showcase_all_sql(filters, user_id, viewed_set, contacts))
+                rows = await cur.fetchall()
+        if paged:
+            return _showcase_apply_fields(_showcase_page_payload(rows, page_limit), fields)
+        return _showcase_apply_fields(_showcase_payload(rows, user_id, showcase_filter), fields)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_schedule_async(
+    request: Request, user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Async-вариант GET /schedule (с ENABLE_SPECIAL_BOOKS_IN_SCHEDULE — через sync-обработчик)."""
+    if ENABLE_SPECIAL_BOOKS_IN_SCHEDULE:
+        return await run_in_threadpool(_call_with_lazy_db, get_schedule, request, user_id, date_from, date_to, fields)
+    date_from, date_to = _schedule_range(date_from, date_to)
+    selected = _fields_or_400(fieldsets.SCHEDULE_ITEM, fields)
+    try:
+        async with _async_cursor() as cur:
+            etag = await _user_etag_async(cur, request, user_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+            await cur.execute(_schedule_standard_sql(), (user_id, date_from, date_to))
+            rows = await cur.fetchall()
+        items = [_schedule_step_item(r) for r in rows]
+        items.sort(key=lambda x: (x["date"], x["title"]))
+        payload = {"items": [fieldsets.pick(item, selected) for item in items], "date_from": date_from, "date_to": date_to}
+        return _with_user_etag(payload, etag)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def list_step_events_async(
+    request: Request, user_id: int, limit: int = 100, viewer_id: Optional[int] = None, fields: Optional[str] = None,
+):
+    """Async-вариант GET /steps/events."""
+    lim = max(1, min(int(limit or 100), 500))
+    selected = _fields_or_400(fieldsets.STEP_EVENT, fields)
+    titles = fieldsets.wants(selected, "linked_dream_titles", "linked_step_titles")
+    try:
+        async with _async_cursor() as cur:
+            # доступ — до If-None-Match: иначе 304 / 200 без доступа выдают, менялись ли данные
+            if viewer_id is not None and viewer_id != user_id:
+                if not await _can_view_lk_async(cur, viewer_id, user_id):
+                    raise HTTPException(status_code=403, detail="Нет доступа к дневнику этого пользователя")
+            etag = await _user_etag_async(cur, request, user_id, viewer_id)
+            not_modified = _user_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+            if not schema_registry.has_table("dreams_steps_events"):
+                return {"events": []}
+            await cur.execute(_step_events_sql(selected), (user_id, lim))
+            out = [_step_event_item(r) for r in await cur.fetchall()]
+            dream_ids, step_ids = _event_link_ids(out) if titles else ([], [])
+            dream_rows: list = []
+            step_rows: list = []
+            if dream_ids:
+                await cur.execute(_LINK_DREAM_TITLES_SQL, (dream_ids,))
+                dream_rows = await cur.fetchall()
+            if step_ids:
+                await cur.execute(_LINK_STEP_TITLES_SQL, (step_ids,))
+                step_rows = await cur.fetchall()
+        if titles:
+            out = _apply_event_link_titles(out, dream_rows, step_rows)
+        return _with_user_etag({"events": [fieldsets.pick(ev, selected) for ev in out]}, etag)
+    except HTTPException:
+        raise
+    except Exception:
+        return {"events": []}
+
+
+async def users_me_async(user_id: int):
+    """Async-вариант GET /users/me."""
+    try:
+        async with _async_cursor() as cur:
+            await cur.execute(_users_me_sql(), (user_id,))
+            user_data = await cur.fetchone()
+            if user_data is None:
+                raise HTTPException(status_code=404, detail="Пользователь не найден")
+            buddy_row = None
+            if user_data.get("buddy_id"):
+                await cur.execute(_BUDDY_CARD_SQL, (user_data["buddy_id"],))
+                buddy_row = await cur.fetchone()
+        return _users_me_payload(user_data, buddy_row)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+_ASYNC_ROUTES = {
+    ("/dreams", "GET"): get_dreams_async,
+    ("/dreams/showcase", "GET"): get_dreams_showcase_async,
+    ("/schedule", "GET"): get_schedule_async,
+    ("/steps/events", "GET"): list_step_events_async,
+    ("/users/me", "GET"): users_me_async,
+}
+
+
+def _install_async_routes() -> None:
+    """Подменяет sync-маршруты на async-варианты на тех же позициях (порядок матчинга путей не меняется)."""
+    routes = app.router.routes
+    for i, route in enumerate(routes):
+        if not isinstance(route, APIRoute):
+            continue
+        for method in route.methods:
+            endpoint = _ASYNC_ROUTES.get((route.path, method))
+            if endpoint is None:
+                continue
+            routes[i] = APIRoute(route.path, endpoint, methods=[method], name=route.name)
+            break
+
+
+if async_requested() and os.getenv("DB_HOST"):
+    if async_available():
+        _install_async_routes()
+
+        @app.on_event("startup")
+        async def async_pool_startup():
+            global async_db_pool
+            async_db_pool = await open_async_pool((DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS))
+
+        @app.on_event("shutdown")
+        async def async_pool_shutdown():
+            global async_db_pool
+            await close_async_pool(async_db_pool)
+            async_db_pool = None
+    else:
+        print("⚠ DB_ASYNC=1, но psycopg[binary,pool] не установлен — работаем в sync-режиме")
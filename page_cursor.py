@@ -0,0 +1,28 @@
+"""
+Opaque page tokens: a short JSON list, base64url-encoded without padding.
+
+Used for the keyset cursors of the showcase, search, feed and per-dream steps pages
+(main.py) and for the delta-sync token (dreams_sync). Callers unpack and validate the
+values; decode() only guarantees a list of the expected length.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, List, Optional
+
+
+def encode(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode(token: str, length: Optional[int] = None) -> List[Any]:
+    """Values of encode(); ValueError on garbage or (with length) a list of another size."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception as e:
+        raise ValueError("bad page token") from e
+    if not isinstance(values, list) or (length is not None and len(values) != length):
+        raise ValueError("bad page token")
+    return values
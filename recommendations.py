@@ -0,0 +1,200 @@
+"""
+"Recommended for you" feed for helpers (GET /dreams/recommended).
+
+Scores are precomputed per user into user_dream_recommendations (top_n rows per user),
+so the feed is an index range read on (user_id, score DESC, dream_id DESC). A public
+dream gets a score from four signals (weights below):
+
+  city       the dream owner lives in the helper's city;
+  category   share of the helper's favorites, help intents and helps in the dream's category;
+  activity   the owner's dreams and step events touched in the last ACTIVITY_DAYS (capped);
+             dreams count by created_at / updated_at where the schema has them, else by date;
+  favorites  the dream's favorites counter (log-scaled, capped).
+
+The helper's own dreams and dreams they already help or helped are never scored. The
+feed query filters the last two again at read time, so a fresh "help" hides the card at
+once, before the next refresh.
+
+Incremental refresh: user_recommendation_state keeps a per-user event counter (seq).
+The write paths in main.py bump it with mark() in the same transaction as the
+favorite / help-intent / helped row. A background job in main.py recomputes users whose
+seq moved past refreshed_seq (events) or whose refreshed_at is older than max_age (new
+dreams, counters and activity of others). The job remembers the seq it read in its
+snapshot, so an event that commits during a refresh leaves the user due again instead of
+being lost. mark() and the refresh touch the state row only briefly, so a slow refresh
+never blocks a favorite click. Refreshes are serialized across workers with an advisory
+lock. A user without a state row gets scored on the first feed read (ensure()).
+
+All functions take a cursor of the caller's transaction and work with any cursor_factory.
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+TABLE = "user_dream_recommendations"
+STATE_TABLE = "user_recommendation_state"
+REFRESH_LOCK_KEY = 7_301_019  # pg_try_advisory_xact_lock: one refresh job at a time across workers
+
+W_CITY = 3.0
+W_CATEGORY = 4.0
+W_ACTIVITY = 1.5
+W_FAVORITES = 1.0
+ACTIVITY_DAYS = 30
+ACTIVITY_CAP = 5
+FAVORITES_CAP = 100
+
+
+def _get(row, i: int, key: str):
+    return row[key] if isinstance(row, dict) else row[i]
+
+
+def score_sql(has_category: bool, has_favorites_count: bool, has_step_events: bool, has_dream_timestamps: bool) -> str:
+    """SELECT (user_id, dream_id, score), top %(top_n)s per user of %(user_ids)s."""
+    affinity_cte = affinity_join = ""
+    category_term = "0"
+    if has_category:
+        affinity_cte = """,
+        touched AS (
+            SELECT user_id, dream_id FROM user_dream_favorites WHERE user_id = ANY(%(user_ids)s)
+            UNION ALL SELECT user_id, dream_id FROM user_dream_helped WHERE user_id = ANY(%(user_ids)s)
+            UNION ALL SELECT user_id, dream_id FROM user_dream_help_intent WHERE user_id = ANY(%(user_ids)s)
+        ),
+        affinity AS (
+            SELECT t.user_id, d.category_id,
+                   COUNT(*)::float8 / SUM(COUNT(*)) OVER (PARTITION BY t.user_id) AS share
+            FROM touched t JOIN dreams d ON d.id = t.dream_id
+            WHERE d.category_id IS NOT NULL
+            GROUP BY t.user_id, d.category_id
+        )"""
+        affinity_join = " LEFT JOIN affinity af ON af.user_id = v.user_id AND af.category_id = d.category_id"
+        category_term = "COALESCE(af.share, 0)"
+    step_events = ""
+    if has_step_events:
+        step_events = f"""
+                UNION ALL
+                SELECT e.user_id, COUNT(*) FROM dreams_steps_events e
+                WHERE e.created_at > NOW() - INTERVAL '{ACTIVITY_DAYS} days' GROUP BY e.user_id"""
+    # created_at / updated_at of dreams are not in the project migrations; dreams.date always is.
+    touched_at = "GREATEST(d.created_at, d.updated_at)" if has_dream_timestamps else "d.date"
+    favorites_cte = favorites_join = ""
+    favorites = "d.favorites_count"
+    if not has_favorites_count:
+        favorites_cte = """,
+        favs AS (SELECT dream_id, COUNT(*) AS n FROM user_dream_favorites GROUP BY dream_id)"""
+        favorites_join = " LEFT JOIN favs ON favs.dream_id = d.id"
+        favorites = "COALESCE(favs.n, 0)"
+    return f"""
+        WITH viewer AS (
+            SELECT u.id AS user_id, lower(btrim(COALESCE(u.city, ''))) AS city
+            FROM users u WHERE u.id = ANY(%(user_ids)s)
+        ){affinity_cte},
+        activity AS (
+            SELECT a.owner_id, LEAST(SUM(a.n), {ACTIVITY_CAP})::float8 / {ACTIVITY_CAP} AS level
+            FROM (
+                SELECT d.user_id AS owner_id, COUNT(*) AS n FROM dreams d
+                WHERE {touched_at} > NOW() - INTERVAL '{ACTIVITY_DAYS} days'
+                GROUP BY d.user_id{step_events}
+            ) a
+            GROUP BY a.owner_id
+        ){favorites_cte}
+        SELECT v.user_id, s.dream_id, s.score
+        FROM viewer v
+        CROSS JOIN LATERAL (
+            SELECT d.id AS dream_id,
+                   (CASE WHEN v.city <> '' AND lower(btrim(COALESCE(o.city, ''))) = v.city THEN {W_CITY} ELSE 0 END
+                    + {W_CATEGORY} * {category_term}
+                    + {W_ACTIVITY} * COALESCE(ac.level, 0)
+                    + {W_FAVORITES} * LEAST(ln(1 + ({favorites})::float8) / ln({1 + FAVORITES_CAP}), 1)
+                   )::real AS score
+            FROM dreams d
+            JOIN users o ON o.id = d.user_id{affinity_join}
+            LEFT JOIN activity ac ON ac.owner_id = d.user_id{favorites_join}
+            WHERE COALESCE(d.is_public, true) = true
+              AND d.user_id <> v.user_id
+              AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = v.user_id AND hl.dream_id = d.id)
+              AND NOT EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.user_id = v.user_id AND h.dream_id = d.id)
+            ORDER BY score DESC, d.id DESC
+            LIMIT %(top_n)s
+        ) s
+    """
+
+
+def mark(cur, user_ids: Sequence[int]) -> None:
+    """An event of these users changed their signals: the refresh job will recompute them."""
+    users = sorted(set(u for u in user_ids if u))
+    if not users:
+        return
+    cur.execute(f"UPDATE {STATE_TABLE} SET seq = seq + 1 WHERE user_id = ANY(%s)", (users,))
+
+
+def due(cur, batch: int, max_age_sec: float) -> List[int]:
+    """Users to recompute: events since the last refresh first, then the stalest."""
+    cur.execute(
+        f"""SELECT user_id FROM {STATE_TABLE}
+            WHERE seq <> refreshed_seq OR refreshed_at IS NULL
+               OR refreshed_at < NOW() - make_interval(secs => %s)
+            ORDER BY (seq <> refreshed_seq) DESC, refreshed_at NULLS FIRST
+            LIMIT %s""",
+        (max_age_sec, batch),
+    )
+    return [_get(r, 0, "user_id") for r in cur.fetchall()]
+
+
+def refresh(
+    cur, user_ids: Sequence[int], top_n: int,
+    has_category: bool, has_favorites_count: bool, has_step_events: bool, has_dream_timestamps: bool,
+) -> int:
+    """Recompute the top_n of these users (they must have state rows). Returns rows written."""
+    users = sorted(set(user_ids))
+    if not users:
+        return 0
+    cur.execute(f"SELECT user_id, seq FROM {STATE_TABLE} WHERE user_id = ANY(%s)", (users,))
+    seen = {_get(r, 0, "user_id"): _get(r, 1, "seq") for r in cur.fetchall()}
+    cur.execute(f"DELETE FROM {TABLE} WHERE user_id = ANY(%s)", (users,))
+    cur.execute(
+        f"INSERT INTO {TABLE} (user_id, dream_id, score) "
+        + score_sql(has_category, has_favorites_count, has_step_events, has_dream_timestamps),
+        {"user_ids": users, "top_n": top_n},
+    )
+    written = cur.rowcount
+    ids = sorted(seen)
+    cur.execute(
+        f"""UPDATE {STATE_TABLE} t SET refreshed_seq = s.seq, refreshed_at = NOW()
+            FROM unnest(%s::int[], %s::bigint[]) AS s(user_id, seq)
+            WHERE t.user_id = s.user_id""",
+        (ids, [seen[u] for u in ids]),
+    )
+    return written
+
+
+def try_lock(cur) -> bool:
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (REFRESH_LOCK_KEY,))
+    return bool(_get(cur.fetchone(), 0, "locked"))
+
+
+def ensure(
+    cur, user_id: int, top_n: int,
+    has_category: bool, has_favorites_count: bool, has_step_events: bool, has_dream_timestamps: bool,
+) -> bool:
+    """Create the user's state row and score them if it did not exist. True if scored now."""
+    cur.execute(
+        f"INSERT INTO {STATE_TABLE} (user_id) SELECT id FROM users WHERE id = %s ON CONFLICT (user_id) DO NOTHING",
+        (user_id,),
+    )
+    if cur.rowcount == 0:
+        return False
+    refresh(cur, [user_id], top_n, has_category, has_favorites_count, has_step_events, has_dream_timestamps)
+    return True
+
+
+def feed_where(after: Optional[tuple]) -> str:
+    """WHERE of the feed read over user_dream_recommendations r JOIN dreams d (params uid, after_score, after_id)."""
+    conds = [
+        "r.user_id = %(uid)s",
+        "COALESCE(d.is_public, true) = true",
+        "NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = r.user_id AND hl.dream_id = r.dream_id)",
+        "NOT EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.user_id = r.user_id AND h.dream_id = r.dream_id)",
+    ]
+    if after is not None:
+        conds.append("(r.score, r.dream_id) < (%(after_score)s::real, %(after_id)s)")
+    return " AND ".join(conds)
@@ -55,6 +55,8 @@ else:
 
 import psycopg2
 
+from db_schema import touch_schema_stamp
+
 def main():
     if len(sys.argv) < 2:
         print("Использование: python3 run_migrate.py <файл.sql> [файл2.sql ...]", file=sys.stderr)
@@ -90,6 +92,8 @@ def main():
             conn.commit()
             path.unlink()
             print(f"  OK: {path.name} (файл удалён)")
+            # Запущенное приложение перечитает схему (schema_registry) по изменению logs/.schema_stamp
+            touch_schema_stamp(_project_root / "logs")
 
     except psycopg2.Error as e:
         if conn:
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Полный ответ GET /dreams: сборка в Python (_dreams_full → dict на каждый шаг → JSONResponse) против сборки
+в PostgreSQL (_dreams_json_sql: json_build_object / json_agg, строка уходит как есть) — миллисекунды и байты.
+
+В одной транзакции добавляет пользователю --user --dreams синтетических мечт и --steps шагов к ним
+(по умолчанию 20 000, серии по дням с дедлайнами и временем, часть выполнена / «не выполнена» / удалена),
+прогоняет оба варианта --repeat раз и откатывает транзакцию — база не меняется. Ответы сверяются
+после json.loads (расхождение — код выхода 1). Функции берутся из main.py, те же, что у эндпоинта.
+
+  python3 scripts/bench_dreams_json.py
+  python3 scripts/bench_dreams_json.py --user 17 --steps 50000 --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from psycopg2.extras import RealDictCursor
+
+import main
+
+
+def _seed(cur, user_id: int, dreams: int, steps: int) -> None:
+    cur.execute(
+        "INSERT INTO dreams (user_id, dream, date) SELECT %s, 'Мечта #' || g, CURRENT_DATE FROM generate_series(1, %s) AS g RETURNING id",
+        (user_id, dreams),
+    )
+    ids = [r["id"] for r in cur.fetchall()]
+    cols = ["dream_id", "title", "completed", "sort_order"]
+    vals = [
+        "(%(ids)s::int[])[1 + g %% %(n)s]",
+        "'Шаг ' || g",
+        "g %% 3 = 0",
+        "g",
+    ]
+    optional = {
+        "deadline": "CURRENT_DATE - 3000 + g / %(n)s",
+        "start_time": "CASE WHEN g %% 2 = 0 THEN TIME '07:30' END",
+        "end_time": "CASE WHEN g %% 2 = 0 THEN TIME '08:00' END",
+        "series_id": "'bench-' || g %% %(n)s",
+        "series_index": "g / %(n)s + 1",
+        "deleted": "g %% 17 = 0",
+        "waived": "g %% 11 = 0",
+    }
+    for col, expr in optional.items():
+        if main.schema_registry.has("dreams_steps", col):
+            cols.append(col)
+            vals.append(expr)
+    cur.execute(
+        "INSERT INTO dreams_steps (" + ", ".join(cols) + ") SELECT " + ", ".join(vals)
+        + " FROM generate_series(1, %(steps)s) AS g",
+        {"ids": ids, "n": len(ids), "steps": steps},
+    )
+    cur.execute("ANALYZE dreams_steps")
+
+
+def _python(cur, user_id: int) -> bytes:
+    return JSONResponse(content=jsonable_encoder(main._dreams_full(cur, user_id))).body
+
+
+def _sql(cur, user_id: int) -> bytes:
+    return main._dreams_json_body(cur, user_id)
+
+
+def _ms(vals):
+    vals = sorted(vals)
+    p95 = vals[min(len(vals) - 1, int(round(0.95 * len(vals))) - 1)]
+    return round(statistics.median(vals) * 1000, 1), round(p95 * 1000, 1)
+
+
+def run() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--user", type=int, default=None, help="владелец (по умолчанию — первый пользователь)")
+    ap.add_argument("--dreams", type=int, default=20, help="сколько синтетических мечт добавить")
+    ap.add_argument("--steps", type=int, default=20000, help="сколько шагов добавить (0 — не добавлять)")
+    ap.add_argument("--repeat", type=int, default=7)
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    mismatch = False
+    try:
+        main.schema_registry.load(conn)
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            user_id = args.user
+            if user_id is None:
+                cur.execute("SELECT MIN(id) AS id FROM users")
+                user_id = cur.fetchone()["id"]
+            if args.steps > 0:
+                t0 = time.perf_counter()
+                _seed(cur, user_id, max(1, args.dreams), args.steps)
+                print(f"Добавлено {args.dreams} мечт и {args.steps} шагов пользователю {user_id} за {time.perf_counter() - t0:.1f} с (откатится)")
+            cur.execute("SELECT COUNT(*) AS n FROM dreams_steps WHERE dream_id IN (SELECT id FROM dreams WHERE user_id = %s)", (user_id,))
+            print(f"Шагов у пользователя: {cur.fetchone()['n']}\n")
+            print(f"{'вариант':<8} {'байт':>10} {'p50 мс':>8} {'p95 мс':>8}")
+            bodies = {}
+            for name, fn in (("python", _python), ("sql", _sql)):
+                fn(cur, user_id)  # прогрев
+                times = []
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    bodies[name] = fn(cur, user_id)
+                    times.append(time.perf_counter() - t0)
+                p50, p95 = _ms(times)
+                print(f"{name:<8} {len(bodies[name]):>10} {p50:>8} {p95:>8}")
+            mismatch = json.loads(bodies["python"]) != json.loads(bodies["sql"])
+            print(f"\nОтветы {'РАЗЛИЧАЮТСЯ' if mismatch else 'совпадают'}")
+    finally:
+        conn.rollback()
+        conn.close()
+    sys.exit(1 if mismatch else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Нагрузка на горячие read-эндпоинты: throughput (RPS) и p50/p95/p99 по каждому пути.
+Для сравнения sync- и async-режима (DB_ASYNC=1) под одной и той же нагрузкой.
+
+Использование (сервер уже запущен):
+  DB_ASYNC=0 uvicorn main:app --port 8000   # прогон 1
+  DB_ASYNC=1 uvicorn main:app --port 8000   # прогон 2
+  python3 scripts/bench_read_endpoints.py --base http://127.0.0.1:8000 --user-id 17 -c 32 -n 2000
+
+Только stdlib (urllib + потоки): клиент одинаковый для обоих режимов.
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+
+def _paths(user_id: int) -> List[str]:
+    return [
+        f"/dreams?user_id={user_id}",
+        f"/dreams/showcase?user_id={user_id}",
+        f"/schedule?user_id={user_id}",
+        f"/steps/events?user_id={user_id}",
+        f"/users/me?user_id={user_id}",
+    ]
+
+
+def _hit(url: str, timeout: float) -> Tuple[float, int]:
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return time.perf_counter() - t0, status
+
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * len(sorted_vals))) - 1))
+    return sorted_vals[k]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base", default="http://127.0.0.1:8000")
+    ap.add_argument("--user-id", type=int, default=17)
+    ap.add_argument("-c", "--concurrency", type=int, default=32)
+    ap.add_argument("-n", "--requests", type=int, default=2000, help="запросов на каждый путь")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--json", action="store_true", help="вывод одной JSON-строкой")
+    args = ap.parse_args()
+
+    base = args.base.rstrip("/")
+    report: Dict[str, dict] = {}
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        for path in _paths(args.user_id):
+            url = base + path
+            _hit(url, args.timeout)  # прогрев
+            t0 = time.perf_counter()
+            results = list(ex.map(lambda _: _hit(url, args.timeout), range(args.requests)))
+            wall = time.perf_counter() - t0
+            lat = sorted(r[0] for r in results)
+            errors = sum(1 for r in results if r[1] != 200)
+            report[path] = {
+                "rps": round(len(results) / wall, 1) if wall else 0.0,
+                "p50_ms": round(_pct(lat, 50) * 1000, 1),
+                "p95_ms": round(_pct(lat, 95) * 1000, 1),
+                "p99_ms": round(_pct(lat, 99) * 1000, 1),
+                "errors": errors,
+            }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print(f"{'path':45} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+    for path, r in report.items():
+        print(f"{path:45} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>5}")
+
+
+if __name__ == "__main__":
+    main()
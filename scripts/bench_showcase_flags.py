@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Отметки зрителя на странице витрины: отдельный запрос на каждый флаг против EXISTS-колонок в самом
+SELECT страницы (showcase_flags.py) — сколько SQL-запросов и миллисекунд уходит на страницу.
+
+В одной транзакции добавляет --dreams синтетических публичных мечт (по умолчанию 20 000) и отметки
+зрителя --user на --marks из них (избранное, «помогаю», «помог», просмотры, запросы завершения), листает
+--pages страниц по --limit карточек keyset'ом (date, id) и откатывает транзакцию — база не меняется.
+
+  queries — как было: набор просмотренных + страница + «dream_id = ANY(ids)» на каждый флаг
+            (user_dream_views без набора, избранное, помогаю, помог, запрос завершения) + счётчики избранного
+            без dreams.favorites_count — до 8 запросов на страницу;
+  exists  — набор просмотренных + страница с колонками showcase_flags.columns_sql поверх limit + 1 строк — 1–2.
+
+Флаги обоих вариантов сверяются на каждой странице (расхождение — код выхода 1).
+
+  python3 scripts/bench_showcase_flags.py
+  python3 scripts/bench_showcase_flags.py --dreams 100000 --pages 20 --limit 30 --explain
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import showcase_flags
+import viewed_sets
+
+# Из --marks синтетических мечт зрителя каждая step-я получает отметку
+_SEED_EVERY = {
+    "user_dream_favorites": 3,
+    "user_dream_help_intent": 5,
+    "user_dream_helped": 11,
+    "user_dream_views": 2,
+}
+
+
+class _CountingCursor(RealDictCursor):
+    statements = 0
+
+    def execute(self, query, vars=None):
+        _CountingCursor.statements += 1
+        return super().execute(query, vars)
+
+
+def _tables(cur) -> set:
+    cur.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = ANY(%s)",
+        ([t for t, _ in showcase_flags.TABLES.values()] + [viewed_sets.TABLE],),
+    )
+    tables = {r["table_name"] for r in cur.fetchall()}
+    cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'dreams' AND column_name = %s", (viewed_sets.KEY_COLUMN,))
+    if cur.fetchone() is None:
+        tables.discard(viewed_sets.TABLE)  # наборы ведутся по dreams.showcase_key
+    return tables
+
+
+def _has_favorites_count(cur) -> bool:
+    cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'dreams' AND column_name = 'favorites_count'")
+    return cur.fetchone() is not None
+
+
+def _seed(cur, n: int, marks: int, user_id: int, tables: set) -> None:
+    cur.execute(
+        """INSERT INTO dreams (user_id, dream, date, is_public)
+           SELECT (SELECT array_agg(id) FROM users)[1 + (g %% (SELECT COUNT(*) FROM users))::int],
+                  'Мечта #' || g, CURRENT_DATE - (g %% 1000), true
+           FROM generate_series(1, %s) AS g
+           RETURNING id""",
+        (n,),
+    )
+    ids = [r["id"] for r in cur.fetchall()]
+    ids = ids[::max(1, len(ids) // max(1, marks))]
+    for table, step in _SEED_EVERY.items():
+        if table in tables:
+            cur.execute(
+                f"INSERT INTO {table} (user_id, dream_id) SELECT %s, unnest(%s::int[])",
+                (user_id, ids[::step]),
+            )
+    if "user_dream_completion_request" in tables:
+        cur.execute(
+            "INSERT INTO user_dream_completion_request (dream_id, helper_user_id) SELECT unnest(%s::int[]), %s",
+            (ids[::15], user_id),
+        )
+    for table in ["dreams"] + sorted(tables):
+        cur.execute("ANALYZE " + table)
+
+
+def _page_sql(after, flag_cols: str = "") -> str:
+    keyset = " AND (d.date, d.id) < (%(after_date)s, %(after_id)s)" if after else ""
+    page = """
+        SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+               u.name AS user_name, u.surname AS user_surname, u.city AS user_city
+        FROM dreams d
+        JOIN users u ON u.id = d.user_id
+        WHERE COALESCE(d.is_public, true) = true""" + keyset + """
+        ORDER BY d.date DESC, d.id DESC
+        LIMIT %(lim)s
+    """
+    if not flag_cols:
+        return page
+    return "SELECT p.*" + flag_cols + " FROM (" + page + ") p ORDER BY p.date DESC, p.id DESC"
+
+
+def _legacy_queries(tables: set, viewed) -> list:
+    """(флаг, SQL) — запросы по флагам, как до showcase_flags."""
+    out = []
+    for name in showcase_flags.FLAGS:
+        table, user_col = showcase_flags.TABLES[name]
+        if (name == "viewed" and viewed is not None) or table not in tables:
+            continue
+        out.append((name, f"SELECT dream_id FROM {table} WHERE {user_col} = %s AND dream_id = ANY(%s)"))
+    return out
+
+
+def _params(user_id: int, after, limit: int) -> dict:
+    params = {"uid": user_id, "lim": limit + 1}
+    if after:
+        params["after_date"], params["after_id"] = after
+    return params
+
+
+def _load_viewed(cur, user_id: int, tables: set):
+    return viewed_sets.load(cur, user_id) if viewed_sets.TABLE in tables else None
+
+
+def _page_queries(cur, user_id: int, after, limit: int, tables: set, has_fav_count: bool):
+    viewed = _load_viewed(cur, user_id, tables)
+    cur.execute(_page_sql(after), _params(user_id, after, limit))
+    rows = cur.fetchall()[:limit]
+    ids = [r["id"] for r in rows]
+    flags = showcase_flags.empty()
+    if viewed is not None:
+        keys = viewed_sets.keys(cur, ids)
+        flags["viewed"] = {i for i in ids if i in keys and keys[i] in viewed}
+    for name, sql in _legacy_queries(tables, viewed):
+        cur.execute(sql, (user_id, ids))
+        flags[name] = {r["dream_id"] for r in cur.fetchall()}
+    if not has_fav_count:
+        cur.execute("SELECT dream_id, COUNT(*) AS c FROM user_dream_favorites WHERE dream_id = ANY(%s) GROUP BY dream_id", (ids,))
+        cur.fetchall()
+    return rows, flags
+
+
+def _exists_sql(user_id: int, after, limit: int, tables: set, viewed):
+    params = _params(user_id, after, limit)
+    predicate = None
+    if viewed is not None:
+        predicate = viewed_sets.predicate("p", dreams_row=False)
+        params.update(viewed_sets.params(viewed))
+    return _page_sql(after, showcase_flags.columns_sql("p", tables, predicate)), params
+
+
+def _page_exists(cur, user_id: int, after, limit: int, tables: set, has_fav_count: bool):
+    viewed = _load_viewed(cur, user_id, tables)
+    cur.execute(*_exists_sql(user_id, after, limit, tables, viewed))
+    rows = cur.fetchall()[:limit]
+    return rows, showcase_flags.from_rows(rows)
+
+
+def _walk(cur, fn, user_id: int, pages: int, limit: int, tables: set, has_fav_count: bool):
+    """Листает pages страниц: [(секунды, запросов, id карточек, флаги)] на каждую."""
+    out, after = [], None
+    for _ in range(pages):
+        before = _CountingCursor.statements
+        t0 = time.perf_counter()
+        rows, flags = fn(cur, user_id, after, limit, tables, has_fav_count)
+        elapsed = time.perf_counter() - t0
+        out.append((elapsed, _CountingCursor.statements - before, [r["id"] for r in rows], flags))
+        if len(rows) < limit:
+            break
+        after = (rows[-1]["date"], rows[-1]["id"])
+    return out
+
+
+def _ms(vals):
+    vals = sorted(vals)
+    p95 = vals[min(len(vals) - 1, int(round(0.95 * len(vals))) - 1)]
+    return round(statistics.median(vals) * 1000, 2), round(p95 * 1000, 2)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dreams", type=int, default=20000, help="сколько синтетических мечт добавить (0 — не добавлять)")
+    ap.add_argument("--marks", type=int, default=500, help="на скольких из них у зрителя есть отметки")
+    ap.add_argument("--user", type=int, default=None, help="зритель (по умолчанию — первый пользователь)")
+    ap.add_argument("--pages", type=int, default=20)
+    ap.add_argument("--limit", type=int, default=30, help="карточек на странице")
+    ap.add_argument("--repeat", type=int, default=3, help="сколько раз пролистать страницы каждым вариантом")
+    ap.add_argument("--explain", action="store_true", help="показать план запроса страницы с EXISTS-колонками")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    mismatches = 0
+    try:
+        with conn.cursor(cursor_factory=_CountingCursor) as cur:
+            tables = _tables(cur)
+            has_fav_count = _has_favorites_count(cur)
+            user_id = args.user
+            if user_id is None:
+                cur.execute("SELECT MIN(id) AS id FROM users")
+                user_id = cur.fetchone()["id"]
+            if args.dreams > 0:
+                t0 = time.perf_counter()
+                _seed(cur, args.dreams, args.marks, user_id, tables)
+                print(f"Добавлено {args.dreams} мечт с отметками зрителя {user_id} за {time.perf_counter() - t0:.1f} с (откатится)")
+            print(f"Таблицы флагов: {', '.join(sorted(tables))}; dreams.favorites_count: {'есть' if has_fav_count else 'нет'}\n")
+            print(f"{'вариант':<8} {'страниц':>8} {'запросов/стр':>13} {'p50 мс':>8} {'p95 мс':>8}")
+            results = {}
+            for name, fn in (("queries", _page_queries), ("exists", _page_exists)):
+                _walk(cur, fn, user_id, args.pages, args.limit, tables, has_fav_count)  # прогрев
+                runs = []
+                for _ in range(args.repeat):
+                    runs += _walk(cur, fn, user_id, args.pages, args.limit, tables, has_fav_count)
+                results[name] = runs[-len(runs) // args.repeat:]
+                p50, p95 = _ms([r[0] for r in runs])
+                per_page = sorted({r[1] for r in runs})
+                print(f"{name:<8} {len(results[name]):>8} {'/'.join(map(str, per_page)):>13} {p50:>8} {p95:>8}")
+            for old, new in zip(results["queries"], results["exists"]):
+                mismatches += old[2] != new[2] or old[3] != new[3]
+            print(f"\nРасхождений карточек / флагов по страницам: {mismatches}")
+            if args.explain:
+                print()
+                sql, params = _exists_sql(user_id, None, args.limit, tables, _load_viewed(cur, user_id, tables))
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+                print("\n".join(r["QUERY PLAN"] for r in cur.fetchall()))
+    finally:
+        conn.rollback()
+        conn.close()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
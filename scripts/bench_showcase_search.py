@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Поиск по витрине (GET /dreams/search) против нынешнего подхода «вся витрина + фильтр на клиенте».
+
+В одной транзакции добавляет --dreams синтетических публичных мечт (по умолчанию 100 000) с
+search_tsv, прогоняет оба варианта по набору запросов и откатывает транзакцию — база не меняется.
+Нужна миграция _sql/mig_dreams_search.sql.
+
+  full   — SELECT всех публичных мечт с автором (как GET /dreams/showcase без limit), выборка всех
+           строк в Python и фильтр подстрокой по тексту / имени / городу — то, что делает клиент;
+           и размер JSON, который ушёл бы клиенту.
+  search — страница --limit по релевантности (dream_search.match_sql + ts_rank_cd, GIN-индекс).
+
+  python3 scripts/bench_showcase_search.py
+  python3 scripts/bench_showcase_search.py --dreams 100000 --repeat 10 --explain
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+
+import dream_search
+
+_WORDS = [
+    "мечта", "путешествие", "море", "горы", "книга", "дом", "сад", "машина", "велосипед", "гитара",
+    "собака", "кошка", "Япония", "Италия", "Байкал", "марафон", "танцы", "английский", "ремонт", "кухня",
+    "фотоаппарат", "рыбалка", "палатка", "ноутбук", "курсы", "свадьба", "подарок", "концерт", "театр", "выставка",
+]
+_QUERIES = ["море", "путешеств", "байкал гитара", "Москва", "ремонт кухни", "зебра"]
+
+_FULL_SQL = """
+    SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,
+           u.name AS user_name, u.surname AS user_surname, u.city AS user_city
+    FROM dreams d
+    JOIN users u ON u.id = d.user_id
+    WHERE COALESCE(d.is_public, true) = true
+    ORDER BY d.id DESC
+"""
+
+
+def _seed(cur, n: int) -> None:
+    cur.execute(
+        """INSERT INTO dreams (user_id, dream, date, is_public)
+           SELECT (SELECT array_agg(id) FROM users)[1 + (g %% (SELECT COUNT(*) FROM users))::int],
+                  'Хочу ' || w[1 + (g * 7) %% cardinality(w)] || ' и ' || w[1 + (g * 13 + 5) %% cardinality(w)]
+                    || ' ' || w[1 + (g * 31 + 11) %% cardinality(w)] || ' #' || g,
+                  CURRENT_DATE - (g %% 1000),
+                  true
+           FROM generate_series(1, %s) AS g, (SELECT %s::text[] AS w) words""",
+        (n, _WORDS),
+    )
+    cur.execute(
+        "UPDATE dreams d SET " + dream_search.TSV_COLUMN + " = " + dream_search.tsv_sql()
+        + " FROM users u WHERE u.id = d.user_id AND d." + dream_search.TSV_COLUMN + " IS NULL"
+    )
+    cur.execute("ANALYZE dreams")
+
+
+def _full(cur, q: str):
+    t0 = time.perf_counter()
+    cur.execute(_FULL_SQL)
+    rows = cur.fetchall()
+    words = dream_search.terms(q)
+    hits = [
+        r for r in rows
+        if all(any(w in (r[k] or "").lower() for k in (1, 6, 7, 8)) for w in words)
+    ]
+    elapsed = time.perf_counter() - t0
+    size = len(json.dumps(rows, default=str, ensure_ascii=False).encode("utf-8"))
+    return elapsed, len(rows), len(hits), size
+
+
+def _search(cur, q: str, limit: int, explain: bool):
+    words = dream_search.terms(q)
+    match, rank, params = dream_search.match_sql(True, words)
+    params["lim"] = limit
+    sql = (
+        "SELECT d.id, d.dream, d.deadline, d.price, d.date, d.user_id,"
+        " u.name AS user_name, u.surname AS user_surname, u.city AS user_city, " + rank + " AS rank"
+        " FROM dreams d JOIN users u ON u.id = d.user_id"
+        " WHERE COALESCE(d.is_public, true) = true AND " + match
+        + " ORDER BY rank DESC, d.id DESC LIMIT %(lim)s"
+    )
+    if explain:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+        print("\n".join(r[0] for r in cur.fetchall()))
+    t0 = time.perf_counter()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    elapsed = time.perf_counter() - t0
+    size = len(json.dumps(rows, default=str, ensure_ascii=False).encode("utf-8"))
+    return elapsed, len(rows), len(rows), size
+
+
+def _ms(vals):
+    vals = sorted(vals)
+    p95 = vals[min(len(vals) - 1, int(round(0.95 * len(vals))) - 1)]
+    return round(statistics.median(vals) * 1000, 1), round(p95 * 1000, 1)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dreams", type=int, default=100000, help="сколько синтетических мечт добавить (0 — не добавлять)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--limit", type=int, default=30, help="размер страницы поиска")
+    ap.add_argument("--explain", action="store_true", help="показать план поискового запроса")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'dreams' AND column_name = %s",
+                (dream_search.TSV_COLUMN,),
+            )
+            if cur.fetchone() is None:
+                print("Нет dreams.search_tsv — сначала _sql/mig_dreams_search.sql", file=sys.stderr)
+                sys.exit(1)
+            if args.dreams > 0:
+                t0 = time.perf_counter()
+                _seed(cur, args.dreams)
+                print(f"Добавлено {args.dreams} мечт за {time.perf_counter() - t0:.1f} с (откатится)")
+            cur.execute("SELECT COUNT(*) FROM dreams WHERE COALESCE(is_public, true) = true")
+            print(f"Публичных мечт: {cur.fetchone()[0]}\n")
+            print(f"{'запрос':<16} {'вариант':<7} {'p50 мс':>8} {'p95 мс':>8} {'строк из БД':>12} {'найдено':>8} {'JSON КБ':>8}")
+            for q in _QUERIES:
+                for name, fn in (("full", lambda: _full(cur, q)), ("search", lambda: _search(cur, q, args.limit, False))):
+                    fn()  # прогрев
+                    runs = [fn() for _ in range(args.repeat)]
+                    p50, p95 = _ms([r[0] for r in runs])
+                    _, fetched, hits, size = runs[-1]
+                    print(f"{q:<16} {name:<7} {p50:>8} {p95:>8} {fetched:>12} {hits:>8} {size // 1024:>8}")
+            if args.explain:
+                print()
+                _search(cur, _QUERIES[2], args.limit, True)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Сборка компактных наборов просмотренных мечт (user_viewed_sets) из user_dream_views.
+
+Нужна один раз после миграций _sql/mig_user_viewed_sets.sql и _sql/mig_dreams_showcase_key.sql (дальше
+наборы ведёт запись просмотров в main.py) и для починки: пересобирает строки заново. Пачками по --batch
+пользователей, каждая пачка — своя транзакция.
+
+  python3 scripts/build_viewed_sets.py
+  python3 scripts/build_viewed_sets.py --user 17
+  python3 scripts/build_viewed_sets.py --batch 200
+
+На проде:
+  docker compose exec app python3 scripts/build_viewed_sets.py
+"""
+import os
+import sys
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+
+import viewed_sets
+
+
+def build_viewed_sets(user_id: int = 0, batch: int = 500) -> None:
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'dreams' AND column_name = %s",
+                (viewed_sets.KEY_COLUMN,),
+            )
+            if cur.fetchone() is None:
+                print("Нет dreams." + viewed_sets.KEY_COLUMN + " — сначала _sql/mig_dreams_showcase_key.sql", file=sys.stderr)
+                sys.exit(1)
+            if user_id:
+                users = [user_id]
+            else:
+                cur.execute("SELECT DISTINCT user_id FROM " + viewed_sets.VIEWS_TABLE + " ORDER BY user_id")
+                users = [r[0] for r in cur.fetchall()]
+        conn.commit()
+        done = 0
+        for i in range(0, len(users), max(batch, 1)):
+            with conn.cursor() as cur:
+                done += viewed_sets.rebuild(cur, users[i:i + batch])
+            conn.commit()
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length(bits)), 0), COUNT(*) FILTER (WHERE bits = ''::bytea)"
+                " FROM " + viewed_sets.TABLE + " WHERE hwm IS NOT NULL"
+            )
+            rows, size, flat = cur.fetchone()
+        conn.rollback()
+        print(f"Собрано наборов: {done}. Всего: {rows}, битмапов {size} байт, только hwm: {flat}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Ошибка БД: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Собрать user_viewed_sets из user_dream_views")
+    parser.add_argument("--user", type=int, default=0, help="только этот пользователь")
+    parser.add_argument("--batch", type=int, default=500, help="пользователей в транзакции")
+    args = parser.parse_args()
+    build_viewed_sets(user_id=args.user, batch=args.batch)
+
+
+if __name__ == "__main__":
+    main()
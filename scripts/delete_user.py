@@ -57,6 +57,17 @@ def delete_user(user_id: int, delete_avatar: bool = True) -> None:
             if n:
                 print(f"  — удалено {n} мечт")
 
+            # 3a. Избранное уйдёт по CASCADE — снять его со счётчиков dreams.favorites_count
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'dreams' AND column_name = 'favorites_count'"
+            )
+            if cur.fetchone():
+                cur.execute(
+                    """UPDATE dreams d SET favorites_count = GREATEST(d.favorites_count - 1, 0)
+                       FROM user_dream_favorites f WHERE f.user_id = %s AND f.dream_id = d.id""",
+                    (user_id,),
+                )
+
             # 4. Пользователь (остальное — CASCADE)
             cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
             if cur.rowcount != 1:
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Удаление старых записей об удалениях (dreams_sync_tombstones) дельта-синхронизации GET /dreams?since=.
+
+Запись нужна, пока жив токен, выданный до удаления: токены старше DREAMS_SYNC_RETENTION_DAYS (30) и так
+получают полный ответ. Удаляются записи старше этого срока плюс сутки запаса (dreams_sync.prune).
+Запускать по cron раз в сутки.
+
+  python3 scripts/prune_dreams_sync.py --dry-run
+  python3 scripts/prune_dreams_sync.py
+
+На проде:
+  docker compose exec app python3 scripts/prune_dreams_sync.py
+"""
+import os
+import sys
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+
+import dreams_sync
+
+
+def prune_dreams_sync(retention_days: float, dry_run: bool = False) -> None:
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (dreams_sync.TOMBSTONES,))
+            if not cur.fetchone()[0]:
+                print(f"Нет {dreams_sync.TOMBSTONES} — сначала _sql/mig_dreams_sync.sql", file=sys.stderr)
+                sys.exit(1)
+            deleted = dreams_sync.prune(cur, retention_days)
+            print(f"Записей старше {retention_days:g} + {dreams_sync.PRUNE_SLACK_DAYS} сут.: {deleted}")
+            if dry_run:
+                conn.rollback()
+                return
+            conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Ошибка БД: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Удалить старые записи dreams_sync_tombstones")
+    parser.add_argument(
+        "--days", type=float, default=float(os.getenv("DREAMS_SYNC_RETENTION_DAYS") or 30),
+        help="срок жизни токена, сут. (по умолчанию DREAMS_SYNC_RETENTION_DAYS или 30)",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    prune_dreams_sync(args.days, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
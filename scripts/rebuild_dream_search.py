@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Пересборка dreams.search_tsv (поиск по витрине, GET /dreams/search) — сверка после скриптов и ручного SQL.
+
+Колонку ведёт main.py в транзакции записи (dream_search.refresh); правки dreams.dream или имени / города
+в users мимо приложения её не трогают. Скрипт находит мечты, у которых search_tsv расходится с
+dream_search.tsv_sql(), и пересчитывает только их — пачками по --batch, каждая пачка — своя транзакция.
+
+  python3 scripts/rebuild_dream_search.py --dry-run
+  python3 scripts/rebuild_dream_search.py
+  python3 scripts/rebuild_dream_search.py 181   # только мечта 181
+
+На проде:
+  docker compose exec app python3 scripts/rebuild_dream_search.py
+"""
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+
+import dream_search
+
+
+def rebuild_dream_search(dream_id: Optional[int] = None, batch: int = 1000, dry_run: bool = False) -> None:
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'dreams' AND column_name = %s",
+                (dream_search.TSV_COLUMN,),
+            )
+            if cur.fetchone() is None:
+                print("Нет dreams." + dream_search.TSV_COLUMN + " — сначала _sql/mig_dreams_search.sql", file=sys.stderr)
+                sys.exit(1)
+            dream_filter = "AND d.id = %s" if dream_id is not None else ""
+            params = (dream_id,) if dream_id is not None else ()
+            cur.execute(
+                f"""
+                SELECT d.id FROM dreams d
+                JOIN users u ON u.id = d.user_id
+                WHERE d.{dream_search.TSV_COLUMN} IS DISTINCT FROM {dream_search.tsv_sql()}
+                  {dream_filter}
+                ORDER BY d.id
+                """,
+                params,
+            )
+            drift = [r[0] for r in cur.fetchall()]
+        conn.rollback()
+        print(f"Расхождений: {len(drift)}")
+        if drift:
+            print("  мечты: " + ", ".join(str(i) for i in drift[:25]) + (" ..." if len(drift) > 25 else ""))
+        if not drift or dry_run:
+            return
+        for i in range(0, len(drift), max(batch, 1)):
+            with conn.cursor() as cur:
+                dream_search.refresh(cur, dream_ids=drift[i:i + batch])
+            conn.commit()
+        print(f"Пересобрано мечт: {len(drift)}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Ошибка БД: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Пересобрать dreams.search_tsv у расходящихся мечт")
+    parser.add_argument("dream_id", type=int, nargs="?", help="ID мечты (опционально)")
+    parser.add_argument("--batch", type=int, default=1000, help="мечт в транзакции")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    rebuild_dream_search(dream_id=args.dream_id, batch=args.batch, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Сверка счётчиков витрины (user_showcase_counters, showcase_totals) с исходными таблицами.
+
+То же, что фоновая сверка в main.py (SHOWCASE_COUNTERS_RECONCILE_SEC), но разом для всех строк
+(или --batch N давно не сверенных). Исправляет только расходящиеся значения и выводит их.
+
+  python3 scripts/reconcile_showcase_counters.py --dry-run
+  python3 scripts/reconcile_showcase_counters.py
+  python3 scripts/reconcile_showcase_counters.py --batch 1000
+
+На проде:
+  docker compose exec app python3 scripts/reconcile_showcase_counters.py
+"""
+import os
+import sys
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+
+import showcase_counters
+
+
+def reconcile_showcase_counters(batch: int = 0, dry_run: bool = False) -> None:
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT to_regclass(%s) IS NOT NULL AS completion",
+                (showcase_counters.COMPLETION_TABLE,),
+            )
+            has_completion = cur.fetchone()[0]
+            if batch <= 0:
+                cur.execute("SELECT COUNT(*) FROM " + showcase_counters.COUNTERS_TABLE)
+                batch = max(cur.fetchone()[0], 1)
+            checked, drift = showcase_counters.reconcile(cur, batch, has_completion, dry_run=dry_run)
+            print(f"Проверено строк: {checked}, расхождений: {len(drift)}")
+            for item in drift[:25]:
+                who = "всего публичных" if item["user_id"] is None else f"пользователь {item['user_id']}"
+                diff = ", ".join(f"{k}: {v[0]} -> {v[1]}" for k, v in item.items() if k != "user_id")
+                print(f"  {who}: {diff}")
+            if dry_run:
+                conn.rollback()
+                return
+            conn.commit()
+            if drift:
+                print(f"Исправлено: {len(drift)}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Ошибка БД: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сверить счётчики витрины user_showcase_counters")
+    parser.add_argument("--batch", type=int, default=0, help="сколько давно не сверенных строк (0 — все)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    reconcile_showcase_counters(batch=args.batch, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Пересчёт dreams.favorites_count по user_dream_favorites (сверка денормализованного счётчика витрины).
+
+Обновляет только расходящиеся строки; выводит найденные расхождения.
+
+  python3 scripts/recount_favorites.py --dry-run
+  python3 scripts/recount_favorites.py
+  python3 scripts/recount_favorites.py 181   # только мечта 181
+
+На проде:
+  docker compose exec app python3 scripts/recount_favorites.py
+"""
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+_project_root = Path(__file__).resolve().parent.parent
+_env_file = _project_root / ".env"
+if _env_file.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(_env_file)
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+
+def recount_favorites(dream_id: Optional[int] = None, dry_run: bool = False) -> None:
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        dbname=os.getenv("DB_NAME"),
+    )
+    conn.autocommit = False
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            dream_filter = "AND d.id = %s" if dream_id is not None else ""
+            params = (dream_id,) if dream_id is not None else ()
+            cur.execute(
+                f"""
+                SELECT d.id, d.favorites_count AS stored, COALESCE(c.n, 0) AS actual
+                FROM dreams d
+                LEFT JOIN (
+                    SELECT dream_id, COUNT(*) AS n FROM user_dream_favorites GROUP BY dream_id
+                ) c ON c.dream_id = d.id
+                WHERE d.favorites_count <> COALESCE(c.n, 0)
+                  {dream_filter}
+                ORDER BY d.id
+                FOR UPDATE OF d
+                """,
+                params,
+            )
+            drift = cur.fetchall()
+            print(f"Расхождений: {len(drift)}")
+            for r in drift[:25]:
+                print(f"  мечта {r['id']}: {r['stored']} -> {r['actual']}")
+            if not drift or dry_run:
+                return
+            cur.execute(
+                """
+                UPDATE dreams d
+                SET favorites_count = (SELECT COUNT(*) FROM user_dream_favorites f WHERE f.dream_id = d.id)
+                WHERE d.id = ANY(%s)
+                """,
+                ([r["id"] for r in drift],),
+            )
+            conn.commit()
+            print(f"Исправлено мечт: {cur.rowcount}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Ошибка БД: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Пересчитать dreams.favorites_count")
+    parser.add_argument("dream_id", type=int, nargs="?", help="ID мечты (опционально)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    recount_favorites(dream_id=args.dream_id, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
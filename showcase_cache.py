@@ -0,0 +1,138 @@
+"""
+In-process snapshot cache of the anonymous showcase (GET /dreams/showcase without user_id).
+
+That payload is the same for every visitor, so it is serialized once per "public dreams
+version" and served from memory with a strong ETag (If-None-Match -> 304). The version is
+a counter row (showcase_public_version) that main.py bumps in the same transaction as
+every write changing the anonymous payload. Each process re-reads it at most every
+check_sec, and only one request does the re-read; the others keep using the last known
+version. A landing spike therefore costs one tiny SELECT per interval per worker and one
+rebuild per version.
+
+Ordering rule: the version is read before the data. A snapshot may carry an older version
+than its contents (one extra rebuild later), never a newer one.
+
+Stale-while-revalidate: while one request rebuilds a key, the others get the previous
+snapshot for up to stale_sec after it went stale instead of queueing on the database.
+Snapshots older than max_age_sec are rebuilt even without a bump (manual SQL, scripts).
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, Optional, Set, Tuple
+
+
+class Snapshot:
+    __slots__ = ("body", "etag", "version", "built_at", "stale_since")
+
+    def __init__(self, body: bytes, version: int) -> None:
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:24] + '"'
+        self.version = version
+        self.built_at = time.monotonic()
+        self.stale_since: Optional[float] = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match against a strong or weak ETag (weak comparison, as RFC 9110 prescribes for this header)."""
+    if not if_none_match:
+        return False
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class SnapshotCache:
+    """Serialized payloads by key for the current version; LRU-bounded to max_entries."""
+
+    def __init__(self, check_sec: float, stale_sec: float, max_age_sec: float, max_entries: int = 32) -> None:
+        self.check_sec = check_sec
+        self.stale_sec = stale_sec
+        self.max_age_sec = max_age_sec
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._entries: "OrderedDict[Hashable, Snapshot]" = OrderedDict()
+        self._building: Set[Hashable] = set()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._checking = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.check_sec > 0
+
+    # --- version ---------------------------------------------------------
+
+    def version(self) -> Tuple[Optional[int], bool]:
+        """(last known version, caller must re-read it and call set_version)."""
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and (self._checking or now - self._checked_at < self.check_sec):
+                return self._version, False
+            self._checking = True
+            return self._version, True
+
+    def set_version(self, version: Optional[int]) -> None:
+        """Result of the re-read; None (failed / no row) keeps the cache off until the next check."""
+        with self._lock:
+            self._version = version
+            self._checked_at = time.monotonic()
+            self._checking = False
+
+    def expire_version(self) -> None:
+        """A write of this process committed a bump: re-read on the next request."""
+        with self._lock:
+            self._checked_at = 0.0
+
+    # --- snapshots -------------------------------------------------------
+
+    def lookup(self, key: Hashable, version: int) -> Tuple[Optional[Snapshot], bool]:
+        """(snapshot to serve, caller must build it and call store / abandon)."""
+        now = time.monotonic()
+        with self._lock:
+            snap = self._entries.get(key)
+            if snap is not None:
+                self._entries.move_to_end(key)
+                if snap.version == version and now - snap.built_at < self.max_age_sec:
+                    return snap, False
+                if snap.stale_since is None:
+                    snap.stale_since = now
+                if key in self._building and now - snap.stale_since <= self.stale_sec:
+                    return snap, False
+            self._building.add(key)
+            return None, True
+
+    def store(self, key: Hashable, version: int, body: bytes) -> Snapshot:
+        snap = Snapshot(body, version)
+        with self._lock:
+            self._building.discard(key)
+            current = self._entries.get(key)
+            # A slower builder of an older version must not replace a newer snapshot.
+            if current is None or current.version <= version:
+                self._entries[key] = snap
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snap
+
+    def abandon(self, key: Hashable) -> None:
+        with self._lock:
+            self._building.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._building.clear()
+            self._version = None
+            self._checked_at = 0.0
@@ -0,0 +1,366 @@
+"""
+Per-user showcase counters (user_showcase_counters) and the public-dream total (showcase_totals).
+
+GET /dreams/showcase/counts reads one row instead of seven COUNT queries. The write
+paths in main.py (view flush, favorite, help intent, helped, completion request, dream
+create / publish / delete) apply deltas to the affected rows in the same transaction
+as the row they change, so a rolled-back write leaves the counters alone.
+
+"new" is not stored: it is public_dreams - viewed, where viewed counts the public
+dreams the user has seen. Publishing or hiding a dream therefore touches the total and
+the rows of the users who interacted with that dream, not every user.
+
+A user's row is created on the first read (ensure_row). Deltas for users without a row
+are skipped. Races the deltas cannot see (two helpers on one dream at once, a write
+during ensure_row, user deletion, manual SQL) are fixed by reconcile(), which the app
+runs in the background and scripts/reconcile_showcase_counters.py runs on demand.
+
+All functions take a cursor of the caller's transaction and work with any cursor_factory.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+COUNTERS_TABLE = "user_showcase_counters"
+TOTALS_TABLE = "showcase_totals"
+COMPLETION_TABLE = "user_dream_completion_request"
+
+COUNTER_COLUMNS = ("viewed", "helping", "helped", "favorites", "in_progress", "pending_completion")
+
+_PUBLIC = "COALESCE(d.is_public, true) = true"
+
+
+def _recompute_sql(has_completion: bool) -> str:
+    """Actual counters of users %(user_ids)s from the source tables (same rules as the old COUNT queries)."""
+    pending = (
+        f"""(SELECT COUNT(DISTINCT r.dream_id) FROM {COMPLETION_TABLE} r
+             JOIN dreams d ON d.id = r.dream_id WHERE d.user_id = u.id)"""
+        if has_completion else "0"
+    )
+    return f"""
+        SELECT u.id AS user_id,
+               (SELECT COUNT(*) FROM user_dream_views v
+                JOIN dreams d ON d.id = v.dream_id AND {_PUBLIC}
+                WHERE v.user_id = u.id) AS viewed,
+               (SELECT COUNT(*) FROM user_dream_help_intent h
+                JOIN dreams d ON d.id = h.dream_id AND {_PUBLIC}
+                WHERE h.user_id = u.id
+                  AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = u.id AND hl.dream_id = h.dream_id)
+               ) AS helping,
+               (SELECT COUNT(*) FROM user_dream_helped hl
+                JOIN dreams d ON d.id = hl.dream_id AND {_PUBLIC}
+                WHERE hl.user_id = u.id) AS helped,
+               (SELECT COUNT(*) FROM user_dream_favorites f
+                JOIN dreams d ON d.id = f.dream_id AND {_PUBLIC}
+                WHERE f.user_id = u.id) AS favorites,
+               (SELECT COUNT(*) FROM dreams d
+                WHERE d.user_id = u.id
+                  AND EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id)) AS in_progress,
+               {pending} AS pending_completion
+        FROM users u
+        WHERE u.id = ANY(%(user_ids)s)
+    """
+
+
+def _public_total_sql() -> str:
+    return f"SELECT COUNT(*) FROM dreams d WHERE {_PUBLIC}"
+
+
+def _row_values(row, columns: Sequence[str]) -> Tuple:
+    if isinstance(row, dict):
+        return tuple(row[c] for c in columns)
+    return tuple(row[: len(columns)])
+
+
+# --- reads ----------------------------------------------------------------
+
+def _read_sql() -> str:
+    cols = ", ".join("c." + c for c in COUNTER_COLUMNS)
+    return f"""SELECT t.public_dreams, c.user_id, {cols}
+               FROM {TOTALS_TABLE} t
+               LEFT JOIN {COUNTERS_TABLE} c ON c.user_id = %s"""
+
+
+def ensure_row(cur, user_id: int, has_completion: bool) -> None:
+    """Create the user's row from the source tables (no-op if it exists or the user doesn't)."""
+    cols = ", ".join(COUNTER_COLUMNS)
+    cur.execute(
+        f"""INSERT INTO {COUNTERS_TABLE} (user_id, {cols})
+            SELECT user_id, {cols} FROM ({_recompute_sql(has_completion)}) a
+            ON CONFLICT (user_id) DO NOTHING""",
+        {"user_ids": [user_id]},
+    )
+
+
+def read_counts(cur, user_id: Optional[int], has_completion: bool, create: bool = True) -> Optional[Dict[str, int]]:
+    """Counters in the /dreams/showcase/counts shape (without buddy_alerts_unread).
+
+    One statement when the row exists; a missing row is created (create=False, e.g. on a
+    read replica: None instead). None also when showcase_totals has no row (not set up).
+    """
+    columns = ("public_dreams", "user_id") + COUNTER_COLUMNS
+    cur.execute(_read_sql(), (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    values = dict(zip(columns, _row_values(row, columns)))
+    if user_id and values["user_id"] is None:
+        if not create:
+            return None
+        ensure_row(cur, user_id, has_completion)
+        cur.execute(_read_sql(), (user_id,))
+        values = dict(zip(columns, _row_values(cur.fetchone(), columns)))
+    total = values["public_dreams"] or 0
+    if not user_id or values["user_id"] is None:
+        return {
+            "new": total, "helping": 0, "helped": 0, "favorites": 0, "all": total,
+            "in_progress": 0, "pending_completion": 0,
+        }
+    return {
+        "new": max(total - (values["viewed"] or 0), 0),
+        "helping": values["helping"] or 0,
+        "helped": values["helped"] or 0,
+        "favorites": values["favorites"] or 0,
+        "all": total,
+        "in_progress": values["in_progress"] or 0,
+        "pending_completion": values["pending_completion"] or 0,
+    }
+
+
+# --- deltas ---------------------------------------------------------------
+
+def _set_clause(deltas: Dict[str, int]) -> str:
+    parts = []
+    for col, delta in deltas.items():
+        if col not in COUNTER_COLUMNS:
+            raise ValueError(f"unknown showcase counter: {col}")
+        parts.append(f"{col} = GREATEST({col} + ({int(delta)}), 0)")
+    parts.append("updated_at = NOW()")
+    return ", ".join(parts)
+
+
+def bump_viewer(cur, user_id: int, dream_id: int, **deltas: int) -> None:
+    """Counters of the user's own actions on a dream; only public dreams count."""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} SET {_set_clause(deltas)}
+            WHERE user_id = %s AND EXISTS (SELECT 1 FROM dreams d WHERE d.id = %s AND {_PUBLIC})""",
+        (user_id, dream_id),
+    )
+
+
+def views_added(cur, pairs: Sequence[Tuple[int, int]]) -> None:
+    """bump_viewer(viewed=1) for a batch of new user_dream_views rows (user_id, dream_id)."""
+    if not pairs:
+        return
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET viewed = GREATEST(c.viewed + v.n, 0), updated_at = NOW()
+            FROM (
+              SELECT p.user_id, COUNT(*) AS n
+              FROM unnest(%s::int[], %s::int[]) AS p(user_id, dream_id)
+              JOIN dreams d ON d.id = p.dream_id
+              WHERE {_PUBLIC}
+              GROUP BY p.user_id
+            ) v
+            WHERE c.user_id = v.user_id""",
+        ([p[0] for p in pairs], [p[1] for p in pairs]),
+    )
+
+
+def help_intent_added(cur, user_id: int, dream_id: int) -> None:
+    """After a new user_dream_help_intent row: helper's helping, owner's in_progress (first helper)."""
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} SET {_set_clause({"helping": 1})}
+            WHERE user_id = %s
+              AND EXISTS (SELECT 1 FROM dreams d WHERE d.id = %s AND {_PUBLIC})
+              AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = %s AND hl.dream_id = %s)""",
+        (user_id, dream_id, user_id, dream_id),
+    )
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET {_set_clause({"in_progress": 1})}
+            FROM dreams d
+            WHERE d.id = %s AND c.user_id = d.user_id
+              AND NOT EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id AND h.user_id <> %s)""",
+        (dream_id, user_id),
+    )
+
+
+def help_intents_removed(cur, dream_id: int) -> None:
+    """After deleting help intents of a dream: owner's in_progress, if no helper is left."""
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET {_set_clause({"in_progress": -1})}
+            FROM dreams d
+            WHERE d.id = %s AND c.user_id = d.user_id
+              AND NOT EXISTS (SELECT 1 FROM user_dream_help_intent h WHERE h.dream_id = d.id)""",
+        (dream_id,),
+    )
+
+
+def helpers_released(cur, user_ids: Iterable[int], dream_id: int) -> None:
+    """After deleting these users' help intents (owner declined): their helping, unless already helped."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET {_set_clause({"helping": -1})}
+            WHERE c.user_id = ANY(%s)
+              AND EXISTS (SELECT 1 FROM dreams d WHERE d.id = %s AND {_PUBLIC})
+              AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = c.user_id AND hl.dream_id = %s)""",
+        (user_ids, dream_id, dream_id),
+    )
+
+
+def completion_request_added(cur, helper_id: int, dream_id: int) -> None:
+    """After a new completion request: owner's pending_completion, if it is the dream's first one."""
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET {_set_clause({"pending_completion": 1})}
+            FROM dreams d
+            WHERE d.id = %s AND c.user_id = d.user_id
+              AND NOT EXISTS (SELECT 1 FROM {COMPLETION_TABLE} r WHERE r.dream_id = d.id AND r.helper_user_id <> %s)""",
+        (dream_id, helper_id),
+    )
+
+
+def completion_requests_removed(cur, dream_id: int) -> None:
+    """After deleting a dream's completion requests: owner's pending_completion, if none is left."""
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET {_set_clause({"pending_completion": -1})}
+            FROM dreams d
+            WHERE d.id = %s AND c.user_id = d.user_id
+              AND NOT EXISTS (SELECT 1 FROM {COMPLETION_TABLE} r WHERE r.dream_id = d.id)""",
+        (dream_id,),
+    )
+
+
+def _shift_audience(cur, dream_ids: List[int], sign: int, public_only: bool) -> None:
+    """Total and the viewers / favoriters / helpers of dreams that become (un)public: one statement each."""
+    public = f"AND EXISTS (SELECT 1 FROM dreams d WHERE d.id = x.dream_id AND {_PUBLIC})" if public_only else ""
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET
+                viewed = GREATEST(c.viewed + %(sign)s * a.viewed, 0),
+                favorites = GREATEST(c.favorites + %(sign)s * a.favorites, 0),
+                helped = GREATEST(c.helped + %(sign)s * a.helped, 0),
+                helping = GREATEST(c.helping + %(sign)s * a.helping, 0),
+                updated_at = NOW()
+            FROM (
+                SELECT x.user_id, SUM(x.v) AS viewed, SUM(x.f) AS favorites, SUM(x.hd) AS helped, SUM(x.hp) AS helping
+                FROM (
+                    SELECT user_id, dream_id, 1 AS v, 0 AS f, 0 AS hd, 0 AS hp
+                    FROM user_dream_views WHERE dream_id = ANY(%(ids)s)
+                    UNION ALL
+                    SELECT user_id, dream_id, 0, 1, 0, 0 FROM user_dream_favorites WHERE dream_id = ANY(%(ids)s)
+                    UNION ALL
+                    SELECT user_id, dream_id, 0, 0, 1, 0 FROM user_dream_helped WHERE dream_id = ANY(%(ids)s)
+                    UNION ALL
+                    SELECT h.user_id, h.dream_id, 0, 0, 0, 1 FROM user_dream_help_intent h
+                    WHERE h.dream_id = ANY(%(ids)s)
+                      AND NOT EXISTS (SELECT 1 FROM user_dream_helped hl WHERE hl.user_id = h.user_id AND hl.dream_id = h.dream_id)
+                ) x
+                WHERE true {public}
+                GROUP BY x.user_id
+            ) a
+            WHERE c.user_id = a.user_id""",
+        {"ids": dream_ids, "sign": sign},
+    )
+    public = f"AND {_PUBLIC}" if public_only else ""
+    cur.execute(
+        f"""UPDATE {TOTALS_TABLE} SET
+                public_dreams = GREATEST(public_dreams + %(sign)s * (
+                    SELECT COUNT(*) FROM dreams d WHERE d.id = ANY(%(ids)s) {public}), 0),
+                updated_at = NOW()""",
+        {"ids": dream_ids, "sign": sign},
+    )
+
+
+def dream_created(cur, is_public: bool) -> None:
+    """A new dream: only the total changes (nobody has interacted with it yet)."""
+    if is_public:
+        cur.execute(f"UPDATE {TOTALS_TABLE} SET public_dreams = public_dreams + 1, updated_at = NOW()")
+
+
+def dream_visibility_changed(cur, dream_id: int, now_public: bool) -> None:
+    """After dreams.is_public actually flipped for dream_id."""
+    _shift_audience(cur, [dream_id], 1 if now_public else -1, public_only=False)
+
+
+def dreams_removed(cur, dream_ids: Iterable[int], has_completion: bool) -> None:
+    """Before deleting dreams (their rows in the showcase tables go by CASCADE)."""
+    dream_ids = list(dream_ids)
+    if not dream_ids:
+        return
+    _shift_audience(cur, dream_ids, -1, public_only=True)
+    pending = (
+        f"(SELECT COUNT(DISTINCT r.dream_id) FROM {COMPLETION_TABLE} r WHERE r.dream_id = ANY(o.ids))"
+        if has_completion else "0"
+    )
+    cur.execute(
+        f"""UPDATE {COUNTERS_TABLE} c SET
+                in_progress = GREATEST(c.in_progress - (
+                    SELECT COUNT(DISTINCT h.dream_id) FROM user_dream_help_intent h WHERE h.dream_id = ANY(o.ids)), 0),
+                pending_completion = GREATEST(c.pending_completion - {pending}, 0),
+                updated_at = NOW()
+            FROM (SELECT user_id, array_agg(id) AS ids FROM dreams WHERE id = ANY(%s) GROUP BY user_id) o
+            WHERE c.user_id = o.user_id""",
+        (dream_ids,),
+    )
+
+
+# --- reconciliation -------------------------------------------------------
+
+def reconcile(cur, batch: int, has_completion: bool, dry_run: bool = False) -> Tuple[int, List[dict]]:
+    """Recompute the total and up to `batch` rows, least recently reconciled first.
+
+    Rows are locked (FOR UPDATE SKIP LOCKED) before the recompute statement takes its
+    snapshot, so a concurrent delta either is already visible or waits and applies on
+    top. Returns (rows checked, drift: [{user_id, column: (stored, actual)}], user_id None = total).
+    """
+    drift: List[dict] = []
+    cur.execute(f"SELECT public_dreams FROM {TOTALS_TABLE} FOR UPDATE")
+    row = cur.fetchone()
+    if row is not None:
+        stored = _row_values(row, ("public_dreams",))[0]
+        cur.execute(_public_total_sql())
+        actual = _row_values(cur.fetchone(), ("count",))[0]
+        if stored != actual:
+            drift.append({"user_id": None, "public_dreams": (stored, actual)})
+            if not dry_run:
+                cur.execute(f"UPDATE {TOTALS_TABLE} SET public_dreams = %s, updated_at = NOW()", (actual,))
+
+    columns = ("user_id",) + COUNTER_COLUMNS
+    cur.execute(
+        f"""SELECT {", ".join(columns)} FROM {COUNTERS_TABLE}
+            ORDER BY reconciled_at NULLS FIRST, user_id
+            LIMIT %s FOR UPDATE SKIP LOCKED""",
+        (batch,),
+    )
+    stored_rows = {r[0]: r[1:] for r in (_row_values(x, columns) for x in cur.fetchall())}
+    if not stored_rows:
+        return 0, drift
+    cur.execute(_recompute_sql(has_completion), {"user_ids": list(stored_rows)})
+    actual_rows = {r[0]: r[1:] for r in (_row_values(x, columns) for x in cur.fetchall())}
+    fixes = []
+    for user_id, stored in stored_rows.items():
+        actual = actual_rows.get(user_id)
+        if actual is None or tuple(stored) == tuple(actual):
+            continue
+        item = {"user_id": user_id}
+        for col, s, a in zip(COUNTER_COLUMNS, stored, actual):
+            if s != a:
+                item[col] = (s, a)
+        drift.append(item)
+        fixes.append((user_id,) + tuple(actual))
+    if dry_run:
+        return len(stored_rows), drift
+    for fix in fixes:
+        cur.execute(
+            f"""UPDATE {COUNTERS_TABLE} SET {", ".join(c + " = %s" for c in COUNTER_COLUMNS)}, updated_at = NOW()
+                WHERE user_id = %s""",
+            fix[1:] + (fix[0],),
+        )
+    cur.execute(
+        f"UPDATE {COUNTERS_TABLE} SET reconciled_at = NOW() WHERE user_id = ANY(%s)",
+        (list(stored_rows),),
+    )
+    return len(stored_rows), drift
@@ -0,0 +1,197 @@
+"""
+Showcase facets: filters by city, category, status and price range, and facet counts.
+
+The filters are plain WHERE conditions on dreams d JOIN users u (main.py adds them to the
+showcase page, the full showcase and GET /dreams/search). Partial indexes over public
+dreams back each one (_sql/mig_showcase_facets.sql): (category_id, date, id),
+(status_id, date, id), the parsed price, and btrim(users.city).
+
+Facet counts (GET /dreams/showcase/facets) come from showcase_facet_counts. This is a
+rollup of public dreams by (city, category code, status code, price bucket) that the app
+rebuilds every SHOWCASE_FACETS_REFRESH_SEC (refresh()). It holds one row per
+combination, not per dream, so a count is a SUM over a few hundred rows. Counts may lag
+by up to that interval. Each facet is counted under the other facets' filters, so the
+values of a selected facet stay visible. Price filters apply at bucket granularity in
+the counts (a bucket counts if it overlaps the range), and exactly in the lists.
+
+dreams.price is NUMERIC(12,2) in the bootstrap schema and free text (VARCHAR) in some older
+databases. price_sql() reads its text form as a number when it looks like one and as NULL
+otherwise, so the same expression works on both. The price index is built on it.
+
+All functions take a cursor of the caller's transaction and work with any cursor_factory.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+TABLE = "showcase_facet_counts"
+PRICE_EDGES = (0, 10_000, 100_000, 1_000_000, 10_000_000)
+NO_PRICE = -1
+REFRESH_LOCK_KEY = 7_301_018  # pg_try_advisory_xact_lock: one refresh at a time across workers
+
+FACETS = ("city", "category", "status", "price")
+
+
+class Filters(NamedTuple):
+    city: Optional[str] = None
+    category: Optional[str] = None
+    status: Optional[str] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None  # exclusive, like the upper edge of a price bucket
+
+    @classmethod
+    def of(cls, city=None, category=None, status=None, price_min=None, price_max=None) -> "Filters":
+        """Blank strings are "no filter"."""
+        return cls(
+            (city or "").strip() or None,
+            (category or "").strip() or None,
+            (status or "").strip() or None,
+            price_min,
+            price_max,
+        )
+
+    @property
+    def active(self) -> bool:
+        return any(v is not None for v in self)
+
+    @property
+    def has_price(self) -> bool:
+        return self.price_min is not None or self.price_max is not None
+
+
+def price_sql(alias: str = "d") -> str:
+    """<alias>.price as NUMERIC, NULL if it is not a plain number (the index expression)."""
+    return (
+        f"(CASE WHEN btrim({alias}.price::text) ~ '^[0-9]+([.][0-9]+)?$'"
+        f" THEN btrim({alias}.price::text)::numeric END)"
+    )
+
+
+def bucket_sql(alias: str = "d") -> str:
+    edges = ",".join(str(e) for e in PRICE_EDGES)
+    return f"COALESCE(width_bucket({price_sql(alias)}, ARRAY[{edges}]::numeric[]) - 1, {NO_PRICE})"
+
+
+def bucket_bounds(bucket: int) -> Tuple[int, Optional[int]]:
+    upper = PRICE_EDGES[bucket + 1] if bucket + 1 < len(PRICE_EDGES) else None
+    return PRICE_EDGES[bucket], upper
+
+
+def price_buckets(filters: Filters) -> List[int]:
+    """Buckets overlapping [price_min, price_max)."""
+    out = []
+    for bucket in range(len(PRICE_EDGES)):
+        lower, upper = bucket_bounds(bucket)
+        if filters.price_max is not None and lower >= filters.price_max:
+            continue
+        if filters.price_min is not None and upper is not None and upper <= filters.price_min:
+            continue
+        out.append(bucket)
+    return out
+
+
+def source_sql(has_status: bool, has_category: bool) -> str:
+    """Rollup rows (city, category, status, price_bucket, n) straight from dreams."""
+    category = "COALESCE(c.code, '')" if has_category else "''"
+    status = "COALESCE(s.code, 'planned')" if has_status else "'planned'"
+    joins = " LEFT JOIN dreams_categories c ON c.id = d.category_id" if has_category else ""
+    joins += " LEFT JOIN dreams_statuses s ON s.id = d.status_id" if has_status else ""
+    return f"""
+        SELECT COALESCE(btrim(u.city), '') AS city, {category} AS category, {status} AS status,
+               {bucket_sql("d")} AS price_bucket, COUNT(*) AS n
+        FROM dreams d
+        JOIN users u ON u.id = d.user_id{joins}
+        WHERE COALESCE(d.is_public, true) = true
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def refresh(cur, has_status: bool, has_category: bool, min_age_sec: float = 0) -> Optional[int]:
+    """Rebuild the rollup in the caller's transaction. None if another worker holds the lock or
+    the rollup is younger than min_age_sec; otherwise the number of rows written."""
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (REFRESH_LOCK_KEY,))
+    row = cur.fetchone()
+    if not (row["locked"] if isinstance(row, dict) else row[0]):
+        return None
+    if min_age_sec > 0:
+        cur.execute(
+            f"SELECT 1 FROM {TABLE} WHERE refreshed_at > NOW() - make_interval(secs => %s) LIMIT 1",
+            (min_age_sec,),
+        )
+        if cur.fetchone() is not None:
+            return None
+    cur.execute(f"DELETE FROM {TABLE}")
+    cur.execute(
+        f"INSERT INTO {TABLE} (city, category, status, price_bucket, n) "
+        + source_sql(has_status, has_category)
+    )
+    return cur.rowcount
+
+
+def _conds(filters: Filters, skip: str) -> Tuple[List[str], Dict[str, object]]:
+    conds, params = [], {}
+    if filters.city and skip != "city":
+        conds.append("f.city = %(fc_city)s")
+        params["fc_city"] = filters.city
+    if filters.category and skip != "category":
+        conds.append("f.category = %(fc_category)s")
+        params["fc_category"] = filters.category
+    if filters.status and skip != "status":
+        conds.append("f.status = %(fc_status)s")
+        params["fc_status"] = filters.status
+    if filters.has_price and skip != "price":
+        conds.append("f.price_bucket = ANY(%(fc_buckets)s)")
+        params["fc_buckets"] = price_buckets(filters)
+    return conds, params
+
+
+def counts_sql(filters: Filters, source: str) -> Tuple[str, dict]:
+    """One statement: (facet, value, n) per facet value plus ('total', NULL, n). source is TABLE or
+    "(source_sql(...))" when the rollup table is missing."""
+    columns = {"city": "f.city", "category": "f.category", "status": "f.status", "price": "f.price_bucket::text"}
+    present = {"city": "f.city <> ''", "category": "f.category <> ''", "status": "true", "price": f"f.price_bucket <> {NO_PRICE}"}
+    parts, params = [], {}
+    for facet in FACETS + ("total",):
+        conds, p = _conds(filters, facet)
+        params.update(p)
+        if facet == "total":
+            parts.append(
+                "SELECT 'total' AS facet, NULL AS value, COALESCE(SUM(f.n), 0) AS n FROM f"
+                + (" WHERE " + " AND ".join(conds) if conds else "")
+            )
+            continue
+        conds.append(present[facet])
+        parts.append(
+            f"SELECT '{facet}' AS facet, {columns[facet]} AS value, SUM(f.n) AS n FROM f"
+            f" WHERE {' AND '.join(conds)} GROUP BY {columns[facet]}"
+        )
+    sql = (
+        f"WITH f AS (SELECT city, category, status, price_bucket, n FROM {source} src)\n"
+        + "\nUNION ALL\n".join(parts)
+    )
+    return sql, params
+
+
+def payload(rows, labels: Dict[Tuple[str, str], str]) -> dict:
+    """counts_sql rows -> {cities, categories, statuses, prices, total}; labels by (facet, code)."""
+    out: dict = {"cities": [], "categories": [], "statuses": [], "prices": [], "total": 0}
+    keys = {"city": "cities", "category": "categories", "status": "statuses", "price": "prices"}
+    for row in rows:
+        if isinstance(row, dict):
+            facet, value, n = row["facet"], row["value"], row["n"]
+        else:
+            facet, value, n = row
+        n = int(n or 0)
+        if facet == "total":
+            out["total"] = n
+        elif facet == "price":
+            lower, upper = bucket_bounds(int(value))
+            out["prices"].append({"min": lower, "max": upper, "count": n})
+        elif facet == "city":
+            out["cities"].append({"value": value, "count": n})
+        else:
+            out[keys[facet]].append({"value": value, "label": labels.get((facet, value)), "count": n})
+    for key in ("cities", "categories", "statuses"):
+        out[key].sort(key=lambda x: (-x["count"], x["value"]))
+    out["prices"].sort(key=lambda x: x["min"])
+    return out
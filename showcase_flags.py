@@ -0,0 +1,69 @@
+"""
+Per-viewer flags of showcase cards (viewed, favorite, helping, helped, completion requested)
+as columns of the card SELECT itself.
+
+Each flag is an EXISTS over its table keyed by (user_id, dream_id). The primary keys /
+unique indexes of those tables answer it with one index probe per card. columns_sql()
+is projected over the already limited row set (the page, the search hits, the feed),
+so the cost is limit x flags probes, and a page is a single statement instead of
+page + one "dream_id = ANY(ids)" query per flag. from_rows() turns the columns back
+into the per-flag id sets that main.py builds cards and counters from.
+
+"Viewed" is either the user_viewed_sets predicate (viewed_sets.predicate(), the set is
+passed as parameters) or EXISTS over user_dream_views when the user has no built set.
+A flag whose table is missing (old schema) projects false.
+
+For a viewer with thousands of rows in a flag table the planner may hash the viewer's
+rows once per statement instead of probing per card; that is still one statement.
+
+The SQL takes the viewer as %(uid)s.
+"""
+from __future__ import annotations
+
+from typing import Container, Dict, Iterable, Optional
+
+FLAGS = ("viewed", "favorites", "helping", "helped", "completion_requested")
+PREFIX = "flag_"
+
+# flag -> (table, column with the viewer id)
+TABLES = {
+    "viewed": ("user_dream_views", "user_id"),
+    "favorites": ("user_dream_favorites", "user_id"),
+    "helping": ("user_dream_help_intent", "user_id"),
+    "helped": ("user_dream_helped", "user_id"),
+    "completion_requested": ("user_dream_completion_request", "helper_user_id"),
+}
+
+
+def empty() -> Dict[str, set]:
+    return {name: set() for name in FLAGS}
+
+
+def exists_sql(name: str, dream_id: str) -> str:
+    table, user_col = TABLES[name]
+    return f"EXISTS (SELECT 1 FROM {table} x WHERE x.{user_col} = %(uid)s AND x.dream_id = {dream_id})"
+
+
+def columns_sql(alias: str, tables: Container[str], viewed_predicate: Optional[str] = None) -> str:
+    """", <flag> AS flag_<name>, ..." for rows <alias> (its id column is the dream id).
+    tables: names of the existing flag tables; viewed_predicate replaces the user_dream_views EXISTS."""
+    cols = []
+    for name in FLAGS:
+        if name == "viewed" and viewed_predicate is not None:
+            expr = viewed_predicate
+        elif TABLES[name][0] in tables:
+            expr = exists_sql(name, f"{alias}.id")
+        else:
+            expr = "false"
+        cols.append(f"{expr} AS {PREFIX}{name}")
+    return ", " + ", ".join(cols)
+
+
+def from_rows(rows: Iterable[dict]) -> Dict[str, set]:
+    """Rows with columns_sql() columns (dict rows) -> {flag: set of dream ids}."""
+    flags = empty()
+    for row in rows:
+        for name in FLAGS:
+            if row.get(PREFIX + name):
+                flags[name].add(row["id"])
+    return flags
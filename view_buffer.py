@@ -0,0 +1,106 @@
+"""
+Write-behind buffer of showcase card views (user_dream_views).
+
+POST /dreams/{id}/view and POST /dreams/views only put (user_id, dream_id, viewed_at)
+into memory. A background thread in main.py drains the buffer every flush_sec and
+writes it with one multi-row upsert (flush()). A full buffer (max_pending) is flushed
+by the request that fills it, and the rest is flushed on shutdown. Repeated views of one
+card before a flush collapse into one entry with the latest viewed_at.
+
+Views are loss-tolerant analytics plus the "new" marker. What a crash loses is at most
+flush_sec of views, which come back the next time the cards are shown. Reads of the
+viewer's own showcase flush first (has_user), so one process never shows a card as
+"new" after it was viewed there.
+
+flush() skips ids of dreams or users that no longer exist instead of failing the whole
+batch on a foreign key, drops ids outside the INT range (they would fail the whole
+statement on every retry), and it writes rows in (user_id, dream_id) order so
+concurrent flushes of several workers do not deadlock.
+"""
+from __future__ import annotations
+
+import datetime as _dt
+from threading import Lock
+from typing import Dict, Iterable, List, Set, Tuple
+
+VIEWS_TABLE = "user_dream_views"
+INT_MAX = 2**31 - 1
+
+Item = Tuple[int, int, _dt.datetime]
+
+
+class ViewBuffer:
+    """Pending views by (user_id, dream_id); bounded by max_pending."""
+
+    def __init__(self, max_pending: int) -> None:
+        self.max_pending = max_pending
+        self._lock = Lock()
+        self._pending: Dict[Tuple[int, int], _dt.datetime] = {}
+        self._users: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, user_id: int, dream_ids: Iterable[int]) -> bool:
+        """Buffer views; True if the buffer is full and the caller should flush."""
+        now = _dt.datetime.now(_dt.timezone.utc)
+        with self._lock:
+            for dream_id in dream_ids:
+                self._pending[(user_id, dream_id)] = now
+                self._users.add(user_id)
+            return len(self._pending) >= self.max_pending
+
+    def has_user(self, user_id: int) -> bool:
+        with self._lock:
+            return user_id in self._users
+
+    def drain(self) -> List[Item]:
+        with self._lock:
+            items = [(u, d, at) for (u, d), at in self._pending.items()]
+            self._pending = {}
+            self._users = set()
+        items.sort()
+        return items
+
+    def requeue(self, items: List[Item]) -> int:
+        """Put back a batch whose flush failed; newer views win. Returns how many were dropped (buffer full)."""
+        dropped = 0
+        with self._lock:
+            for user_id, dream_id, at in items:
+                key = (user_id, dream_id)
+                if key in self._pending:
+                    self._pending[key] = max(self._pending[key], at)
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    dropped += 1
+                    continue
+                self._pending[key] = at
+                self._users.add(user_id)
+        return dropped
+
+
+def flush(cur, items: List[Item]) -> List[Tuple[int, int]]:
+    """Upsert views in one statement; returns (user_id, dream_id) of newly inserted rows."""
+    items = [i for i in items if 0 < i[0] <= INT_MAX and 0 < i[1] <= INT_MAX]
+    if not items:
+        return []
+    cur.execute(
+        f"""INSERT INTO {VIEWS_TABLE} (user_id, dream_id, viewed_at)
+            SELECT v.user_id, v.dream_id, v.viewed_at
+            FROM unnest(%s::int[], %s::int[], %s::timestamptz[]) AS v(user_id, dream_id, viewed_at)
+            WHERE EXISTS (SELECT 1 FROM dreams d WHERE d.id = v.dream_id)
+              AND EXISTS (SELECT 1 FROM users u WHERE u.id = v.user_id)
+            ORDER BY v.user_id, v.dream_id
+            ON CONFLICT (user_id, dream_id) DO UPDATE
+              SET viewed_at = GREATEST({VIEWS_TABLE}.viewed_at, EXCLUDED.viewed_at)
+            RETURNING user_id, dream_id, (xmax = 0) AS inserted""",
+        ([i[0] for i in items], [i[1] for i in items], [i[2] for i in items]),
+    )
+    inserted = []
+    for row in cur.fetchall():
+        if isinstance(row, dict):
+            if row["inserted"]:
+                inserted.append((row["user_id"], row["dream_id"]))
+        elif row[2]:
+            inserted.append((row[0], row[1]))
+    return inserted
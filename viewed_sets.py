@@ -0,0 +1,235 @@
+"""
+Compact per-user set of viewed dream ids (user_viewed_sets) for the showcase "new" marker.
+
+Positions are dreams.showcase_key, not ids: a trigger gives a dream the next number of
+dreams_showcase_key_seq every time it becomes public (_sql/mig_dreams_showcase_key.sql).
+Private dreams have no position, and a dream published later lands above every mark.
+
+A row is a high-water mark plus a bitmap: every key <= hwm counts as viewed, and bit i
+of bits (get_bit order: byte i // 8, bit i % 8 from the least significant end) means
+that key hwm + 1 + i is viewed. The mark moves over keys that are viewed, no longer
+public or not held by any dream, so hiding and deleting dreams never touch the rows. A
+key held by an insert that has not committed yet looks unused, so the mark stays
+KEY_MARGIN keys below the last one handed out: a user who has seen everything is stored
+as an integer plus at most KEY_MARGIN bits. Above the mark, the bitmap grows by one bit
+per published dream, not by one row per view.
+
+A dream published again gets a new key. published() copies the views its earlier
+viewers have in user_dream_views to the new key; a dream republished by plain SQL is
+"new" again for them.
+
+"Viewed" checks are either done in Python (ViewedSet.__contains__ over keys) or in
+SQL through predicate(), which takes the row as %(vs_hwm)s / %(vs_bits)s parameters.
+Either way the user_dream_views anti-join is gone. user_dream_views stays as the log
+of viewed_at for analytics and as the source a missing row is built from.
+
+A NULL hwm is a placeholder for a row that is not built yet. Readers fall back to
+user_dream_views. views_added(), called in the view-flush transaction, builds it on
+first use. Writers lock the rows (FOR UPDATE, in user_id order) before reading them, so
+concurrent flushes of several workers serialize per user instead of losing bits.
+
+All functions take a cursor of the caller's transaction and work with any cursor_factory.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+TABLE = "user_viewed_sets"
+VIEWS_TABLE = "user_dream_views"
+KEY_COLUMN = "showcase_key"
+KEY_SEQUENCE = "dreams_showcase_key_seq"
+KEY_MARGIN = 1024  # keys handed out most recently: the mark does not pass them (their insert may be in flight)
+LOAD_SQL = f"SELECT hwm, bits FROM {TABLE} WHERE user_id = %s"
+
+
+def _get(row, i: int, key: str):
+    return row[key] if isinstance(row, dict) else row[i]
+
+
+class ViewedSet:
+    __slots__ = ("hwm", "mask")
+
+    def __init__(self, hwm: int = 0, mask: int = 0) -> None:
+        self.hwm = hwm
+        self.mask = mask
+
+    @classmethod
+    def from_row(cls, hwm: int, bits) -> "ViewedSet":
+        return cls(hwm, int.from_bytes(bytes(bits or b""), "little"))
+
+    def __contains__(self, key: int) -> bool:
+        return key <= self.hwm or bool(self.mask >> (key - self.hwm - 1) & 1)
+
+    @property
+    def top(self) -> int:
+        """Largest viewed key."""
+        return self.hwm + self.mask.bit_length()
+
+    @property
+    def bits(self) -> bytes:
+        return self.mask.to_bytes((self.mask.bit_length() + 7) // 8, "little")
+
+    def add(self, keys: Iterable[int]) -> None:
+        for key in keys:
+            if key > self.hwm:
+                self.mask |= 1 << (key - self.hwm - 1)
+
+    def advance(self, first_unviewed: Optional[int], horizon: int) -> None:
+        """Move the mark up to the first unviewed public dream (None: none up to top), not past horizon."""
+        new_hwm = min(self.top if first_unviewed is None else first_unviewed - 1, self.top, horizon)
+        if new_hwm > self.hwm:
+            self.mask >>= new_hwm - self.hwm
+            self.hwm = new_hwm
+
+
+def _contains_sql(dream_id: str, hwm: str, bits: str) -> str:
+    # CASE, not AND/OR: get_bit() out of range is an error and SQL does not promise evaluation order
+    off = f"({dream_id} - {hwm} - 1)"
+    return (
+        f"(CASE WHEN {dream_id} <= {hwm} THEN true"
+        f" WHEN {off} < length({bits}) * 8 THEN get_bit({bits}, {off}::int) = 1"
+        f" ELSE false END)"
+    )
+
+
+def predicate(alias: str = "d", dreams_row: bool = True) -> str:
+    """SQL: dream <alias> is in the set given as %(vs_hwm)s / %(vs_bits)s. dreams_row=False — <alias> is
+    not a dreams row but has its id (a page over a subquery): the key is looked up by that id."""
+    key = f"{alias}.{KEY_COLUMN}" if dreams_row else f"(SELECT k.{KEY_COLUMN} FROM dreams k WHERE k.id = {alias}.id)"
+    return _contains_sql(key, "%(vs_hwm)s::int", "%(vs_bits)s::bytea")
+
+
+def params(vs: ViewedSet) -> Dict[str, object]:
+    return {"vs_hwm": vs.hwm, "vs_bits": vs.bits}
+
+
+def parse(row) -> Optional[ViewedSet]:
+    """A LOAD_SQL row (sync or async driver) -> set; None if there is no built row."""
+    if row is None or _get(row, 0, "hwm") is None:
+        return None
+    return ViewedSet.from_row(_get(row, 0, "hwm"), _get(row, 1, "bits"))
+
+
+def load(cur, user_id: int) -> Optional[ViewedSet]:
+    """The user's set, or None if it is not built yet (callers fall back to user_dream_views)."""
+    cur.execute(LOAD_SQL, (user_id,))
+    return parse(cur.fetchone())
+
+
+def _horizon(cur) -> int:
+    """Highest key the mark may pass: KEY_MARGIN below the last key handed out (committed or not)."""
+    cur.execute(f"SELECT last_value AS last FROM {KEY_SEQUENCE}")
+    return int(_get(cur.fetchone(), 0, "last")) - KEY_MARGIN
+
+
+def _first_unviewed(cur, sets: Dict[int, ViewedSet]) -> Dict[int, Optional[int]]:
+    """Per user: the smallest key above the mark of a public dream that is not in the set (up to top)."""
+    users = sorted(sets)
+    key = f"d.{KEY_COLUMN}"
+    cur.execute(
+        f"""SELECT s.user_id,
+                   (SELECT MIN({key}) FROM dreams d
+                    WHERE {key} > s.hwm AND {key} <= s.top AND COALESCE(d.is_public, true) = true
+                      AND NOT {_contains_sql(key, "s.hwm", "s.bits")}
+                   ) AS first_unviewed
+            FROM unnest(%s::int[], %s::int[], %s::int[], %s::bytea[]) AS s(user_id, hwm, top, bits)""",
+        (
+            users,
+            [sets[u].hwm for u in users],
+            [sets[u].top for u in users],
+            [sets[u].bits for u in users],
+        ),
+    )
+    return {_get(r, 0, "user_id"): _get(r, 1, "first_unviewed") for r in cur.fetchall()}
+
+
+def _store(cur, sets: Dict[int, ViewedSet]) -> None:
+    horizon = _horizon(cur)
+    for user_id, first in _first_unviewed(cur, sets).items():
+        sets[user_id].advance(first, horizon)
+    users = sorted(sets)
+    cur.execute(
+        f"""UPDATE {TABLE} t SET hwm = s.hwm, bits = s.bits, updated_at = NOW()
+            FROM unnest(%s::int[], %s::int[], %s::bytea[]) AS s(user_id, hwm, bits)
+            WHERE t.user_id = s.user_id""",
+        (users, [sets[u].hwm for u in users], [sets[u].bits for u in users]),
+    )
+
+
+def _build(cur, user_ids: Sequence[int]) -> Dict[int, ViewedSet]:
+    cur.execute(
+        f"""SELECT v.user_id, array_agg(d.{KEY_COLUMN}) AS keys
+            FROM {VIEWS_TABLE} v JOIN dreams d ON d.id = v.dream_id
+            WHERE v.user_id = ANY(%s) AND d.{KEY_COLUMN} IS NOT NULL
+            GROUP BY v.user_id""",
+        (list(user_ids),),
+    )
+    sets = {u: ViewedSet() for u in user_ids}
+    for row in cur.fetchall():
+        sets[_get(row, 0, "user_id")].add(_get(row, 1, "keys"))
+    return sets
+
+
+def keys(cur, dream_ids: Iterable[int]) -> Dict[int, int]:
+    """dream id -> showcase key (dreams that were never public have none)."""
+    cur.execute(
+        f"SELECT id, {KEY_COLUMN} AS key FROM dreams WHERE id = ANY(%s) AND {KEY_COLUMN} IS NOT NULL",
+        (sorted(set(dream_ids)),),
+    )
+    return {_get(r, 0, "id"): _get(r, 1, "key") for r in cur.fetchall()}
+
+
+def views_added(cur, pairs: Sequence[Tuple[int, int]]) -> None:
+    """After new user_dream_views rows (user_id, dream_id): add them to the users' sets (building missing ones)."""
+    if not pairs:
+        return
+    keys_of = keys(cur, [dream_id for _, dream_id in pairs])
+    by_user: Dict[int, List[int]] = {}
+    for user_id, dream_id in pairs:
+        if dream_id in keys_of:
+            by_user.setdefault(user_id, []).append(keys_of[dream_id])
+    if not by_user:
+        return
+    users = sorted(by_user)
+    cur.execute(
+        f"INSERT INTO {TABLE} (user_id) SELECT u FROM unnest(%s::int[]) AS u ORDER BY u ON CONFLICT (user_id) DO NOTHING",
+        (users,),
+    )
+    cur.execute(
+        f"SELECT user_id, hwm, bits FROM {TABLE} WHERE user_id = ANY(%s) ORDER BY user_id FOR UPDATE",
+        (users,),
+    )
+    sets: Dict[int, ViewedSet] = {}
+    unbuilt = []
+    for row in cur.fetchall():
+        user_id, hwm = _get(row, 0, "user_id"), _get(row, 1, "hwm")
+        if hwm is None:
+            unbuilt.append(user_id)
+        else:
+            sets[user_id] = ViewedSet.from_row(hwm, _get(row, 2, "bits"))
+            sets[user_id].add(by_user[user_id])
+    if unbuilt:
+        # the new views are already in user_dream_views (same transaction)
+        sets.update(_build(cur, unbuilt))
+    _store(cur, sets)
+
+
+def published(cur, dream_id: int) -> None:
+    """The dream became public again under a new key: keep it viewed for the users who viewed it before."""
+    cur.execute(f"SELECT user_id FROM {VIEWS_TABLE} WHERE dream_id = %s", (dream_id,))
+    views_added(cur, [(_get(r, 0, "user_id"), dream_id) for r in cur.fetchall()])
+
+
+def rebuild(cur, user_ids: Sequence[int]) -> int:
+    """Rebuild the sets of these users from user_dream_views (script / repair). Returns rows written."""
+    if not user_ids:
+        return 0
+    users = sorted(set(user_ids))
+    cur.execute(
+        f"INSERT INTO {TABLE} (user_id) SELECT u FROM unnest(%s::int[]) AS u ORDER BY u ON CONFLICT (user_id) DO NOTHING",
+        (users,),
+    )
+    cur.execute(f"SELECT user_id FROM {TABLE} WHERE user_id = ANY(%s) ORDER BY user_id FOR UPDATE", (users,))
+    sets = _build(cur, users)
+    _store(cur, sets)
+    return len(sets)